@@ -0,0 +1,139 @@
+"""
+Benchmark the phases of DSL compilation on synthetic policies
+
+Each phase is timed separately (best of --repeat runs) and then run once more under
+tracemalloc to record its peak memory. Results are written as json, so that runs can
+be compared across commits:
+
+$ python benchmarks/run_benchmarks.py --scale medium --output results.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import synthetic_dsl  # noqa: E402
+
+from osc_trino_acl_dsl.__about__ import __version__  # noqa: E402
+from osc_trino_acl_dsl.compact_rules import dsl_to_compact_rules  # noqa: E402
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules, yaml_loader  # noqa: E402
+from osc_trino_acl_dsl.rules_io import decode_rules, encode_rules, write_rules_json  # noqa: E402
+from osc_trino_acl_dsl.rules_precommit_check import _check_pair  # noqa: E402
+from osc_trino_acl_dsl.validation import validate_dsl  # noqa: E402
+
+_scales = {
+    "small": dict(catalogs=2, schemas_per_catalog=5, tables_per_schema=20),
+    "medium": dict(catalogs=4, schemas_per_catalog=25, tables_per_schema=100),
+    "large": dict(catalogs=8, schemas_per_catalog=50, tables_per_schema=100),
+}
+
+
+def _measure(fn, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak}
+
+
+def run(params: dict, repeat: int) -> dict:
+    dsl = synthetic_dsl(**params)
+    rules = dsl_to_rules(dsl, validate=False)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dslpath = os.path.join(tmpdir, "trino-acl-dsl.yaml")
+        rulespath = os.path.join(tmpdir, "rules.json")
+        with open(dslpath, "w") as dsl_file:
+            yaml.dump(dsl, dsl_file, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+        with open(rulespath, "w") as rules_file:
+            write_rules_json(rules.items(), rules_file)
+
+        with open(rulespath, "rb") as rules_file:
+            json_bytes = rules_file.read()
+        pickled = encode_rules(rules, "pickle")
+
+        def load_yaml():
+            with open(dslpath, "r") as dsl_file:
+                yaml.load(dsl_file, Loader=yaml_loader())
+
+        def check():
+            passed, report, _ = _check_pair(dslpath, rulespath, "benchmark")
+            assert passed, report
+
+        phases = {
+            "yaml_load": load_yaml,
+            "validate": lambda: validate_dsl(dsl),
+            "dsl_to_rules": lambda: dsl_to_rules(dsl, validate=False),
+            "dsl_to_compact_rules": lambda: dsl_to_compact_rules(dsl, validate=False),
+            "json_write": lambda: write_rules_json(rules.items(), io.StringIO()),
+            "minified_write": lambda: encode_rules(rules, "minified"),
+            "json_load": lambda: decode_rules(json_bytes, "json"),
+            "pickle_load": lambda: decode_rules(pickled, "pickle"),
+            "precommit_check": check,
+        }
+        results = {name: _measure(fn, repeat) for name, fn in phases.items()}
+        sizes = {"dsl_bytes": os.path.getsize(dslpath), "rules_bytes": os.path.getsize(rulespath)}
+
+    return {
+        "params": params,
+        "sizes": sizes,
+        "rules": {section: len(srules) for section, srules in rules.items()},
+        "phases": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark DSL compilation phases on synthetic policies")
+    parser.add_argument("--scale", choices=sorted(_scales.keys()), default="small")
+    parser.add_argument("--catalogs", type=int)
+    parser.add_argument("--schemas-per-catalog", type=int)
+    parser.add_argument("--tables-per-schema", type=int)
+    parser.add_argument("--acls-per-table", type=int)
+    parser.add_argument("--hidden-columns", type=int)
+    parser.add_argument("--filters", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per phase; the best is reported")
+    parser.add_argument("--output", default="-", help="json results file (default: stdout)")
+    args = parser.parse_args()
+
+    params = dict(_scales[args.scale])
+    for k in [
+        "catalogs",
+        "schemas_per_catalog",
+        "tables_per_schema",
+        "acls_per_table",
+        "hidden_columns",
+        "filters",
+        "seed",
+    ]:
+        if getattr(args, k) is not None:
+            params[k] = getattr(args, k)
+
+    results = run(params, args.repeat)
+    results.update({"version": __version__, "python": platform.python_version(), "scale": args.scale})
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=4)
+            results_file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
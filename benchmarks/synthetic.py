@@ -0,0 +1,68 @@
+"""
+Synthetic trino ACL DSL generator for benchmarks
+
+Generates DSL structures at a parametrized scale, shaped like real multi-tenant
+policies: every catalog and schema has admins, and tables mix table admins,
+row/column ACL tiers, and public defaults with hidden columns and filters.
+"""
+
+import random
+
+
+def synthetic_dsl(
+    catalogs=2,
+    schemas_per_catalog=10,
+    tables_per_schema=50,
+    acls_per_table=2,
+    hidden_columns=3,
+    filters=1,
+    seed=0,
+) -> dict:
+    rng = random.Random(seed)
+    dsl: dict = {
+        "admin": [{"group": "admins"}, {"user": "root"}],
+        "public": True,
+        "catalogs": [],
+        "schemas": [],
+        "tables": [],
+    }
+    for c in range(catalogs):
+        catalog = f"catalog_{c}"
+        dsl["catalogs"].append({"catalog": catalog, "public": rng.random() < 0.5})
+        for s in range(schemas_per_catalog):
+            schema = f"schema_{s}"
+            dsl["schemas"].append(
+                {
+                    "catalog": catalog,
+                    "schema": schema,
+                    "admin": [{"group": f"{catalog}_{schema}_dev"}, {"user": f"owner_{c}_{s}"}],
+                    "public": rng.random() < 0.5,
+                }
+            )
+            for t in range(tables_per_schema):
+                dsl["tables"].append(
+                    _synthetic_table(rng, catalog, schema, f"table_{t}", acls_per_table, hidden_columns, filters)
+                )
+    return dsl
+
+
+def _synthetic_table(rng, catalog, schema, table, acls_per_table, hidden_columns, filters) -> dict:
+    spec: dict = {"catalog": catalog, "schema": schema, "table": table}
+    if rng.random() < 0.3:
+        spec["admin"] = [{"user": f"user_{rng.randrange(1000)}"}]
+    acl = []
+    # an acl entry must hide columns or filter rows, so without either the table has no acl
+    for a in range(acls_per_table if (hidden_columns > 0) or (filters > 0) else 0):
+        entry: dict = {"id": [{"group": f"{table}_tier_{a}"}, {"user": f"user_{rng.randrange(1000)}"}]}
+        if hidden_columns > 0:
+            entry["hide"] = [f"column_{rng.randrange(4 * hidden_columns)}" for _ in range(hidden_columns)]
+        if filters > 0:
+            entry["filter"] = [f"region_{f} = 'r{rng.randrange(10)}'" for f in range(filters)]
+        acl.append(entry)
+    if len(acl) > 0:
+        spec["acl"] = acl
+    if rng.random() < 0.5:
+        spec["public"] = {"hide": [f"column_{rng.randrange(4 * max(1, hidden_columns))}"]}
+    else:
+        spec["public"] = rng.random() < 0.5
+    return spec
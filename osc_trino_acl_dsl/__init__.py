@@ -4,10 +4,34 @@ osc-trino-acl-dsl
 A DSL for generating rules.json files for Trino
 """
 
-from .dsl2rules import dsl_json_schema, dsl_json_validator, dsl_to_rules
+import importlib
 
-__all__ = [
-    "dsl_to_rules",
-    "dsl_json_schema",
-    "dsl_json_validator",
-]
+# the public api is imported on first use, so that command line entry points,
+# notably the pre-commit hook, do not pay for importing modules they never use
+_exports = {
+    "dsl_to_rules": ".dsl2rules",
+    "dsl_rules_sections": ".dsl2rules",
+    "dsl_json_schema": ".dsl2rules",
+    "dsl_json_validator": ".dsl2rules",
+    "dsl_to_compact_rules": ".compact_rules",
+    "CompactRules": ".compact_rules",
+    "dsl_validation_errors": ".validation",
+    "validate_dsl": ".validation",
+    "IncrementalCompiler": ".incremental",
+    "Permissions": ".rules_eval",
+    "RulesEvaluator": ".rules_eval",
+}
+
+__all__ = list(_exports.keys())
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
@@ -0,0 +1,327 @@
+"""
+Semantic differences between two versions of a DSL policy
+
+Rather than a textual diff of two rules.json files, this reports how effective permissions
+change: which principal gains or loses which privilege, hidden column or row filter on which
+table. Both rule sets are indexed by literal (catalog, schema, table) as in the evaluator. Only
+tables under index entries whose rules changed are compared, and only tables whose candidate
+rules differ are evaluated for every principal, so the cost of a diff mostly scales with the
+size of the change rather than with the size of the policy.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from .acl_matrix import load_principals, load_tables, resolved_sections, rule_permissions, section_matrix
+from .dsl2rules import dsl_to_rules
+from .dsl_modules import included_rules_sections, parse_dsl, read_bytes
+from .rules_eval import Permissions, RuleSection
+from .rules_io import canonical_rule
+from .rules_sampling import changed_rules, combined_principals, sample_objects, sample_principals, unanalyzable_rules
+
+# stands for any user, group or object name not mentioned by either version of the policy
+_other = "*"
+
+_sections = ("catalogs", "schemas", "tables")
+
+PermissionChange = namedtuple("PermissionChange", ["table", "principal", "before", "after"])
+
+
+def _git_show(rev: str, fname: str) -> bytes:
+    return subprocess.run(["git", "show", f"{rev}:{fname}"], check=True, capture_output=True).stdout
+
+
+def _read(spec: str) -> tuple:
+    """the (file name, git revision or None) of a file name, or of a git revision of a file given as REV:PATH"""
+    if os.path.exists(spec) or (":" not in spec):
+        return (spec, None)
+    rev, fname = spec.split(":", 1)
+    return (fname, rev)
+
+
+def read_dsl(spec: str):
+    """
+    Load a DSL from a file name, or from a git revision of a file given as REV:PATH,
+    for example 'HEAD:trino-acl-dsl.yaml', as understood by 'git show'
+    """
+    fname, rev = _read(spec)
+    return parse_dsl(read_bytes(fname) if rev is None else _git_show(rev, fname), fname)
+
+
+def read_rules(spec: str) -> dict:
+    """
+    The rules compiled from the DSL read by 'read_dsl', and from any files it includes, which are
+    read from the same git revision as the DSL
+    """
+    dsl = read_dsl(spec)
+    if not (isinstance(dsl, dict) and ("include" in dsl)):
+        return dsl_to_rules(dsl, validate=True)
+    fname, rev = _read(spec)
+    read_file = read_bytes if rev is None else lambda path: _git_show(rev, path)
+    sections = included_rules_sections(dsl, fname, validate=True, read_file=read_file)
+    return {section: list(rules) for section, rules in sections}
+
+
+def _dirty_keys(section_a: RuleSection, section_b: RuleSection):
+    """
+    The literal object keys whose rules differ between two indexed sections. Objects matching only
+    other keys have the same candidate rules in both sections, provided that the rules under other
+    keys are also still in the same relative order. Returns None if they are not.
+    """
+    buckets_a: dict = {}
+    buckets_b: dict = {}
+    for crule in section_a.rules:
+        buckets_a.setdefault(crule.key, []).append(crule.rule)
+    for crule in section_b.rules:
+        buckets_b.setdefault(crule.key, []).append(crule.rule)
+    dirty = set([k for k in set(buckets_a) | set(buckets_b) if buckets_a.get(k) != buckets_b.get(k)])
+    clean_a = [crule.rule for crule in section_a.rules if crule.key not in dirty]
+    clean_b = [crule.rule for crule in section_b.rules if crule.key not in dirty]
+    return dirty if clean_a == clean_b else None
+
+
+def _changed_objects(sections_a: dict, sections_b: dict, objects: list) -> list:
+    """the objects whose candidate rules differ between two indexed rule sets, in any section"""
+    changed = set()
+    for k, section_a in sections_a.items():
+        section_b = sections_b[k]
+        dirty = _dirty_keys(section_a, section_b)
+        for obj in objects:
+            if obj in changed:
+                continue
+            if (dirty is not None) and not any([key in dirty for key in itertools.product(*[(v, None) for v in obj])]):
+                continue
+            if [r.rule for r in section_a.candidates(obj)] != [r.rule for r in section_b.candidates(obj)]:
+                changed.add(obj)
+    return [obj for obj in objects if obj in changed]
+
+
+def _components(principal: tuple) -> list:
+    """the principals with a single user or group that a sampled principal combines"""
+    user, groups = principal
+    return ([] if user == _other else [(user, ())]) + [(_other, (g,)) for g in groups]
+
+
+def _differing(section: str, rules_a: list, rules_b: list) -> list:
+    """the indexes of the principals given different permissions by the first matching rules 'rules_a' and 'rules_b'"""
+    same: dict = {}
+    differing = []
+    for j, (ra, rb) in enumerate(zip(rules_a, rules_b)):
+        pair = (id(ra), id(rb))
+        if pair not in same:
+            same[pair] = rule_permissions(section, ra) == rule_permissions(section, rb)
+        if not same[pair]:
+            differing.append(j)
+    return differing
+
+
+def _permissions(resolved: dict, j: int) -> Permissions:
+    return Permissions(*itertools.chain(*[rule_permissions(k, resolved[k][j]) for k in _sections]))
+
+
+def _first_match(crules: list, principal: tuple):
+    user, groups = principal
+    for crule in crules:
+        if crule.matches_principal(user, groups):
+            return crule.rule
+    return None
+
+
+def _unexplained(section: str, cands_a: list, cands_b: list, changed_ids: set) -> list:
+    """
+    Principals combining the users and groups of the changed rules among the candidate rules
+    'cands_a' and 'cands_b' of one section with those of the other candidates, whose permissions
+    in that section change other than from the permissions of one of the single principals they
+    combine to the changed permissions of one of them. Changes of the latter kind are explained
+    by the changes reported for the single principals.
+    """
+    rules = [r.rule for r in cands_a + cands_b]
+    pair_rules = [rule for rule in rules if id(rule) in changed_ids]
+    if len(pair_rules) == 0:
+        return []
+    combined = sorted(combined_principals(pair_rules, rules, _other))
+    values: dict = {}
+    for principal in combined:
+        for p in [principal] + _components(principal):
+            if p not in values:
+                values[p] = tuple([rule_permissions(section, _first_match(c, p)) for c in (cands_a, cands_b)])
+    unexplained = []
+    for principal in combined:
+        before, after = values[principal]
+        parts = [values[p] for p in _components(principal)]
+        if before == after:
+            continue
+        if any([b == before for b, _ in parts]) and any([(b != a) and (a == after) for b, a in parts]):
+            continue
+        unexplained.append(principal)
+    return unexplained
+
+
+def _combined_changes(sections_a: dict, sections_b: dict, objects: list, changed_ids: set) -> list:
+    """the changes on 'objects' for the unexplained principals combining a user and groups, or several groups"""
+    changes = []
+    # the principals depend only on the candidate rules, which are often the same for many objects
+    unexplained: dict = {}
+    for obj in objects:
+        principals: set = set()
+        for k, section_a in sections_a.items():
+            cands_a = section_a.candidates(obj)
+            cands_b = sections_b[k].candidates(obj)
+            key = (k, tuple([r.index for r in cands_a]), tuple([r.index for r in cands_b]))
+            if key not in unexplained:
+                unexplained[key] = _unexplained(k, cands_a, cands_b, changed_ids)
+            principals.update(unexplained[key])
+        if len(principals) == 0:
+            continue
+        principals = sorted(principals)
+        for ra, rb in zip(section_matrix(sections_a, principals, [obj]), section_matrix(sections_b, principals, [obj])):
+            if ra[2] != rb[2]:
+                changes.append(PermissionChange(obj, ra[0], ra[2], rb[2]))
+    return changes
+
+
+def rules_diff(rules_a: dict, rules_b: dict, principals=None, tables=None) -> list:
+    """
+    The effective permission changes from rules 'rules_a' to 'rules_b', as a list of
+    PermissionChange sorted by table and principal. Principals are (user, groups) tuples and
+    tables are (catalog, schema, table) tuples. If either is None, they are sampled from the
+    names matched by the patterns of both rule sets, with '*' standing for all other names,
+    which misses changes to rules reported by 'unanalyzable_changes'. Sampled principals
+    include a user and a group, or two groups, where a changed rule gives them permissions
+    that the changes for either alone do not explain.
+    """
+    both = [rules_a, rules_b]
+    if tables is None:
+        tables = sample_objects(both, _other)
+    sections_a = {k: RuleSection(rules_a.get(k, [])) for k in _sections}
+    sections_b = {k: RuleSection(rules_b.get(k, [])) for k in _sections}
+    changed = _changed_objects(sections_a, sections_b, [tuple(t) for t in tables])
+
+    changes = []
+    sampled = principals is None
+    if sampled:
+        principals = sample_principals(both, _other)
+        changed_ids = set([id(rule) for _, rule in changed_rules(rules_a, rules_b)])
+        changes.extend(_combined_changes(sections_a, sections_b, changed, changed_ids))
+    last: dict = {}
+    resolved = zip(
+        resolved_sections(sections_a, principals, changed), resolved_sections(sections_b, principals, changed)
+    )
+    for (obj, resolved_a), (_, resolved_b) in resolved:
+        differing: set = set()
+        for k in _sections:
+            # consecutive objects with the same candidate rules share their resolved rules
+            if (k not in last) or (last[k][0] is not resolved_a[k]) or (last[k][1] is not resolved_b[k]):
+                last[k] = (resolved_a[k], resolved_b[k], _differing(k, resolved_a[k], resolved_b[k]))
+            differing.update(last[k][2])
+        for j in sorted(differing):
+            before = _permissions(resolved_a, j)
+            changes.append(PermissionChange(obj, principals[j], before, _permissions(resolved_b, j)))
+    return sorted(changes, key=lambda c: (c.table, _principal_name(c.principal)))
+
+
+def unanalyzable_changes(rules_a: dict, rules_b: dict) -> list:
+    """the (section, rule) pairs of changed rules with patterns that 'rules_diff' cannot sample names for"""
+    return unanalyzable_rules(changed_rules(rules_a, rules_b))
+
+
+def _hidden(perms) -> set:
+    return set([col["name"] for col in perms.columns if not col.get("allow", True)])
+
+
+def describe_change(change: PermissionChange) -> list:
+    """human readable descriptions of each permission that differs in 'change'"""
+    before, after = change.before, change.after
+    lines = []
+    if before.allow != after.allow:
+        lines.append(f"catalog access {before.allow} -> {after.allow}")
+    if before.owner != after.owner:
+        lines.append("gains schema ownership" if after.owner else "loses schema ownership")
+    gained = sorted(set(after.privileges) - set(before.privileges))
+    lost = sorted(set(before.privileges) - set(after.privileges))
+    if len(gained) > 0:
+        lines.append(f"gains {', '.join(gained)}")
+    if len(lost) > 0:
+        lines.append(f"loses {', '.join(lost)}")
+    hidden = sorted(_hidden(after) - _hidden(before))
+    shown = sorted(_hidden(before) - _hidden(after))
+    if len(hidden) > 0:
+        lines.append(f"columns now hidden: {', '.join(hidden)}")
+    if len(shown) > 0:
+        lines.append(f"columns now visible: {', '.join(shown)}")
+    if before.filter != after.filter:
+        lines.append(f"row filter {before.filter} -> {after.filter}")
+    return lines
+
+
+def _principal_name(principal: tuple) -> str:
+    user, groups = principal
+    if (user == _other) and (len(groups) > 0):
+        return "group:" + ",".join(groups)
+    if len(groups) > 0:
+        return f"user:{user} group:" + ",".join(groups)
+    return f"user:{user}"
+
+
+def _report_unanalyzable(prog: str, unanalyzable: list):
+    """exit with an error listing changed rules whose effect could not be sampled, if there are any"""
+    if len(unanalyzable) == 0:
+        return
+    for section, rule in unanalyzable:
+        print(f"{prog}: not analyzable, changed {section} rule {canonical_rule(rule)}", file=sys.stderr)
+    print(f"{prog}: pass --principals and --tables to compare these changes", file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="report effective permission changes between two DSL versions")
+    parser.add_argument("old", metavar="OLD_DSL", help="DSL file, or REV:PATH to read a git revision of it")
+    parser.add_argument("new", metavar="NEW_DSL", help="DSL file, or REV:PATH to read a git revision of it")
+    parser.add_argument("--principals", default=None, help="yaml or json list of {user, groups} entries")
+    parser.add_argument("--tables", default=None, help="text file listing catalog.schema.table, one per line")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="output format")
+    args = parser.parse_args(sys.argv[1:])
+
+    rules_a = read_rules(args.old)
+    rules_b = read_rules(args.new)
+    principals = None if args.principals is None else load_principals(args.principals)
+    tables = None if args.tables is None else load_tables(args.tables)
+    changes = rules_diff(rules_a, rules_b, principals=principals, tables=tables)
+    # with an explicit population of principals and tables, every change to it is reported
+    unanalyzable = [] if (principals is not None) and (tables is not None) else unanalyzable_changes(rules_a, rules_b)
+
+    if args.format == "json":
+        entries = [
+            {
+                "table": ".".join(c.table),
+                "user": c.principal[0],
+                "groups": list(c.principal[1]),
+                "before": c.before._asdict(),
+                "after": c.after._asdict(),
+            }
+            for c in changes
+        ]
+        json.dump(entries, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+        _report_unanalyzable(parser.prog, unanalyzable)
+        return
+
+    table = None
+    for change in changes:
+        if change.table != table:
+            table = change.table
+            print(".".join(table))
+        for line in describe_change(change):
+            print(f"    {_principal_name(change.principal)}: {line}")
+    _report_unanalyzable(parser.prog, unanalyzable)
+    if len(changes) == 0:
+        print(f"{parser.prog}: no effective permission changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Bulk evaluation of effective permissions for every principal on every table
+
+Rather than asking the evaluator one (user, table) question at a time, each distinct
+user or group pattern is matched once against the whole principal list, producing a
+bit mask (a python int with one bit per principal). First-match resolution for a table
+then walks its candidate rules in order, peeling off the principals that each rule claims
+with a few big-int operations, until every principal has been assigned a rule.
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+from .dsl2rules import load_dsl_file
+from .rules_eval import Permissions, RuleSection
+
+_matrix_columns = ["user", "groups", "catalog", "schema", "table", "allow", "owner", "privileges", "hide", "filter"]
+
+
+class _PrincipalMasks(object):
+    """caches principal bit masks per distinct user/group pattern"""
+
+    def __init__(self, principals: list):
+        self.principals = principals
+        self.all = (1 << len(principals)) - 1
+        self._user: dict = {}
+        self._group: dict = {}
+        self._rule: dict = {}
+
+    def _user_mask(self, pat) -> int:
+        m = self._user.get(pat.pattern)
+        if m is None:
+            m = 0
+            for j, (user, _) in enumerate(self.principals):
+                if pat.fullmatch(user) is not None:
+                    m |= 1 << j
+            self._user[pat.pattern] = m
+        return m
+
+    def _group_mask(self, pat) -> int:
+        m = self._group.get(pat.pattern)
+        if m is None:
+            m = 0
+            for j, (_, groups) in enumerate(self.principals):
+                if any(pat.fullmatch(g) is not None for g in groups):
+                    m |= 1 << j
+            self._group[pat.pattern] = m
+        return m
+
+    def mask(self, crule) -> int:
+        m = self._rule.get(crule)
+        if m is None:
+            m = self.all
+            if crule.user is not None:
+                m &= self._user_mask(crule.user)
+            if crule.group is not None:
+                m &= self._group_mask(crule.group)
+            self._rule[crule] = m
+        return m
+
+
+def _resolve(candidates: list, masks: _PrincipalMasks) -> list:
+    """returns the first matching rule dict (or None) among 'candidates' for every principal"""
+    assigned: list = [None] * len(masks.principals)
+    remaining = masks.all
+    for crule in candidates:
+        hit = remaining & masks.mask(crule)
+        if hit == 0:
+            continue
+        remaining &= ~hit
+        while hit:
+            low = hit & -hit
+            assigned[low.bit_length() - 1] = crule.rule
+            hit ^= low
+        if remaining == 0:
+            break
+    return assigned
+
+
+def resolved_sections(sections: dict, principals: list, tables: list):
+    """
+    Generates (table, resolved) for every table, where 'resolved' maps each section to the list
+    of the first matching rule dict (or None) for every principal. Consecutive tables with the
+    same candidate rules in a section, like the tables of one catalog in the 'catalogs' section,
+    share the same list, which must not be modified.
+    """
+    masks = _PrincipalMasks([(user, tuple(groups)) for user, groups in principals])
+    last: dict = {}
+    for obj in tables:
+        obj = tuple(obj)
+        resolved = {}
+        for k, section in sections.items():
+            candidates = section.candidates(obj)
+            if (k not in last) or (last[k][0] != candidates):
+                last[k] = (candidates, _resolve(candidates, masks))
+            resolved[k] = last[k][1]
+        yield (obj, resolved)
+
+
+def rule_permissions(section: str, rule) -> tuple:
+    """the fields of Permissions set by 'rule', the first matching rule of 'section', or by no rule if it is None"""
+    if section == "catalogs":
+        return ("none",) if rule is None else (rule["allow"],)
+    if section == "schemas":
+        return (False,) if rule is None else (rule["owner"],)
+    return ([], [], None) if rule is None else (rule["privileges"], rule.get("columns", []), rule.get("filter"))
+
+
+def access_matrix(rules: dict, principals: list, tables: list):
+    """
+    Generates (principal, table, Permissions) for every pair in principals x tables,
+    where each principal is a (user, groups) tuple and each table is a (catalog, schema, table) tuple.
+    Results are generated table by table, in the order of 'tables' and then 'principals'.
+    """
+    sections = {k: RuleSection(rules.get(k, [])) for k in ["catalogs", "schemas", "tables"]}
+    return section_matrix(sections, principals, tables)
+
+
+def section_matrix(sections: dict, principals: list, tables: list):
+    """access_matrix, for rule sections that are already indexed"""
+    for obj, resolved in resolved_sections(sections, principals, tables):
+        crules = resolved["catalogs"]
+        srules = resolved["schemas"]
+        trules = resolved["tables"]
+        for j, principal in enumerate(principals):
+            allow = "none" if crules[j] is None else crules[j]["allow"]
+            owner = False if srules[j] is None else srules[j]["owner"]
+            trule = trules[j]
+            if trule is None:
+                perms = Permissions(allow, owner, [], [], None)
+            else:
+                perms = Permissions(allow, owner, trule["privileges"], trule.get("columns", []), trule.get("filter"))
+            yield (principal, obj, perms)
+
+
+def _matrix_row(principal: tuple, obj: tuple, perms: Permissions) -> list:
+    user, groups = principal
+    return [
+        user,
+        ";".join(groups),
+        obj[0],
+        obj[1],
+        obj[2],
+        perms.allow,
+        perms.owner,
+        ";".join(perms.privileges),
+        ";".join([col["name"] for col in perms.columns if not col.get("allow", True)]),
+        "" if perms.filter is None else perms.filter,
+    ]
+
+
+def load_principals(fname: str) -> list:
+    """loads a yaml or json list of {"user": <name>, "groups": [<group>, ...]} entries"""
+    entries = load_dsl_file(fname)
+    return [(str(e["user"]), tuple([str(g) for g in e.get("groups", [])])) for e in entries]
+
+
+def load_tables(fname: str) -> list:
+    """loads a text file with one 'catalog.schema.table' name per line"""
+    tables = []
+    with open(fname, "r") as tables_file:
+        for line in tables_file:
+            line = line.strip()
+            if (len(line) == 0) or line.startswith("#"):
+                continue
+            parts = line.split(".")
+            if len(parts) != 3:
+                raise ValueError(f"{fname}: expected catalog.schema.table, found '{line}'")
+            tables.append(tuple(parts))
+    return tables
+
+
+def main():
+    from .dsl_loader import load_dsl_rules_sections
+
+    parser = argparse.ArgumentParser(description="emit the effective permission matrix for principals x tables")
+    parser.add_argument("dsl", metavar="DSL_FILE", help="trino acl DSL file (yaml or json)")
+    parser.add_argument("--principals", required=True, help="yaml or json list of {user, groups} entries")
+    parser.add_argument("--tables", required=True, help="text file listing catalog.schema.table, one per line")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv", help="csv rows, or json columns")
+    args = parser.parse_args(sys.argv[1:])
+
+    rules = {section: list(rules) for section, rules in load_dsl_rules_sections(args.dsl, validate=True)}
+    rows = (_matrix_row(*r) for r in access_matrix(rules, load_principals(args.principals), load_tables(args.tables)))
+
+    if args.format == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(_matrix_columns)
+        writer.writerows(rows)
+    else:
+        columns: dict = {c: [] for c in _matrix_columns}
+        for row in rows:
+            for c, v in zip(_matrix_columns, row):
+                columns[c].append(v)
+        json.dump(columns, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+A local policy decision service emulating trino file-based access control
+
+Tools like a data catalog UI or dbt pre-flight checks can ask "can user X read table Y, and
+which columns and filters apply?" over HTTP, without going through a trino coordinator.
+Rules are compiled from a DSL file once, into an indexed RulesEvaluator, and recompiled when
+the DSL file or any file it includes changes. Queries are json:
+
+GET  /check?user=alice&groups=devs,ops&table=dev.proj1.table1
+POST /check   {"user": "alice", "groups": ["devs"], "table": "dev.proj1.table1"}
+POST /batch   {"queries": [<query>, ...]}
+POST /batch   {"principals": [{"user": "alice", "groups": ["devs"]}, ...], "tables": ["dev.proj1.table1", ...]}
+GET  /health
+
+Each answer has the effective permissions of Permissions, plus 'read', which is true if the
+user can select from the table at all, and 'hidden' columns. A batch of principals x tables is
+evaluated with the bulk matcher of acl_matrix, one table at a time for all principals.
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .acl_matrix import section_matrix
+from .dsl2rules import file_stats
+from .rules_eval import RulesEvaluator
+
+
+class PolicyStore(object):
+    """
+    Holds the evaluator for a DSL file, replacing it when the DSL file or any file it includes
+    changes, which is checked at most once every 'reload_interval' seconds. If the changed DSL
+    does not compile, the last good rules stay in place.
+    """
+
+    def __init__(self, dslpath: str, reload_interval=1.0, log=sys.stderr):
+        self.dslpath = dslpath
+        self.reload_interval = reload_interval
+        self.log = log
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._stats, self._evaluator = self._load()
+
+    def _load(self) -> tuple:
+        from .dsl_loader import load_dsl_rules_sections
+
+        included: list = []
+        # the files are examined before they are read, so a change while loading is seen by the next check
+        stats = file_stats([self.dslpath])
+        sections = load_dsl_rules_sections(self.dslpath, validate=True, included=included)
+        evaluator = RulesEvaluator({section: list(rules) for section, rules in sections})
+        stats.update(file_stats(included))
+        self.loaded_at = time.time()
+        return (stats, evaluator)
+
+    def _changed(self) -> bool:
+        return file_stats(self._stats.keys()) != self._stats
+
+    def evaluator(self) -> RulesEvaluator:
+        """the current evaluator, reloading the DSL first if it changed"""
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return self._evaluator
+        # one request thread reloads, while the others keep answering from the current rules
+        if self._lock.acquire(blocking=False):
+            try:
+                self._checked = now
+                if self._changed():
+                    self._stats, self._evaluator = self._load()
+                    print(f"reloaded {self.dslpath}", file=self.log)
+            except Exception as e:
+                print(f"failed to reload {self.dslpath}, {type(e).__name__}:\n{e}", file=self.log)
+            finally:
+                self._lock.release()
+        return self._evaluator
+
+
+def _split_table(name) -> tuple:
+    parts = name.split(".") if isinstance(name, str) else list(name)
+    if len(parts) != 3:
+        raise ValueError(f"expected catalog.schema.table, found '{name}'")
+    return tuple(parts)
+
+
+def _groups(entry: dict) -> tuple:
+    """the groups of a json query or principal, given as a list or as a comma separated string"""
+    groups = entry.get("groups", [])
+    if isinstance(groups, str):
+        groups = [g for g in groups.split(",") if len(g) > 0]
+    if not (isinstance(groups, list) and all([isinstance(g, str) for g in groups])):
+        raise ValueError(f"expected a list of group names, found {json.dumps(groups)}")
+    return tuple(groups)
+
+
+def _parse_query(query: dict) -> tuple:
+    """a (user, groups, (catalog, schema, table)) tuple from a json query"""
+    obj = _split_table(query["table"])
+    return (str(query["user"]), _groups(query), obj)
+
+
+def _answer(perms) -> dict:
+    answer = perms._asdict()
+    answer["read"] = (perms.allow != "none") and ("SELECT" in perms.privileges)
+    answer["hidden"] = [col["name"] for col in perms.columns if not col.get("allow", True)]
+    return answer
+
+
+def check(evaluator: RulesEvaluator, query: dict) -> dict:
+    """the answer to one json query"""
+    user, groups, obj = _parse_query(query)
+    return _answer(evaluator.permissions(user, groups, *obj))
+
+
+def batch(evaluator: RulesEvaluator, request: dict) -> dict:
+    """the answers to a json batch, of 'queries', or of every pair of 'principals' x 'tables'"""
+    if "queries" in request:
+        return {"results": [check(evaluator, query) for query in request["queries"]]}
+    principals = [(str(p["user"]), _groups(p)) for p in request["principals"]]
+    tables = [_split_table(t) for t in request["tables"]]
+    results = []
+    for (user, groups), obj, perms in section_matrix(evaluator.sections, principals, tables):
+        answer = _answer(perms)
+        answer.update({"user": user, "groups": list(groups), "table": ".".join(obj)})
+        results.append(answer)
+    return {"results": results}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # set on the subclass made by 'make_server'
+    store: PolicyStore
+    verbose = False
+    # clients can keep a connection open across queries, since every reply has a Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, path: str, request):
+        if path == "/health":
+            return {"status": "ok", "dsl": self.store.dslpath, "loaded_at": self.store.loaded_at}
+        if path == "/check":
+            return check(self.store.evaluator(), request)
+        if (path == "/batch") and (self.command == "POST"):
+            return batch(self.store.evaluator(), request)
+        return None
+
+    def _handle(self, request):
+        path = urlsplit(self.path).path
+        try:
+            answer = self._dispatch(path, request)
+        except (KeyError, TypeError, ValueError) as e:
+            # malformed queries are the client's problem
+            self._reply(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        if answer is None:
+            self._reply(404, {"error": f"no such endpoint {self.command} {path}"})
+        else:
+            self._reply(200, answer)
+
+    def do_GET(self):
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        self._handle(query)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._reply(400, {"error": f"invalid json: {e}"})
+            return
+        self._handle(request)
+
+    def log_message(self, format, *args):
+        # clients send thousands of queries, so requests are only logged on request
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(store: PolicyStore, host="127.0.0.1", port=8181, verbose=False) -> ThreadingHTTPServer:
+    """an HTTP server answering queries from 'store', which is not started yet"""
+    handler = type("Handler", (_Handler,), {"store": store, "verbose": verbose})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="answer trino access control queries for a DSL over HTTP")
+    parser.add_argument("dsl", metavar="DSL_FILE", help="trino acl DSL file (yaml or json)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8181, help="port to listen on (default: 8181)")
+    parser.add_argument(
+        "--reload-interval", type=float, default=1.0, help="seconds between checks for DSL changes (default: 1)"
+    )
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(sys.argv[1:])
+
+    store = PolicyStore(args.dsl, reload_interval=args.reload_interval)
+    server = make_server(store, host=args.host, port=args.port, verbose=args.verbose)
+    print(f"{parser.prog}: serving {args.dsl} on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+A compact in-memory representation of compiled rules
+
+Rules generated from a large DSL are highly repetitive: the same catalog and schema names,
+privilege lists, hidden column lists and filters appear on many rules, but as dicts each rule
+holds its own copies. Here each rule is a slotted record, identifiers are interned, and
+privileges, hidden columns and filters are immutable values shared by every rule using them.
+Rules are converted back to the usual dict form only when they are serialized.
+
+>>> rules = dsl_to_compact_rules(dsl)
+>>> write_rules_json(rules.items(), rules_file)
+"""
+
+import sys
+
+from .dsl2rules import dsl_rules_sections
+
+# every attribute a generated rule can have
+_rule_keys = ("user", "group", "catalog", "schema", "table", "allow", "owner", "privileges", "columns", "filter")
+
+# attributes holding names or patterns, which are interned
+_identifier_keys = ("user", "group", "catalog", "schema", "table", "allow")
+
+
+class ColumnMask(object):
+    """one entry of a rule's 'columns' list"""
+
+    __slots__ = ("name", "allow")
+
+    def __init__(self, name: str, allow: bool):
+        self.name = name
+        self.allow = allow
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "allow": self.allow}
+
+
+class _SharedValues(object):
+    """shares one immutable object between all rules of a rule set having equal values"""
+
+    def __init__(self):
+        self._values: dict = {}
+        self._masks: dict = {}
+
+    def value(self, v):
+        return self._values.setdefault(v, v)
+
+    def columns(self, columns: list) -> tuple:
+        masks = []
+        for col in columns:
+            if set(col.keys()) != {"name", "allow"}:
+                raise ValueError(f"unsupported column specification {col}")
+            key = (sys.intern(col["name"]), col["allow"])
+            mask = self._masks.get(key)
+            if mask is None:
+                mask = self._masks.setdefault(key, ColumnMask(*key))
+            masks.append(mask)
+        return self.value(tuple(masks))
+
+
+class CompactRule(object):
+    """
+    A single rule. 'keys' is the tuple of attributes present on the rule, in the order
+    they appear in its dict form, and is itself shared between rules of the same shape.
+    """
+
+    __slots__ = ("keys",) + _rule_keys
+
+    def __init__(self, rule: dict, shared: _SharedValues):
+        for k, v in rule.items():
+            if k in _identifier_keys:
+                v = sys.intern(v)
+            elif k == "privileges":
+                v = shared.value(tuple([sys.intern(p) for p in v]))
+            elif k == "columns":
+                v = shared.columns(v)
+            elif k == "filter":
+                v = shared.value(v)
+            elif k != "owner":
+                raise ValueError(f"unsupported rule attribute {k}")
+            setattr(self, k, v)
+        self.keys = shared.value(tuple(rule.keys()))
+
+    def to_dict(self) -> dict:
+        rule = {}
+        for k in self.keys:
+            v = getattr(self, k)
+            if k == "privileges":
+                v = list(v)
+            elif k == "columns":
+                v = [col.to_dict() for col in v]
+            rule[k] = v
+        return rule
+
+
+class CompactRules(object):
+    """
+    Rules in compact form, built from (section, rules) pairs such as those generated by
+    'dsl_rules_sections'. Rules are consumed one at a time, so when they are generated lazily
+    the dict form of the whole rule set is never held in memory.
+    """
+
+    def __init__(self, sections):
+        shared = _SharedValues()
+        self.sections = {section: tuple([CompactRule(r, shared) for r in rules]) for section, rules in sections}
+
+    def items(self):
+        """(section, rules) pairs with rules in dict form, for example to pass to 'write_rules_json'"""
+        for section, rules in self.sections.items():
+            yield (section, (r.to_dict() for r in rules))
+
+    def to_rules(self) -> dict:
+        """the rules in their usual dict form"""
+        return {section: list(rules) for section, rules in self.items()}
+
+
+def dsl_to_compact_rules(dsl: dict, validate=True, jobs=1) -> CompactRules:
+    """equivalent to dsl_to_rules, but returns the rules in compact form"""
+    return CompactRules(dsl_rules_sections(dsl, validate=validate, jobs=jobs))
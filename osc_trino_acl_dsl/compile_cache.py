@@ -0,0 +1,111 @@
+"""
+A persistent cache of verified DSL -> rules.json pairs, for the pre-commit check,
+and of compiled DSL fragments
+
+Entries are keyed by a hash of the DSL file path and bytes, the package version, the revision
+of the compiled rules and the DSL json-schema, and record a hash of the rules.json bytes that were last verified to be
+consistent with that DSL. A repeat check of an unchanged pair is then two file hashes
+and a lookup, with no yaml parsing, validation or compilation. Compiled DSL fragments are
+keyed the same way by their content, and record their compiled rules as json. Entries are files
+in the cache directory, and the least recently used are evicted beyond a fixed number of entries.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from .__about__ import __version__
+
+_default_max_entries = 256
+
+
+def default_cache_dir() -> str:
+    """$OSC_TRINO_ACL_DSL_CACHE if set, otherwise osc-trino-acl-dsl under the user cache directory"""
+    if "OSC_TRINO_ACL_DSL_CACHE" in os.environ:
+        return os.environ["OSC_TRINO_ACL_DSL_CACHE"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "osc-trino-acl-dsl")
+
+
+def file_digest(fname: str) -> str:
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _schema_digest() -> str:
+    from .dsl2rules import _rules_revision, dsl_json_schema
+
+    h = hashlib.sha256(f"{_rules_revision}\n".encode("utf-8"))
+    h.update(json.dumps(dsl_json_schema(), sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class CompileCache(object):
+    """
+    Maps DSL files to the digest of the rules.json last verified against them.
+    I/O errors on the cache directory are never fatal: the cache just behaves as empty.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=_default_max_entries):
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.max_entries = max_entries
+        self._schema_digest = None
+
+    def _hash(self):
+        if self._schema_digest is None:
+            self._schema_digest = _schema_digest()
+        h = hashlib.sha256()
+        h.update(f"{__version__}\n{self._schema_digest}\n".encode("utf-8"))
+        return h
+
+    def key(self, dslpath: str) -> str:
+        h = self._hash()
+        # the files a DSL includes are relative to it, so equal DSLs in different directories may differ
+        h.update(f"{os.path.realpath(dslpath)}\n".encode("utf-8"))
+        h.update(file_digest(dslpath).encode("utf-8"))
+        return h.hexdigest()
+
+    def content_key(self, kind: str, data: bytes) -> str:
+        """the key for a value of some 'kind' derived from file content 'data', such as a compiled DSL fragment"""
+        h = self._hash()
+        h.update(f"{kind}\n".encode("utf-8"))
+        h.update(data)
+        return h.hexdigest()
+
+    def get(self, key: str):
+        """the cached value for 'key', or None"""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path, "r") as f:
+                value = f.read().strip()
+            # refresh access time for LRU eviction
+            os.utime(path)
+            return value
+        except OSError:
+            return None
+
+    def put(self, key: str, value: str):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                f.write(value)
+            os.replace(tmp, os.path.join(self.cache_dir, key))
+            self._evict()
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.cache_dir) if e.is_file() and not e.name.startswith(".")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
@@ -1,15 +1,20 @@
 import json
 import sys
 
-# from pyyaml package
-import yaml
+from .rules_io import write_rules_json
+from .timings import PhaseTimings, add_profiling_arguments, no_timings, profiling
 
 _dsl_schema_cache = None
 _dsl_validator_cache = None
+_dsl_entry_validator_cache: dict = {}
 
 _table_admin_privs = ["SELECT", "INSERT", "DELETE", "OWNERSHIP"]
 _table_public_privs = ["SELECT"]
 
+# the revision of the rules compiled from a DSL, which keys caches of compiled rules along with the
+# package version, and changes whenever the same DSL compiles to different rules
+_rules_revision = 2
+
 
 def dsl_json_schema():
     global _dsl_schema_cache
@@ -42,12 +47,208 @@ def dsl_json_validator():
     return _dsl_validator_cache
 
 
-def _acl_groups(jobj: dict, k="admin") -> list:
-    return [e["group"] for e in jobj[k] if ("group" in e)]
+def dsl_entry_validator(definition: str):
+    """
+    A validator for a single DSL entry, against one of the named definitions in the
+    DSL json-schema, for example 'schema-entry' or 'table-entry'
+    """
+    validator = _dsl_entry_validator_cache.get(definition)
+    if validator is not None:
+        return validator
+    import jsonschema
+
+    schema = dsl_json_schema()
+    validator = jsonschema.Draft7Validator(
+        {"$ref": f"#/definitions/{definition}", "definitions": schema["definitions"]}
+    )
+    _dsl_entry_validator_cache[definition] = validator
+    return validator
+
+
+def _validate(dsl, jobs=1):
+    from .validation import validate_dsl
+
+    validate_dsl(dsl, jobs=jobs)
+
+
+def _alternation(patterns: list) -> str:
+    if len(patterns) > 1:
+        patterns = sorted(set(patterns))
+    return sys.intern("|".join(patterns))
+
+
+class PrincipalSets(object):
+    """
+    A registry of the principal lists of a DSL, that is 'admin' and acl 'id' lists of user and group
+    patterns. Each distinct set of patterns is canonicalized once, into an alternation of its sorted,
+    deduplicated group patterns and one of its user patterns, and every rule generated from an equal
+    list, in any order, shares those same strings. A registry is created for each compilation.
+    """
+
+    def __init__(self):
+        # the number of lists looked up
+        self.lists = 0
+        self._lists: dict = {}
+
+    def __len__(self) -> int:
+        """the number of distinct principal sets"""
+        return len(set(self._lists.values()))
+
+    def alternations(self, ids: list) -> tuple:
+        """the (groups, users) alternations of a list of {"group": <pattern>} and {"user": <pattern>} entries"""
+        self.lists += 1
+        # lists are looked up as written, which is cheaper than as sets, and equal sets
+        # written in another order still share the same interned alternations
+        key = tuple([tuple(e.items()) for e in ids])
+        alts = self._lists.get(key)
+        if alts is None:
+            groups = [e["group"] for e in ids if "group" in e]
+            users = [e["user"] for e in ids if "user" in e]
+            alts = self._lists[key] = (_alternation(groups), _alternation(users))
+        return alts
+
+
+def principal_sets(dsl: dict, registry=None) -> PrincipalSets:
+    """
+    a registry of every principal list of 'dsl', or of a DSL fragment, see PrincipalSets,
+    which are added to 'registry' if it is given
+    """
+    if registry is None:
+        registry = PrincipalSets()
+    if "admin" in dsl:
+        registry.alternations(dsl["admin"])
+    for spec in dsl.get("schemas", []):
+        registry.alternations(spec["admin"])
+    for spec in dsl.get("tables", []):
+        if "admin" in spec:
+            registry.alternations(spec["admin"])
+        for acl in spec.get("acl", []):
+            registry.alternations(acl["id"])
+    return registry
+
+
+def _column_masks(hide: tuple) -> list:
+    return [{"name": col, "allow": False} for col in hide]
+
+
+def _conjunction(filters: tuple) -> str:
+    return " and ".join([f"({f})" for f in filters])
+
 
+class Expressions(object):
+    """
+    A registry of the column masks and row filters of table rules. Each distinct list of hidden columns
+    is built once into a 'columns' list, and each distinct list of filters into one conjunction, which
+    every rule hiding those columns or applying those filters shares, as rules share privilege lists.
+    The hidden columns and filters of a table's public rule, the unions of those of its acl entries and
+    its public settings, are likewise built once for each distinct combination. A registry is created
+    for each compilation, so that rules of separate compilations never share a 'columns' list.
+    """
+
+    def __init__(self):
+        # [value, uses] by key
+        self._columns: dict = {}
+        self._filters: dict = {}
+        # the (columns key, filters key) of the public rule, by the hidden columns and filters it unites
+        self._unions: dict = {}
+
+    def _shared(self, values: dict, key: tuple, build):
+        entry = values.get(key)
+        if entry is None:
+            entry = values[key] = [build(key), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def columns(self, hide: tuple) -> list:
+        """the 'columns' of a rule hiding the columns 'hide', which must not be modified"""
+        return self._shared(self._columns, hide, _column_masks)
+
+    def filter(self, filters: tuple) -> str:
+        """the 'filter' of a rule applying all of 'filters'"""
+        return self._shared(self._filters, filters, _conjunction)
+
+    def public(self, hides: tuple, filters: tuple) -> tuple:
+        """
+        the (columns, filter) of a public rule hiding every column of each tuple of 'hides' and applying
+        every filter of each tuple of 'filters', either of which is None if there are none
+        """
+        key = (hides, filters)
+        union = self._unions.get(key)
+        if union is None:
+            uhide = tuple(sorted(set([col for hide in hides for col in hide])))
+            ufilter = tuple(sorted(set([f for fs in filters for f in fs])))
+            union = self._unions[key] = (uhide if len(uhide) > 0 else None, ufilter if len(ufilter) > 0 else None)
+        uhide, ufilter = union
+        return (
+            None if uhide is None else self.columns(uhide),
+            None if ufilter is None else self.filter(ufilter),
+        )
+
+    def stats(self) -> dict:
+        """
+        the number of column masks and filters of rules, how many are distinct, and the size of
+        the json of the column masks and filters shared with an earlier rule, rather than rebuilt
+        """
+        shared_bytes = 0
+        for values in (self._columns, self._filters):
+            for value, uses in values.values():
+                shared_bytes += (uses - 1) * len(json.dumps(value))
+        return {
+            "column_masks": sum([uses for _, uses in self._columns.values()]),
+            "distinct_column_masks": len(self._columns),
+            "filters": sum([uses for _, uses in self._filters.values()]),
+            "distinct_filters": len(self._filters),
+            "shared_bytes": shared_bytes,
+        }
 
-def _acl_users(jobj: dict, k="admin") -> list:
-    return [e["user"] for e in jobj[k] if ("user" in e)]
+
+def _is_public(public) -> bool:
+    # spec['public'] can be either boolean or an object, and it
+    # registers as True if it is an object or boolean value True
+    return ((type(public) == bool) and public) or (type(public) == dict)
+
+
+def _table_expressions(spec: dict, pub: bool, expressions: Expressions) -> tuple:
+    """
+    the (columns, filter) of each acl entry of a table entry, and of its public rule if 'pub',
+    as ([(columns, filter), ...], (columns, filter)), with None for either if there is none
+    """
+    acl_masks = []
+    hides = []
+    filters = []
+    for acl in spec.get("acl", []):
+        columns = None
+        row_filter = None
+        if "hide" in acl:
+            hides.append(tuple(acl["hide"]))
+            columns = expressions.columns(hides[-1])
+        if "filter" in acl:
+            filters.append(tuple(acl["filter"]))
+            row_filter = expressions.filter(filters[-1])
+        acl_masks.append((columns, row_filter))
+    if not pub:
+        return (acl_masks, (None, None))
+    public = spec["public"]
+    if type(public) == dict:
+        # if 'public' was specified as an object with settings, then
+        # include these in the union of all hidden columns and filters
+        if "hide" in public:
+            hides.append(tuple(public["hide"]))
+        if "filter" in public:
+            filters.append(tuple(public["filter"]))
+    return (acl_masks, expressions.public(tuple(hides), tuple(filters)))
+
+
+def table_expressions(dsl: dict, registry=None) -> Expressions:
+    """
+    a registry of the column masks and filters of every table entry of 'dsl', or of a DSL fragment,
+    see Expressions, which are added to 'registry' if it is given
+    """
+    if registry is None:
+        registry = Expressions()
+    for spec in dsl.get("tables", []):
+        _table_expressions(spec, _is_public(spec["public"]), registry)
+    return registry
 
 
 # python is so dumb
@@ -65,7 +266,272 @@ def _concat(l1: list, l2: list) -> list:
     return c
 
 
-def dsl_to_rules(dsl: dict, validate=True) -> dict:  # noqa: C901
+def _admin_rules(dsl: dict) -> tuple:
+    """the (catalog, schema, table) rules for the global admin acl"""
+    catalog_rules = []
+    schema_rules = []
+    table_rules = []
+    groups, users = PrincipalSets().alternations(dsl["admin"])
+    if len(groups) > 0:
+        # if any group entries were present, insert corresponding admin rules
+        catalog_rules.append({"group": groups, "allow": "all"})
+        schema_rules.append({"group": groups, "owner": True})
+        table_rules.append({"group": groups, "privileges": _table_admin_privs})
+    if len(users) > 0:
+        # if any user entries were present, insert corresponding admin rules
+        catalog_rules.append({"user": users, "allow": "all"})
+        schema_rules.append({"user": users, "owner": True})
+        table_rules.append({"user": users, "privileges": _table_admin_privs})
+    return (catalog_rules, schema_rules, table_rules)
+
+
+def _schema_fragment(spec: dict, principals=None) -> tuple:
+    """
+    the (schema, table) admin rules for one entry of the dsl 'schemas' list, with the alternations
+    of 'principals', the PrincipalSets of the compilation, if it is given
+    """
+    if principals is None:
+        principals = PrincipalSets()
+    schema_rules = []
+    table_rules = []
+    cst = {"catalog": spec["catalog"], "schema": spec["schema"]}
+    # configure group(s) with ownership of this schema
+    groups, users = principals.alternations(spec["admin"])
+    if len(groups) > 0:
+        schema_rules.append(_union(cst, {"group": groups, "owner": True}))
+        # ensure that schema admins also have full table-level privs inside their schema
+        table_rules.append(_union(cst, {"group": groups, "privileges": _table_admin_privs}))
+    # add corresponding rules for any user patterns
+    if len(users) > 0:
+        schema_rules.append(_union(cst, {"user": users, "owner": True}))
+        table_rules.append(_union(cst, {"user": users, "privileges": _table_admin_privs}))
+    return (schema_rules, table_rules)
+
+
+def _table_fragment(spec: dict, principals=None, expressions=None) -> list:  # noqa: C901
+    """
+    the table rules for one entry of the dsl 'tables' list, with the alternations of 'principals' and the
+    column masks and filters of 'expressions', the PrincipalSets and Expressions of the compilation, if given
+    """
+    if principals is None:
+        principals = PrincipalSets()
+    if expressions is None:
+        expressions = Expressions()
+    table_rules = []
+    cst = {"catalog": spec["catalog"], "schema": spec["schema"], "table": spec["table"]}
+    # "admin" is optional for any individual table because schema admins
+    # are also table admins for any table in the schema
+    if "admin" in spec:
+        # table admin group rules go first to override others
+        rule = _union(cst, {"privileges": _table_admin_privs})
+        groups, users = principals.alternations(spec["admin"])
+        if len(groups) > 0:
+            table_rules.append(_union({"group": groups}, rule))
+        if len(users) > 0:
+            table_rules.append(_union({"user": users}, rule))
+    pub = _is_public(spec["public"])
+    acl_masks, (pcolumns, pfilter) = _table_expressions(spec, pub, expressions)
+    # construct acl rules if any are configured
+    for acl, (columns, row_filter) in zip(spec.get("acl", []), acl_masks):
+        rule = _union(cst, {"privileges": _table_public_privs})
+        if columns is not None:
+            rule["columns"] = columns
+        if row_filter is not None:
+            rule["filter"] = row_filter
+        groups, users = principals.alternations(acl["id"])
+        if len(groups) > 0:
+            table_rules.append(_union({"group": groups}, rule))
+        if len(users) > 0:
+            table_rules.append(_union({"user": users}, rule))
+    # table default policy goes last
+    rule = _union(cst, {"privileges": (_table_public_privs if pub else [])})
+    # if table is set to general public access, then include
+    # all hidden columns and row filters in the acl list, so that
+    # public cannot see anything hidden by any other row/col ACL rule
+    if pcolumns is not None:
+        rule["columns"] = pcolumns
+    if pfilter is not None:
+        rule["filter"] = pfilter
+    table_rules.append(rule)
+    return table_rules
+
+
+def _catalog_admins(schema_specs, table_specs) -> dict:
+    """
+    Any schema or table admins require "allow":"all" on the associated catalog
+    so it is most effective to just accumulate these and add corresponding rules
+    in the catalog section
+    https://trino.io/docs/current/security/file-system-access-control.html#catalog-schema-and-table-access
+    note there is not a similar issue for table -> schema ownerships
+    """
+    uallow: dict = {}
+    for spec in schema_specs:
+        uallow.setdefault(spec["catalog"], []).extend(spec["admin"])
+    for spec in table_specs:
+        if "admin" in spec:
+            uallow.setdefault(spec["catalog"], []).extend(spec["admin"])
+    return uallow
+
+
+def _catalog_section(dsl: dict, admin_rules: list, uallow: dict, timings):
+    yield from admin_rules
+    with timings.phase("catalogs"):
+        for spec in dsl["catalogs"]:
+            rule = {"catalog": spec["catalog"], "allow": "all"}
+            # configure group(s) with read+write access to this catalog
+            # I have concerns about how using "|" style regex is going to scale if number
+            # of schemas and tables grows large, so I am going to encode these as individual rules
+            ugs = sorted(list(set([e["group"] for e in uallow.get(spec["catalog"], []) if "group" in e])))
+            for ug in ugs:
+                yield _union({"group": ug}, rule)
+            ugs = sorted(list(set([e["user"] for e in uallow.get(spec["catalog"], []) if "user" in e])))
+            for ug in ugs:
+                yield _union({"user": ug}, rule)
+    yield {
+        # allows basic 'show schemas' and 'show tables' operations for everyone
+        "allow": "read-only"
+    }
+
+
+def _schema_section(admin_rules: list, schema_fragments: list):
+    yield from admin_rules
+    for srules, _ in schema_fragments:
+        yield from srules
+    yield {
+        # defaulting all schemas to owner is not safe
+        # schemas should be assigned ownership on an explicit basis
+        "owner": False
+    }
+
+
+def _table_section(dsl: dict, admin_rules: list, schema_fragments: list, table_fragments, timings):
+    yield from admin_rules
+    # the semantic definition for schema admin is that it includes
+    # admin over any table in that schema, so these rules need to appear before other table
+    # related rules
+    for _, trules in schema_fragments:
+        yield from trules
+    # table rules go here
+    with timings.phase("tables"):
+        for trules in table_fragments:
+            yield from trules
+    # default schema rules for tables are lower priority than specific table rules
+    with timings.phase("schema defaults"):
+        for spec in dsl["schemas"]:
+            cst = {"catalog": spec["catalog"], "schema": spec["schema"]}
+            # set the default public privs inside this schema
+            yield _union(cst, {"privileges": _table_public_privs if spec["public"] else []})
+    # catalog rules for tables section are lower priority than schema rules above
+    with timings.phase("catalogs"):
+        for spec in dsl["catalogs"]:
+            yield {"catalog": spec["catalog"], "privileges": _table_public_privs if spec["public"] else []}
+    # global default rules go last
+    yield {
+        # default table privs can be 'read-only' (i.e. select) or 'no privileges'
+        "privileges": (_table_public_privs if dsl["public"] else [])
+    }
+
+
+def _rules_sections(dsl: dict, schema_fragments: list, table_fragments, timings=no_timings):
+    """
+    Generate the ("catalogs", rules), ("schemas", rules), ("tables", rules) sections of a rules
+    structure from the global sections of 'dsl' and the per-entry rule fragments, which must correspond
+    one-to-one with dsl["schemas"] and dsl["tables"]. 'table_fragments' is only iterated once, while
+    generating the 'tables' section, so it may be lazy.
+    """
+    if "include" in dsl:
+        # included paths are relative to the DSL file, see dsl_loader.load_dsl_rules_sections
+        raise ValueError("a DSL with 'include' must be compiled from its file")
+    with timings.phase("catalogs"):
+        uallow = _catalog_admins(dsl["schemas"], dsl["tables"])
+    # rules configuring admin acl go first to ensure they override anything else
+    with timings.phase("admin"):
+        admin_catalog, admin_schema, admin_table = _admin_rules(dsl)
+    yield ("catalogs", _catalog_section(dsl, admin_catalog, uallow, timings))
+    yield ("schemas", _schema_section(admin_schema, schema_fragments))
+    yield ("tables", _table_section(dsl, admin_table, schema_fragments, table_fragments, timings))
+
+
+def _assemble_rules(dsl: dict, schema_fragments: list, table_fragments, timings=no_timings) -> dict:
+    """assemble the final json structure from 'dsl' and its per-entry rule fragments"""
+    sections = _rules_sections(dsl, schema_fragments, table_fragments, timings=timings)
+    return {section: list(rules) for section, rules in sections}
+
+
+def _compile_shard(schema_specs: list, table_specs: list) -> tuple:
+    """compile the fragments for one shard of entries, in a worker process"""
+    principals = PrincipalSets()
+    expressions = Expressions()
+    return (
+        [_schema_fragment(spec, principals) for spec in schema_specs],
+        [_table_fragment(spec, principals, expressions) for spec in table_specs],
+    )
+
+
+def _parallel_fragments(dsl: dict, jobs: int) -> tuple:
+    """
+    Compile the schema and table fragments of 'dsl' across 'jobs' worker processes.
+    Entries are sharded by catalog, and fragments are merged back into DSL order, so
+    the result is identical to compiling them serially.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # group entry indexes by catalog, then deal catalogs to shards largest first
+    catalogs: dict = {}
+    for j, spec in enumerate(dsl["schemas"]):
+        catalogs.setdefault(spec["catalog"], ([], []))[0].append(j)
+    for j, spec in enumerate(dsl["tables"]):
+        catalogs.setdefault(spec["catalog"], ([], []))[1].append(j)
+    shards: list = [([], []) for _ in range(jobs)]
+    for sidx, tidx in sorted(catalogs.values(), key=lambda e: -(len(e[0]) + len(e[1]))):
+        shard = min(shards, key=lambda e: len(e[0]) + len(e[1]))
+        shard[0].extend(sidx)
+        shard[1].extend(tidx)
+    shards = [e for e in shards if (len(e[0]) + len(e[1])) > 0]
+    if len(shards) <= 1:
+        # no entries, or a single catalog, gain nothing from worker processes
+        return _compile_shard(dsl["schemas"], dsl["tables"])
+
+    schema_fragments: list = [None] * len(dsl["schemas"])
+    table_fragments: list = [None] * len(dsl["tables"])
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [
+            pool.submit(_compile_shard, [dsl["schemas"][j] for j in sidx], [dsl["tables"][j] for j in tidx])
+            for sidx, tidx in shards
+        ]
+        for (sidx, tidx), future in zip(shards, futures):
+            sfrags, tfrags = future.result()
+            for j, frag in zip(sidx, sfrags):
+                schema_fragments[j] = frag
+            for j, frag in zip(tidx, tfrags):
+                table_fragments[j] = frag
+    return (schema_fragments, table_fragments)
+
+
+def dsl_rules_sections(dsl: dict, validate=True, jobs=1):
+    """
+    Transform DSL json structure to trino 'rules.json' structure, section by section
+
+    Generates ("catalogs", rules), ("schemas", rules) and ("tables", rules), where each
+    'rules' is an iterator that generates the rules of that section as they are compiled.
+    Each section should be consumed before advancing to the next. Together with
+    'rules_io.write_rules_json' this avoids holding the full 'tables' rule list in memory.
+    If jobs > 1 entries are compiled up front in parallel, as with 'dsl_to_rules'.
+    """
+    if validate:
+        # validate the dsl json structure against the DSL json-schema
+        _validate(dsl, jobs)
+
+    if jobs > 1:
+        return _rules_sections(dsl, *_parallel_fragments(dsl, jobs))
+    principals = PrincipalSets()
+    expressions = Expressions()
+    schema_fragments = [_schema_fragment(spec, principals) for spec in dsl["schemas"]]
+    table_fragments = (_table_fragment(spec, principals, expressions) for spec in dsl["tables"])
+    return _rules_sections(dsl, schema_fragments, table_fragments)
+
+
+def dsl_to_rules(dsl: dict, validate=True, jobs=1, timings=no_timings) -> dict:
     """
     Transform DSL json structure to trino 'rules.json' structure
 
@@ -75,176 +541,251 @@ def dsl_to_rules(dsl: dict, validate=True) -> dict:  # noqa: C901
 
     This function returns a 'dict' structure that can be written using 'json.dump' to produce
     a 'rules.json' file ingestable by trino.
+
+    If jobs > 1, the schema and table entries are compiled in that many worker processes,
+    sharded by catalog. The result is identical to serial compilation.
+
+    If 'timings' is a timings.PhaseTimings, the time spent in each phase of compilation is recorded.
     """
     if validate:
         # validate the dsl json structure against the DSL json-schema
-        dsl_json_validator().validate(dsl)
-
-    # mypy type checking may prefer these be typed but needs py3.9 to
-    # support clean list[dict] type annotation
-    catalog_rules = []
-    schema_rules = []
-    table_rules = []
-
-    # rules configuring admin acl go first to ensure they override anything else
-    ugs = _acl_groups(dsl)
-    if len(ugs) > 0:
-        # if any group entries were present, insert corresponding admin rules
-        catalog_rules.append({"group": "|".join(ugs), "allow": "all"})
-        schema_rules.append({"group": "|".join(ugs), "owner": True})
-        table_rules.append({"group": "|".join(ugs), "privileges": _table_admin_privs})
-    ugs = _acl_users(dsl)
-    if len(ugs) > 0:
-        # if any user entries were present, insert corresponding admin rules
-        catalog_rules.append({"user": "|".join(ugs), "allow": "all"})
-        schema_rules.append({"user": "|".join(ugs), "owner": True})
-        table_rules.append({"user": "|".join(ugs), "privileges": _table_admin_privs})
-
-    # any schema or table admins require "allow":"all" on the associated catalog
-    # so it is most effective to just accumulate these and add corresponding rules
-    # in the catalog section
-    # https://trino.io/docs/current/security/file-system-access-control.html#catalog-schema-and-table-access
-    # note there is not a similar issue for table -> schema ownerships
-    uallow: dict = {}
+        with timings.phase("validate"):
+            _validate(dsl, jobs)
 
-    # the semantic definition for schema admin is that it includes
-    # admin over any table in that schema, so these rules need to appear before other table
-    # related rules
-    for spec in dsl["schemas"]:
-        cst = {"catalog": spec["catalog"], "schema": spec["schema"]}
-        # configure group(s) with ownership of this schema
-        ugs = _acl_groups(spec)
-        if len(ugs) > 0:
-            schema_rules.append(_union(cst, {"group": "|".join(ugs), "owner": True}))
-            # ensure that schema admins also have full table-level privs inside their schema
-            table_rules.append(_union(cst, {"group": "|".join(ugs), "privileges": _table_admin_privs}))
-        # add corresponding rules for any user patterns
-        ugs = _acl_users(spec)
-        if len(ugs) > 0:
-            schema_rules.append(_union(cst, {"user": "|".join(ugs), "owner": True}))
-            table_rules.append(_union(cst, {"user": "|".join(ugs), "privileges": _table_admin_privs}))
-        uallow[spec["catalog"]] = _concat(uallow.get(spec["catalog"], []), spec["admin"])
-
-    # table rules go here
-    for spec in dsl["tables"]:
-        cst = {"catalog": spec["catalog"], "schema": spec["schema"], "table": spec["table"]}
-        # "admin" is optional for any individual table because schema admins
-        # are also table admins for any table in the schema
-        if "admin" in spec:
-            # table admin group rules go first to override others
-            rule = _union(cst, {"privileges": _table_admin_privs})
-            ugs = _acl_groups(spec)
-            if len(ugs) > 0:
-                table_rules.append(_union({"group": "|".join(ugs)}, rule))
-            ugs = _acl_users(spec)
-            if len(ugs) > 0:
-                table_rules.append(_union({"user": "|".join(ugs)}, rule))
-            uallow[spec["catalog"]] = _concat(uallow.get(spec["catalog"], []), spec["admin"])
-        # construct acl rules if any are configured
-        uhide = set()
-        ufilter = set()
-        if "acl" in spec:
-            for acl in spec["acl"]:
-                rule = _union(cst, {"privileges": _table_public_privs})
-                if "hide" in acl:
-                    uhide.update(set(acl["hide"]))
-                    rule.update({"columns": [{"name": col, "allow": False} for col in acl["hide"]]})
-                if "filter" in acl:
-                    ufilter.update(set(acl["filter"]))
-                    rule.update({"filter": " and ".join([f"({f})" for f in acl["filter"]])})
-                ugs = _acl_groups(acl, k="id")
-                if len(ugs) > 0:
-                    table_rules.append(_union({"group": "|".join(ugs)}, rule))
-                ugs = _acl_users(acl, k="id")
-                if len(ugs) > 0:
-                    table_rules.append(_union({"user": "|".join(ugs)}, rule))
-        # table default policy goes last
-        # spec['public'] can be either boolean or an object, and it
-        # registers as True if it is an object or boolean value True
-        public = spec["public"]
-        pub = ((type(public) == bool) and public) or (type(public) == dict)
-        rule = _union(cst, {"privileges": (_table_public_privs if pub else [])})
-        if type(public) == dict:
-            # if 'public' was specified as an object with settings, then
-            # include these in the union of all hidden columns and filters
-            if "hide" in public:
-                uhide.update(set(public["hide"]))
-            if "filter" in public:
-                ufilter.update(set(public["filter"]))
-        if pub:
-            # if table is set to general public access, then include
-            # all hidden columns and row filters in the acl list, so that
-            # public cannot see anything hidden by any other row/col ACL rule
-            if len(uhide) > 0:
-                rule.update({"columns": [{"name": col, "allow": False} for col in sorted(list(uhide))]})
-            if len(ufilter) > 0:
-                rule.update({"filter": " and ".join([f"({f})" for f in sorted(list(ufilter))])})
-        table_rules.append(rule)
+    if jobs > 1:
+        with timings.phase("parallel compile"):
+            fragments = _parallel_fragments(dsl, jobs)
+        return _assemble_rules(dsl, *fragments, timings=timings)
+    principals = PrincipalSets()
+    expressions = Expressions()
+    with timings.phase("schemas"):
+        schema_fragments = [_schema_fragment(spec, principals) for spec in dsl["schemas"]]
+    with timings.phase("tables"):
+        table_fragments = [_table_fragment(spec, principals, expressions) for spec in dsl["tables"]]
+    return _assemble_rules(dsl, schema_fragments, table_fragments, timings=timings)
 
-    # default schema rules for tables are lower priority than specific table rules
-    for spec in dsl["schemas"]:
-        cst = {"catalog": spec["catalog"], "schema": spec["schema"]}
-        # set the default public privs inside this schema
-        table_rules.append(_union(cst, {"privileges": _table_public_privs if spec["public"] else []}))
-
-    # next are catalog rules
-    for spec in dsl["catalogs"]:
-        rule = {"catalog": spec["catalog"], "allow": "all"}
-        # configure group(s) with read+write access to this catalog
-        # I have concerns about how using "|" style regex is going to scale if number
-        # of schemas and tables grows large, so I am going to encode these as individual rules
-        ugs = sorted(list(set([e["group"] for e in uallow.get(spec["catalog"], []) if "group" in e])))
-        for ug in ugs:
-            catalog_rules.append(_union({"group": ug}, rule))
-        ugs = sorted(list(set([e["user"] for e in uallow.get(spec["catalog"], []) if "user" in e])))
-        for ug in ugs:
-            catalog_rules.append(_union({"user": ug}, rule))
-
-        # catalog rules for tables section are lower priority than schema rules above
-        table_rules.append({"catalog": spec["catalog"], "privileges": _table_public_privs if spec["public"] else []})
 
-    # global default rules go last
-    table_rules.append(
-        {
-            # default table privs can be 'read-only' (i.e. select) or 'no privileges'
-            "privileges": (_table_public_privs if dsl["public"] else [])
-        }
-    )
-    schema_rules.append(
-        {
-            # defaulting all schemas to owner is not safe
-            # schemas should be assigned ownership on an explicit basis
-            "owner": False
-        }
-    )
-    catalog_rules.append(
-        {
-            # allows basic 'show schemas' and 'show tables' operations for everyone
-            "allow": "read-only"
-        }
-    )
+def yaml_loader():
+    """the libyaml based safe loader if pyyaml was built with it, otherwise the pure python one"""
+    # pyyaml is imported on first use, it is a noticeable part of command startup time
+    import yaml
 
-    # assemble the final json structure and return it
-    rules = {"catalogs": catalog_rules, "schemas": schema_rules, "tables": table_rules}
-    return rules
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
-def main():
-    dsl_fname = sys.argv[1]
+def load_dsl_file(dsl_fname: str):
+    """load a yaml or json file, based on its file suffix"""
+    import yaml
 
     with open(dsl_fname, "r") as dsl_file:
         if dsl_fname.endswith(".json"):
-            dsl = json.load(dsl_file)
+            return json.load(dsl_file)
         elif dsl_fname.endswith(".yaml"):
-            dsl = yaml.safe_load(dsl_file)
+            return yaml.load(dsl_file, Loader=yaml_loader())
         else:
             raise ValueError(f"Filename {dsl_fname} had unrecognized suffix")
 
-    rules = dsl_to_rules(dsl, validate=True)
 
-    with sys.stdout as rules_file:
-        json.dump(rules, rules_file, indent=4)
-        rules_file.write("\n")
+def _load_timed(dsl_fname: str, timings):
+    import yaml
+
+    with timings.phase("read"):
+        with open(dsl_fname, "r") as dsl_file:
+            text = dsl_file.read()
+    if dsl_fname.endswith(".json"):
+        with timings.phase("json load"):
+            return json.loads(text)
+    elif dsl_fname.endswith(".yaml"):
+        with timings.phase("yaml load"):
+            return yaml.load(text, Loader=yaml_loader())
+    else:
+        raise ValueError(f"Filename {dsl_fname} had unrecognized suffix")
+
+
+def _compile_sections(args, timings, included):
+    from .compile_cache import CompileCache
+    from .dsl_loader import load_dsl_rules_sections
+
+    # compiled DSL fragments are cached
+    cache = None if args.no_cache else CompileCache(cache_dir=args.cache_dir)
+    if not (args.timings or (args.jobs > 1)):
+        return load_dsl_rules_sections(args.dsl, validate=True, cache=cache, included=included)
+    # phases are run one after another, rather than streamed, so they can be measured separately
+    dsl = _load_timed(args.dsl, timings)
+    if isinstance(dsl, dict) and ("include" in dsl):
+        from .dsl_modules import included_rules_sections
+
+        return included_rules_sections(dsl, args.dsl, True, cache, included)
+    if args.timings:
+        return dsl_to_rules(dsl, jobs=args.jobs, timings=timings).items()
+    return dsl_rules_sections(dsl, validate=True, jobs=args.jobs)
+
+
+def _compile_main(prog: str, args, timings=no_timings, included=None):
+    """
+    The rules sections for the command line arguments of 'main'. The paths of
+    any files included by the DSL are appended to the list 'included', if it is not None.
+    """
+    sections = _compile_sections(args, timings, included)
+
+    if args.optimize:
+        from .rules_optimize import check_equivalence, optimize_rules
+
+        compiled = {section: list(rules) for section, rules in sections}
+        with timings.phase("optimize"):
+            rules, report = optimize_rules(compiled)
+        for section, (before, after) in report.items():
+            print(f"{prog}: {section}: {before} -> {after} rules", file=sys.stderr)
+        # optimized rules are only ever written if they give every principal the same permissions
+        with timings.phase("check equivalence"):
+            difference = check_equivalence(compiled, rules)
+        if difference is not None:
+            principal, table = difference
+            raise ValueError(f"optimized rules differ from the compiled rules for {principal} on {table}")
+        sections = rules.items()
+    if args.factor_patterns:
+        from .rules_patterns import factor_rules
+
+        with timings.phase("factor patterns"):
+            sections = factor_rules({section: list(rules) for section, rules in sections}).items()
+    return sections
+
+
+def _publish(prog: str, sections, output: str, fmt: str):
+    from .rules_io import publish_rules
+
+    if publish_rules({section: list(rules) for section, rules in sections}, output, fmt=fmt):
+        print(f"{prog}: wrote {output}", file=sys.stderr)
+    else:
+        print(f"{prog}: {output} is unchanged", file=sys.stderr)
+
+
+def _write_stdout(sections, fmt: str):
+    if fmt == "json":
+        with sys.stdout as rules_file:
+            write_rules_json(sections, rules_file)
+        return
+    from .rules_io import encode_rules
+
+    data = encode_rules({section: list(rules) for section, rules in sections}, fmt)
+    with sys.stdout.buffer as rules_file:
+        rules_file.write(data)
+
+
+def file_stats(paths) -> dict:
+    """the modification time and size of each of 'paths' that can be read"""
+    import os
+
+    stats = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stats[path] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def _watch(prog: str, args, polls=None):
+    """
+    Regenerate args.output whenever the DSL file or any file it includes changes, which is detected
+    by polling their modification times and sizes. If 'polls' is not None, stop after that many polls.
+    """
+    import time
+
+    watched = [args.dsl]
+    last: dict = {}
+    while (polls is None) or (polls > 0):
+        stats = file_stats(watched)
+        # a watched file that is missing is a change too, so that the failure to compile is reported
+        current = {path: stats.get(path) for path in watched}
+        if any([(path not in last) or (last[path] != stat) for path, stat in current.items()]):
+            last.update(current)
+            included: list = []
+            try:
+                _publish(prog, _compile_main(prog, args, included=included), args.output, args.format)
+                # files newly included are watched from now on
+                watched = [args.dsl] + included
+                last.update({path: stat for path, stat in file_stats(included).items() if path not in last})
+            except Exception as e:
+                # the last good rules stay in place until the DSL is fixed
+                print(f"{prog}: failed to compile {args.dsl}, {type(e).__name__}:\n{e}", file=sys.stderr)
+        if polls is not None:
+            polls -= 1
+        time.sleep(args.poll_interval)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="transform a trino acl DSL file to trino rules.json")
+    parser.add_argument("dsl", metavar="DSL_FILE", help="trino acl DSL file (yaml or json)")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1, help="number of worker processes used to compile DSL entries"
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="remove shadowed rules and merge adjacent equivalent rules, reporting the reduction on stderr, "
+        "and refuse to write them unless they give the same permissions as the compiled rules",
+    )
+    parser.add_argument(
+        "--factor-patterns",
+        action="store_true",
+        help="rewrite alternations of user and group names into trie-factored patterns, which trino matches faster",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="RULES_FILE",
+        default=None,
+        help="write rules atomically to RULES_FILE, only if they changed, instead of to standard output",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "minified", "pickle", "msgpack"],
+        default="json",
+        help="indented json (the default), minified json, or a binary format only read by tools of this package",
+    )
+    parser.add_argument(
+        "--watch", action="store_true", help="with --output, keep regenerating RULES_FILE whenever DSL_FILE changes"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="always recompile files included by DSL_FILE, ignoring the cache"
+    )
+    parser.add_argument("--cache-dir", default=None, help="directory for compiled files included by DSL_FILE")
+    parser.add_argument(
+        "--poll-interval", type=float, default=1.0, help="seconds between checks of DSL_FILE for --watch"
+    )
+    add_profiling_arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+    if args.watch and (args.output is None):
+        parser.error("--watch requires --output")
+    if args.format == "msgpack":
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            parser.error("--format msgpack requires the msgpack package")
+
+    if args.watch:
+        try:
+            _watch(parser.prog, args)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    timings = PhaseTimings(trace_memory=True) if args.timings else no_timings
+    with profiling(args.profile, args.timings, args.tracemalloc):
+        sections = _compile_main(parser.prog, args, timings)
+        if args.output is not None:
+            with timings.phase("publish"):
+                _publish(parser.prog, sections, args.output, args.format)
+        else:
+            with timings.phase(f"{args.format} dump"):
+                _write_stdout(sections, args.format)
+
+    if args.timings:
+        print(timings.report(prefix=f"{parser.prog}: "), file=sys.stderr)
 
 
 if __name__ == "__main__":
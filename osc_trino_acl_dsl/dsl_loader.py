@@ -0,0 +1,172 @@
+"""
+Event based loading of yaml DSL files
+
+The DSL 'tables' list is by far the largest part of a policy. Rather than constructing the
+whole yaml document before compiling it, this loader walks the parser's event stream and hands
+each table entry to the compiler as soon as it has been read, so that table entries need not all
+be held in memory at once. The libyaml parser is used whenever pyyaml was built with it.
+"""
+
+import json
+
+import yaml
+
+from .dsl2rules import (
+    Expressions,
+    PrincipalSets,
+    _rules_sections,
+    _schema_fragment,
+    _table_fragment,
+    dsl_rules_sections,
+    yaml_loader,
+)
+from .dsl_modules import included_rules_sections, merge_includes
+from .validation import validate_entry, validate_skeleton
+
+
+class _EventComposer(object):
+    """composes yaml nodes from a loader's event stream, one node at a time"""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.anchors: dict = {}
+
+    def _resolve_tag(self, kind, event, value):
+        if (event.tag is None) or (event.tag == "!"):
+            return self.loader.resolve(kind, value, event.implicit)
+        return event.tag
+
+    def _anchor(self, event, node):
+        if event.anchor is not None:
+            self.anchors[event.anchor] = node
+        return node
+
+    def compose(self):
+        event = self.loader.get_event()
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self.anchors:
+                raise yaml.composer.ComposerError(None, None, f"found undefined alias {event.anchor}", event.start_mark)
+            return self.anchors[event.anchor]
+        if isinstance(event, yaml.ScalarEvent):
+            tag = self._resolve_tag(yaml.ScalarNode, event, event.value)
+            node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+            return self._anchor(event, node)
+        if isinstance(event, yaml.SequenceStartEvent):
+            tag = self._resolve_tag(yaml.SequenceNode, event, None)
+            node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            self._anchor(event, node)
+            while not self.loader.check_event(yaml.SequenceEndEvent):
+                node.value.append(self.compose())
+            node.end_mark = self.loader.get_event().end_mark
+            return node
+        if isinstance(event, yaml.MappingStartEvent):
+            tag = self._resolve_tag(yaml.MappingNode, event, None)
+            node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            self._anchor(event, node)
+            while not self.loader.check_event(yaml.MappingEndEvent):
+                key = self.compose()
+                node.value.append((key, self.compose()))
+            node.end_mark = self.loader.get_event().end_mark
+            return node
+        raise yaml.composer.ComposerError(None, None, f"unexpected yaml event {event}", event.start_mark)
+
+    def construct(self):
+        return self.loader.construct_document(self.compose())
+
+
+def _iter_sequence(composer):
+    while not composer.loader.check_event(yaml.SequenceEndEvent):
+        yield composer.construct()
+    composer.loader.get_event()
+
+
+def iter_dsl_yaml(stream):
+    """
+    Generates (key, value) for each top-level key of a yaml DSL document.
+    The value for 'tables' is itself a generator of the table entries, parsed one at a time,
+    which must be fully consumed before advancing to the next key.
+    """
+    loader = yaml_loader()(stream)
+    try:
+        composer = _EventComposer(loader)
+        loader.get_event()  # stream start
+        if not loader.check_event(yaml.DocumentStartEvent):
+            raise ValueError("DSL yaml stream contained no document")
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError("DSL yaml document is not a mapping")
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = composer.construct()
+            if (key == "tables") and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                yield (key, _iter_sequence(composer))
+            else:
+                yield (key, composer.construct())
+    finally:
+        loader.dispose()
+
+
+def stream_dsl_rules_sections(stream, validate=True, dsl_fname="", cache=None, included=None):
+    """
+    Parse a yaml DSL from 'stream' and compile its table entries as they are read.
+    Returns the (section, rules) pairs of the compiled rules, like 'dsl_rules_sections'.
+    Any files the DSL includes are found relative to 'dsl_fname', and are cached in 'cache'
+    if it is not None, and their paths are appended to the list 'included' if it is not None.
+    """
+    dsl: dict = {}
+    table_fragments: list = []
+    principals = PrincipalSets()
+    expressions = Expressions()
+    for key, value in iter_dsl_yaml(stream):
+        if key != "tables":
+            dsl[key] = value
+            continue
+        # only the catalog and admin list of each table entry are retained
+        # which is what the catalog-admin rules need
+        table_fragments = []
+        dsl["tables"] = []
+        for spec in value:
+            if validate:
+                validate_entry("table-entry", spec)
+            table_fragments.append(_table_fragment(spec, principals, expressions))
+            if "admin" in spec:
+                dsl["tables"].append({"catalog": spec["catalog"], "admin": spec["admin"]})
+    if validate:
+        # table entries have already been validated one at a time
+        skel = dsl.copy()
+        if "tables" in skel:
+            skel["tables"] = []
+        validate_skeleton(skel)
+    schema_fragments = [_schema_fragment(spec, principals) for spec in dsl["schemas"]]
+    if "include" in dsl:
+        dsl, schema_fragments, table_fragments = merge_includes(
+            dsl, dsl_fname, schema_fragments, table_fragments, validate, cache, included
+        )
+    return _rules_sections(dsl, schema_fragments, table_fragments)
+
+
+def stream_dsl_to_rules(stream, validate=True) -> dict:
+    """Parse a yaml DSL from 'stream' and return its rules structure, as with 'dsl_to_rules'"""
+    return {section: list(rules) for section, rules in stream_dsl_rules_sections(stream, validate=validate)}
+
+
+def load_dsl_rules_sections(dsl_fname: str, validate=True, cache=None, included=None):
+    """
+    Load and compile a yaml or json DSL file, based on its file suffix, together with any
+    files it includes, returning the (section, rules) pairs of the compiled rules.
+    Compiled included files are cached in 'cache', a CompileCache, if it is not None,
+    and their paths are appended to the list 'included' if it is not None.
+    """
+    with open(dsl_fname, "r") as dsl_file:
+        if dsl_fname.endswith(".json"):
+            dsl = json.load(dsl_file)
+            if isinstance(dsl, dict) and ("include" in dsl):
+                return included_rules_sections(dsl, dsl_fname, validate, cache, included)
+            return dsl_rules_sections(dsl, validate=validate)
+        elif dsl_fname.endswith(".yaml"):
+            return stream_dsl_rules_sections(
+                dsl_file, validate=validate, dsl_fname=dsl_fname, cache=cache, included=included
+            )
+        else:
+            raise ValueError(f"Filename {dsl_fname} had unrecognized suffix")
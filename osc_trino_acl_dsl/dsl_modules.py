@@ -0,0 +1,137 @@
+"""
+DSL policies split across files
+
+A DSL may list fragment files under 'include', with paths relative to the including DSL file.
+A fragment may have 'catalogs', 'schemas' and 'tables' lists, which are appended in include order
+to those of the including DSL, so that each team can own a file with its own catalogs, schemas and
+tables. Only the including DSL sets 'admin' and 'public', and fragments do not include other files.
+
+Each fragment is parsed, validated and compiled on its own, and the compiled form of a fragment can
+be cached by a hash of its content, so that editing one fragment only recompiles that fragment,
+followed by merging the compiled fragments, which is cheap.
+"""
+
+import json
+import os
+
+from .dsl2rules import Expressions, PrincipalSets, _rules_sections, _schema_fragment, _table_fragment, yaml_loader
+from .validation import validate_dsl
+
+_fragment_keys = ("catalogs", "schemas", "tables")
+
+
+def include_paths(dsl: dict, dsl_fname: str) -> list:
+    """the paths of the fragment files included by 'dsl', which was loaded from the file 'dsl_fname'"""
+    base = os.path.dirname(dsl_fname)
+    return [os.path.join(base, path) for path in dsl.get("include", [])]
+
+
+def parse_dsl(data: bytes, fname: str):
+    """the DSL, or DSL fragment, in the yaml or json content 'data' of the file 'fname'"""
+    if fname.endswith(".json"):
+        return json.loads(data)
+    elif fname.endswith(".yaml"):
+        import yaml
+
+        return yaml.load(data, Loader=yaml_loader())
+    raise ValueError(f"Filename {fname} had unrecognized suffix")
+
+
+def compile_fragment(fragment: dict, fname: str, validate=True) -> dict:
+    """
+    The compiled form of a DSL fragment: its catalog and schema entries, the catalog and admin list of
+    each of its table entries, and the rule fragments of its schema and table entries. It is json
+    serializable, so that it can be cached.
+    """
+    if validate:
+        validate_dsl(fragment, definition="dsl-fragment")
+    unexpected = sorted(set(fragment.keys()) - set(_fragment_keys))
+    if len(unexpected) > 0:
+        raise ValueError(f"{fname}: a DSL fragment can only have {', '.join(_fragment_keys)}, found {unexpected}")
+    schemas = fragment.get("schemas", [])
+    tables = fragment.get("tables", [])
+    principals = PrincipalSets()
+    expressions = Expressions()
+    return {
+        "catalogs": fragment.get("catalogs", []),
+        "schemas": schemas,
+        # the catalog-admin rules only need the catalog and admin list of table entries
+        "tables": [{"catalog": spec["catalog"], "admin": spec["admin"]} for spec in tables if "admin" in spec],
+        "schema_fragments": [_schema_fragment(spec, principals) for spec in schemas],
+        "table_fragments": [_table_fragment(spec, principals, expressions) for spec in tables],
+    }
+
+
+def read_bytes(fname: str) -> bytes:
+    """the content of the file 'fname', the default way to read included fragments"""
+    with open(fname, "rb") as fragment_file:
+        return fragment_file.read()
+
+
+def load_fragment(fname: str, validate=True, cache=None, read_file=read_bytes) -> dict:
+    """
+    load and compile a DSL fragment file, using 'cache', a CompileCache, if it is not None,
+    and reading its content with 'read_file', which by default reads the named file
+    """
+    data = read_file(fname)
+    # fragments compiled without validation are never cached
+    key = None
+    if (cache is not None) and validate:
+        key = cache.content_key("dsl-fragment" + os.path.splitext(fname)[1], data)
+        cached = cache.get(key)
+        if cached is not None:
+            try:
+                return json.loads(cached)
+            except ValueError:
+                pass
+    compiled = compile_fragment(parse_dsl(data, fname), fname, validate=validate)
+    if key is not None:
+        cache.put(key, json.dumps(compiled))
+    return compiled
+
+
+def merge_includes(
+    dsl: dict,
+    dsl_fname: str,
+    schema_fragments,
+    table_fragments,
+    validate=True,
+    cache=None,
+    included=None,
+    read_file=read_bytes,
+):
+    """
+    Append the entries and rule fragments of each file included by 'dsl' to those of 'dsl' itself, returning
+    the merged (dsl, schema_fragments, table_fragments), which can be passed to '_rules_sections'. Table entries
+    of the merged dsl only have the catalog and admin list needed for the catalog-admin rules.
+    The paths of the included files are appended to the list 'included', if it is not None.
+    """
+    merged = {k: v for k, v in dsl.items() if k != "include"}
+    for k in _fragment_keys:
+        merged[k] = list(dsl[k])
+    schema_fragments = list(schema_fragments)
+    table_fragments = list(table_fragments)
+    for path in include_paths(dsl, dsl_fname):
+        if included is not None:
+            included.append(path)
+        fragment = load_fragment(path, validate=validate, cache=cache, read_file=read_file)
+        for k in _fragment_keys:
+            merged[k].extend(fragment[k])
+        schema_fragments.extend(fragment["schema_fragments"])
+        table_fragments.extend(fragment["table_fragments"])
+    return (merged, schema_fragments, table_fragments)
+
+
+def included_rules_sections(dsl: dict, dsl_fname: str, validate=True, cache=None, included=None, read_file=read_bytes):
+    """
+    the (section, rules) pairs compiled from 'dsl', loaded from the file 'dsl_fname', and the files it includes,
+    which are read with 'read_file'
+    """
+    if validate:
+        validate_dsl(dsl)
+    principals = PrincipalSets()
+    expressions = Expressions()
+    schema_fragments = [_schema_fragment(spec, principals) for spec in dsl["schemas"]]
+    table_fragments = [_table_fragment(spec, principals, expressions) for spec in dsl["tables"]]
+    merged = merge_includes(dsl, dsl_fname, schema_fragments, table_fragments, validate, cache, included, read_file)
+    return _rules_sections(*merged)
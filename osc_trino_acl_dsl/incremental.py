@@ -0,0 +1,111 @@
+"""
+Incremental compilation of the DSL
+
+Every entry of the DSL 'schemas' and 'tables' lists compiles to a rule fragment that depends
+only on that entry. The catalog-admin accumulation and the global default rules are cheap to
+rebuild, so caching the fragments by a fingerprint of their entries means that editing one
+table in a large DSL recompiles (and revalidates) only that table's rules.
+"""
+
+import hashlib
+import json
+
+from .__about__ import __version__
+from .dsl2rules import Expressions, PrincipalSets, _assemble_rules, _rules_revision, _schema_fragment, _table_fragment
+from .validation import validate_dsl, validate_entry
+
+
+def _fingerprint(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _dsl_skeleton(dsl: dict) -> dict:
+    """the dsl with its per-entry lists emptied, for validating only the global structure"""
+    if not isinstance(dsl, dict):
+        return dsl
+    # lists which are missing stay missing, so that validation reports them
+    return {k: ([] if k in ("schemas", "tables") else v) for k, v in dsl.items()}
+
+
+class IncrementalCompiler(object):
+    """
+    Compiles DSL structures to rules.json structures, reusing the rule fragments of
+    any 'schemas' or 'tables' entries unchanged since the previous call to 'compile'.
+    Output is identical to 'dsl_to_rules'. Returned rules share objects with the
+    fragment cache, and so should be treated as read-only.
+
+    >>> compiler = IncrementalCompiler.load(".rules-cache.json")
+    >>> rules = compiler.compile(dsl)
+    >>> compiler.save(".rules-cache.json")
+    """
+
+    def __init__(self):
+        self._schemas: dict = {}
+        self._tables: dict = {}
+        # counts from the most recent compilation
+        self.reused = 0
+        self.compiled = 0
+
+    def _fragments(self, specs: list, cache: dict, compile_entry, definition: str, validate: bool) -> tuple:
+        fragments = []
+        current: dict = {}
+        for spec in specs:
+            fp = _fingerprint(spec)
+            frag = current.get(fp)
+            if frag is None:
+                frag = cache.get(fp)
+            if frag is None:
+                if validate:
+                    validate_entry(definition, spec)
+                frag = compile_entry(spec)
+                self.compiled += 1
+            else:
+                self.reused += 1
+            current[fp] = frag
+            fragments.append(frag)
+        return (fragments, current)
+
+    def compile(self, dsl: dict, validate=True) -> dict:
+        """Transform DSL json structure to trino 'rules.json' structure, see 'dsl_to_rules'"""
+        if validate:
+            # reported like any other DSL validation error, the entries are validated below
+            validate_dsl(_dsl_skeleton(dsl))
+        self.reused = 0
+        self.compiled = 0
+        principals = PrincipalSets()
+        expressions = Expressions()
+        sfrags, self._schemas = self._fragments(
+            dsl["schemas"], self._schemas, lambda spec: _schema_fragment(spec, principals), "schema-entry", validate
+        )
+        tfrags, self._tables = self._fragments(
+            dsl["tables"],
+            self._tables,
+            lambda spec: _table_fragment(spec, principals, expressions),
+            "table-entry",
+            validate,
+        )
+        return _assemble_rules(dsl, sfrags, tfrags)
+
+    def save(self, fname: str):
+        """save the fragments of the most recent compilation"""
+        with open(fname, "w") as cache_file:
+            saved = {"version": __version__, "revision": _rules_revision}
+            saved.update({"schemas": self._schemas, "tables": self._tables})
+            json.dump(saved, cache_file)
+
+    @classmethod
+    def load(cls, fname: str):
+        """
+        load fragments saved by 'save'; an empty compiler is returned if the file
+        does not exist or was saved by a different version of this package, or of its rules
+        """
+        compiler = cls()
+        try:
+            with open(fname, "r") as cache_file:
+                saved = json.load(cache_file)
+        except FileNotFoundError:
+            return compiler
+        if (saved.get("version") == __version__) and (saved.get("revision") == _rules_revision):
+            compiler._schemas = {fp: tuple(frag) for fp, frag in saved["schemas"].items()}
+            compiler._tables = saved["tables"]
+        return compiler
@@ -0,0 +1,176 @@
+"""
+A compiled evaluator for trino 'rules.json' structures
+
+Trino applies file-based access control rules first-match, top to bottom, using
+full regex matching on each of the rule attributes. This module emulates those semantics,
+but precompiles every pattern once and indexes rules by their literal catalog/schema/table
+values, so that a query only examines the rules that can possibly apply to its table.
+"""
+
+import heapq
+import itertools
+import re
+from collections import namedtuple
+
+# the rule attributes that select a database object, in hierarchy order
+_object_keys = ("catalog", "schema", "table")
+
+# bound the per-object candidate cache so audit runs over huge inventories stay bounded
+_max_cached_objects = 100000
+
+Permissions = namedtuple("Permissions", ["allow", "owner", "privileges", "columns", "filter"])
+
+
+# the characters escaped by re.escape, none of which appear in a pattern that is a plain name
+_special_chars = frozenset("()[]{}?*+-|^$\\.&~# \t\n\r\v\f")
+
+
+def is_literal(pattern: str) -> bool:
+    """True if 'pattern' contains no regex syntax, so full matching is plain string equality"""
+    return _special_chars.isdisjoint(pattern)
+
+
+def _compile(pattern: str, patterns: dict):
+    """compile 'pattern', sharing compiled patterns through 'patterns', since generated rules repeat them heavily"""
+    pat = patterns.get(pattern)
+    if pat is None:
+        pat = patterns[pattern] = re.compile(pattern)
+    return pat
+
+
+def object_key(rule: dict) -> tuple:
+    """the rule's literal (catalog, schema, table) attributes, with None for absent or pattern attributes"""
+    key = []
+    for k in _object_keys:
+        pat = rule.get(k)
+        key.append(pat if (pat is not None) and is_literal(pat) else None)
+    return tuple(key)
+
+
+class CompiledRule(object):
+    """A single rules.json rule with all of its patterns precompiled"""
+
+    __slots__ = ("index", "rule", "key", "objpats", "user", "group")
+
+    def __init__(self, index: int, rule: dict, patterns=None):
+        patterns = {} if patterns is None else patterns
+        self.index = index
+        self.rule = rule
+        # literal object attributes are matched by the index, using None as a wildcard
+        # any true patterns are retained here and matched by regex
+        self.key = object_key(rule)
+        self.objpats = tuple(
+            [
+                (j, _compile(rule[k], patterns))
+                for j, k in enumerate(_object_keys)
+                if (k in rule) and (self.key[j] is None)
+            ]
+        )
+        self.user = _compile(rule["user"], patterns) if "user" in rule else None
+        self.group = _compile(rule["group"], patterns) if "group" in rule else None
+
+    def matches_object(self, obj: tuple) -> bool:
+        """obj is a (catalog, schema, table) tuple"""
+        for k, lit in enumerate(self.key):
+            if (lit is not None) and (lit != obj[k]):
+                return False
+        for k, pat in self.objpats:
+            if pat.fullmatch(obj[k]) is None:
+                return False
+        return True
+
+    def matches_principal(self, user: str, groups: tuple) -> bool:
+        if (self.user is not None) and (self.user.fullmatch(user) is None):
+            return False
+        if self.group is not None:
+            for g in groups:
+                if self.group.fullmatch(g) is not None:
+                    return True
+            return False
+        return True
+
+    def matches(self, user: str, groups: tuple, obj: tuple) -> bool:
+        return self.matches_object(obj) and self.matches_principal(user, groups)
+
+
+class RuleSection(object):
+    """
+    An indexed, first-match view over one section ('catalogs', 'schemas' or 'tables') of rules.json
+
+    Rules are bucketed by their tuple of literal object attributes. For any particular
+    object only the buckets matching it (at most eight) can contain applicable rules, and
+    these are merged back into rule order and cached per object.
+    """
+
+    def __init__(self, rules: list):
+        patterns: dict = {}
+        self.rules = [CompiledRule(j, rule, patterns) for j, rule in enumerate(rules)]
+        self._buckets: dict = {}
+        for crule in self.rules:
+            self._buckets.setdefault(crule.key, []).append(crule)
+        self._candidates: dict = {}
+
+    def candidates(self, obj: tuple) -> list:
+        """all rules whose object attributes match 'obj', in rule order"""
+        cands = self._candidates.get(obj)
+        if cands is not None:
+            return cands
+        buckets = []
+        for key in itertools.product(*[(v, None) for v in obj]):
+            b = self._buckets.get(key)
+            if b is not None:
+                buckets.append(b)
+        cands = [r for r in heapq.merge(*buckets, key=lambda r: r.index) if r.matches_object(obj)]
+        if len(self._candidates) >= _max_cached_objects:
+            self._candidates.clear()
+        self._candidates[obj] = cands
+        return cands
+
+    def first_match(self, user: str, groups: tuple, obj: tuple):
+        """returns the first matching CompiledRule, or None if no rule matches"""
+        for crule in self.candidates(obj):
+            if crule.matches_principal(user, groups):
+                return crule
+        return None
+
+
+class RulesEvaluator(object):
+    """
+    Answers access queries against a rules.json structure, for example the output of 'dsl_to_rules'
+
+    >>> ev = RulesEvaluator(dsl_to_rules(dsl))
+    >>> ev.permissions("usera", ["devs"], "dev", "proj1", "table1")
+    Permissions(allow='all', owner=True, privileges=[...], columns=[], filter=None)
+    """
+
+    def __init__(self, rules: dict):
+        self.sections = {k: RuleSection(rules.get(k, [])) for k in ["catalogs", "schemas", "tables"]}
+
+    @classmethod
+    def from_file(cls, path: str, fmt=None):
+        """an evaluator for a rules file in any of the formats written by trino-dsl-to-rules"""
+        from .rules_io import load_rules
+
+        return cls(load_rules(path, fmt=fmt))
+
+    def first_matching_rule(self, section: str, user: str, groups, catalog: str, schema: str, table: str):
+        """returns the first rule dict in 'section' matching the query, or None"""
+        crule = self.sections[section].first_match(user, tuple(groups), (catalog, schema, table))
+        return None if crule is None else crule.rule
+
+    def permissions(self, user: str, groups, catalog: str, schema: str, table: str) -> Permissions:
+        """
+        The effective (allow, owner, privileges, columns, filter) for a user on a table.
+        If no rule matches in some section, trino's deny-by-default values are reported.
+        """
+        groups = tuple(groups)
+        obj = (catalog, schema, table)
+        crule = self.sections["catalogs"].first_match(user, groups, obj)
+        allow = "none" if crule is None else crule.rule["allow"]
+        srule = self.sections["schemas"].first_match(user, groups, obj)
+        owner = False if srule is None else srule.rule["owner"]
+        trule = self.sections["tables"].first_match(user, groups, obj)
+        if trule is None:
+            return Permissions(allow, owner, [], [], None)
+        rule = trule.rule
+        return Permissions(allow, owner, rule["privileges"], rule.get("columns", []), rule.get("filter"))
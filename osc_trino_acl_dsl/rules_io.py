@@ -0,0 +1,198 @@
+"""
+Reading and writing trino 'rules.json' files
+
+Besides the indented json that trino-dsl-to-rules has always written, rules can be written as
+minified json, which trino reads equally well, or in the binary 'pickle' and 'msgpack' formats,
+which are only for tools of this package, for example to reload compiled rules into the evaluator
+without parsing json. orjson is used for minified json whenever it is installed.
+"""
+
+import json
+
+# the output formats, and the file name suffixes that 'load_rules' recognizes for them
+rules_formats = {"json": ".json", "minified": ".json", "pickle": ".pickle", "msgpack": ".msgpack"}
+
+
+def write_rules_json(sections, rules_file):
+    """
+    Incrementally write rules as json, from (section, rules) pairs such as those generated
+    by 'dsl_rules_sections', or from the items() of a rules dict. Only one rule at a time is
+    serialized, and the output is identical to json.dump(rules, rules_file, indent=4)
+    followed by a newline.
+    """
+    rules_file.write("{")
+    sep = "\n"
+    for section, rules in sections:
+        rules_file.write(f"{sep}    {json.dumps(section)}: [")
+        rsep = "\n"
+        for rule in rules:
+            rules_file.write(rsep + "        " + json.dumps(rule, indent=4).replace("\n", "\n        "))
+            rsep = ",\n"
+        # json.dump writes an empty list as []
+        rules_file.write("]" if rsep == "\n" else "\n    ]")
+        sep = ",\n"
+    rules_file.write("}\n" if sep == "\n" else "\n}\n")
+
+
+def canonical_rule(rule: dict) -> str:
+    """
+    A canonical json encoding of one rule: keys are sorted, and the order of the
+    'privileges' list is normalized, since it has no effect on trino's rule semantics
+    """
+    if "privileges" in rule:
+        rule = rule.copy()
+        rule["privileges"] = sorted(rule["privileges"])
+    return json.dumps(rule, sort_keys=True, separators=(",", ":"))
+
+
+def first_rules_difference(expected: dict, actual: dict):
+    """
+    Compares two rules structures in canonical form, returning None if they are equivalent,
+    or else a (section, index) locating the first rule that differs. An index equal to the
+    length of the shorter section means one section is a prefix of the other.
+    """
+    if not isinstance(actual, dict):
+        return ("", 0)
+    for section in sorted(set(expected.keys()) | set(actual.keys())):
+        erules = expected.get(section, [])
+        arules = actual.get(section, [])
+        for j, (erule, arule) in enumerate(zip(erules, arules)):
+            if (not isinstance(arule, dict)) or (canonical_rule(erule) != canonical_rule(arule)):
+                return (section, j)
+        if len(erules) != len(arules):
+            return (section, min(len(erules), len(arules)))
+    return None
+
+
+class _CompareWriter(object):
+    """a write-only file that compares everything written to it against another file's content"""
+
+    def __init__(self, target):
+        self.target = target
+        self.matches = True
+
+    def write(self, s: str):
+        if self.matches and (self.target.read(len(s)) != s):
+            self.matches = False
+
+
+def rules_json_matches(sections, rules_file) -> bool:
+    """
+    True if the content of 'rules_file' is exactly what 'write_rules_json' would write for
+    'sections'. The comparison is streamed, without parsing or loading 'rules_file'.
+    """
+    cmp = _CompareWriter(rules_file)
+    write_rules_json(sections, cmp)
+    return cmp.matches and (rules_file.read(1) == "")
+
+
+def _orjson():
+    try:
+        import orjson
+
+        return orjson
+    except ImportError:
+        return None
+
+
+def encode_rules(rules: dict, fmt: str) -> bytes:
+    """'rules' encoded in any of the 'rules_formats' other than 'json', which is streamed by write_rules_json"""
+    if fmt == "minified":
+        orjson = _orjson()
+        if orjson is not None:
+            return orjson.dumps(rules) + b"\n"
+        # the same utf-8 output as orjson
+        return (json.dumps(rules, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+    if fmt == "pickle":
+        import pickle
+
+        return pickle.dumps(rules, protocol=pickle.HIGHEST_PROTOCOL)
+    if fmt == "msgpack":
+        import msgpack
+
+        return msgpack.packb(rules)
+    raise ValueError(f"unsupported rules format {fmt}")
+
+
+def decode_rules(data: bytes, fmt: str) -> dict:
+    """
+    Rules decoded from any of the 'rules_formats'. Note that decoding the 'pickle' format
+    can run arbitrary code, so it must only be used for files written by trusted tools.
+    """
+    if fmt in ("json", "minified"):
+        orjson = _orjson()
+        return json.loads(data) if orjson is None else orjson.loads(data)
+    if fmt == "pickle":
+        import pickle
+
+        return pickle.loads(data)
+    if fmt == "msgpack":
+        import msgpack
+
+        return msgpack.unpackb(data)
+    raise ValueError(f"unsupported rules format {fmt}")
+
+
+def rules_file_format(path: str) -> str:
+    """the format of a rules file, from its file name suffix, defaulting to json"""
+    for fmt in ("pickle", "msgpack"):
+        if path.endswith(rules_formats[fmt]):
+            return fmt
+    return "json"
+
+
+def load_rules(path: str, fmt=None) -> dict:
+    """load rules from a file in any of the 'rules_formats', by default based on its file name suffix"""
+    with open(path, "rb") as rules_file:
+        return decode_rules(rules_file.read(), rules_file_format(path) if fmt is None else fmt)
+
+
+def _existing_rules_match(rules: dict, path: str, fmt: str, data=None) -> bool:
+    """True if the file 'path' already holds exactly 'rules' in format 'fmt', whose encoding is 'data' unless json"""
+    try:
+        if fmt == "json":
+            with open(path, "r") as rules_file:
+                return rules_json_matches(rules.items(), rules_file)
+        with open(path, "rb") as rules_file:
+            return rules_file.read() == data
+    except Exception:
+        # an unreadable file, in any way, is simply replaced
+        return False
+
+
+def publish_rules(rules: dict, path: str, fmt="json") -> bool:
+    """
+    Write 'rules' in format 'fmt' to the file 'path' atomically, through a temporary file renamed
+    over it, so that readers such as trino coordinators periodically reloading it never see a
+    partial file. Nothing is written if 'path' already holds the same rules in the same format, since
+    rewriting them would only trigger needless reloads. Returns True if the file was written.
+    """
+    import os
+    import tempfile
+
+    # indented json is streamed, in both the comparison and the writing, rather than encoded at once
+    data = None if fmt == "json" else encode_rules(rules, fmt)
+    if _existing_rules_match(rules, path, fmt, data):
+        return False
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        # as for a newly created file
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".rules-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w" if fmt == "json" else "wb") as rules_file:
+            if fmt == "json":
+                write_rules_json(rules.items(), rules_file)
+            else:
+                rules_file.write(data)
+            rules_file.flush()
+            os.fsync(rules_file.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return True
@@ -0,0 +1,129 @@
+"""
+An optional optimization pass over generated rules
+
+Trino evaluates each section of rules.json first-match, top to bottom, so shorter rule lists
+are cheaper to evaluate. This pass removes rules that can never match because an earlier rule
+always matches first, and merges runs of adjacent rules that have identical bodies and differ
+in a single pattern into one rule whose pattern is the alternation of theirs. Both transforms
+preserve first-match semantics, and 'check_equivalence' compares the effective permissions of
+two rule sets to confirm it.
+"""
+
+import itertools
+import re
+
+from .rules_eval import object_key
+from .rules_sampling import literal_alternatives
+
+# rule attributes that select which requests a rule applies to
+_match_keys = ("user", "group", "catalog", "schema", "table")
+
+
+def _match_part(rule: dict) -> dict:
+    return {k: v for k, v in rule.items() if k in _match_keys}
+
+
+def _body(rule: dict) -> dict:
+    return {k: v for k, v in rule.items() if k not in _match_keys}
+
+
+def _pattern_covers(a: str, b: str) -> bool:
+    """True if every string fully matching pattern b also fully matches pattern a"""
+    if (a == b) or (a == ".*"):
+        return True
+    alts = literal_alternatives(b)
+    return (alts is not None) and all([re.fullmatch(a, alt) is not None for alt in alts])
+
+
+def _subsumes(a: dict, b: dict) -> bool:
+    """
+    True if rule 'a' matches every request that rule 'b' matches. This is conservative:
+    a False result only means subsumption could not be established.
+    """
+    for k in _match_keys:
+        if k not in a:
+            continue
+        if (k not in b) or not _pattern_covers(a[k], b[k]):
+            return False
+    return True
+
+
+def _remove_shadowed(rules: list) -> list:
+    """remove rules that are subsumed by some earlier rule, so can never be the first match"""
+    kept: list = []
+    # earlier rules are indexed by their literal object attributes, as in the evaluator,
+    # so each rule is only compared against the earlier rules that could subsume it
+    buckets: dict = {}
+    for rule in rules:
+        key = object_key(rule)
+        shadowed = False
+        for k in itertools.product(*[((v, None) if v is not None else (None,)) for v in key]):
+            if any([_subsumes(e, rule) for e in buckets.get(k, [])]):
+                shadowed = True
+                break
+        if not shadowed:
+            kept.append(rule)
+            buckets.setdefault(key, []).append(rule)
+    return kept
+
+
+def _mergeable_key(a: dict, b: dict):
+    """the single match attribute in which 'a' and 'b' differ, if they can be merged"""
+    if _body(a) != _body(b):
+        return None
+    ma = _match_part(a)
+    mb = _match_part(b)
+    if set(ma.keys()) != set(mb.keys()):
+        return None
+    diff = [k for k in ma if ma[k] != mb[k]]
+    return diff[0] if len(diff) == 1 else None
+
+
+def _merge_adjacent(rules: list) -> list:
+    """merge runs of adjacent rules which differ only in one pattern into an alternation"""
+    merged: list = []
+    for rule in rules:
+        if len(merged) > 0:
+            k = _mergeable_key(merged[-1], rule)
+            if k is not None:
+                prev = merged[-1].copy()
+                # a top level alternation fully matches iff any alternative fully matches
+                prev[k] = f"{prev[k]}|{rule[k]}"
+                merged[-1] = prev
+                continue
+        merged.append(rule)
+    return merged
+
+
+def optimize_rules(rules: dict) -> tuple:
+    """
+    Returns (optimized rules, report), where report maps each section
+    to its (original, optimized) number of rules
+    """
+    optimized = {}
+    report = {}
+    for section, srules in rules.items():
+        orules = _merge_adjacent(_remove_shadowed(srules))
+        optimized[section] = orules
+        report[section] = (len(srules), len(orules))
+    return (optimized, report)
+
+
+def check_equivalence(rules_a: dict, rules_b: dict):
+    """
+    Compare the effective permissions of two rule sets, returning None if they agree, or else
+    a ((user, groups), (catalog, schema, table)) request on which they differ.
+
+    Requests are sampled from both rule sets as by 'trino-acl-diff': the literal names of
+    alternations, witness names for other patterns, a sentinel name that matches only broad
+    patterns, and principals in a changed rule's group and another group. Raises ValueError
+    if a rule that differs between the two has patterns for which no names can be sampled.
+    """
+    from .acl_diff import rules_diff, unanalyzable_changes
+
+    unanalyzable = unanalyzable_changes(rules_a, rules_b)
+    if len(unanalyzable) > 0:
+        section, rule = unanalyzable[0]
+        raise ValueError(f"cannot compare rules with patterns that cannot be sampled, like {section} rule {rule}")
+    changes = rules_diff(rules_a, rules_b)
+    return None if len(changes) == 0 else (changes[0].principal, changes[0].table)
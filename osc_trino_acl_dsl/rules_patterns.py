@@ -0,0 +1,301 @@
+"""
+Analysis of the regex patterns in generated rules
+
+The DSL compiler joins user and group names into alternations like 'a|b|c', and trino
+compiles and full-matches these patterns on every access check, against every rule it scans.
+This module compiles every pattern of a rule set and reports problems: patterns that fail to
+compile, nested quantifiers that risk catastrophic backtracking, and rules that match every
+request before the end of their section, so that every later rule is unreachable. It can also
+time full matching of each rule's patterns, and rewrite alternations of literal names into
+trie-factored form, for example 'dev_a|dev_b|data' into 'd(?:ata|ev_[ab])', which matches the
+same names while testing each shared prefix only once.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+from .dsl2rules import Expressions, PrincipalSets, principal_sets, table_expressions
+from .dsl_modules import include_paths, parse_dsl
+from .rules_sampling import literal_alternatives
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    # python < 3.11
+    import sre_parse as _sre_parse
+
+# rule attributes holding patterns, in the order they are reported
+_pattern_keys = ("user", "group", "catalog", "schema", "table")
+
+# rule attributes whose literal alternations are factored by default
+_factor_keys = ("user", "group")
+
+# a name that no generated pattern is expected to match, used to time failed matches
+_sentinel = "zz_unmatched_zz"
+
+_repeat_ops = (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT)
+
+PatternIssue = namedtuple("PatternIssue", ["section", "index", "key", "pattern", "issue", "message"])
+
+RuleCost = namedtuple("RuleCost", ["section", "index", "ns", "factored_ns"])
+
+
+def _children(op, av) -> list:
+    """the sub-patterns of one node of a parsed pattern"""
+    if op in _repeat_ops:
+        return [av[2]]
+    if op == _sre_parse.SUBPATTERN:
+        return [av[-1]]
+    if op == _sre_parse.BRANCH:
+        return av[1]
+    if op in (_sre_parse.ASSERT, _sre_parse.ASSERT_NOT):
+        return [av[1]]
+    # atomic groups and possessive repeats (python >= 3.11) never backtrack into their body
+    return []
+
+
+def _has_repeat(parsed) -> bool:
+    """true if 'parsed' contains a backtracking repeat of more than one item"""
+    for op, av in parsed:
+        if (op in _repeat_ops) and (av[1] > 1):
+            return True
+        if any([_has_repeat(child) for child in _children(op, av)]):
+            return True
+    return False
+
+
+def _nested_quantifier(parsed) -> bool:
+    """true if 'parsed' repeats a sub-pattern that itself contains a repeat, like (a+)* or (a|b*)+"""
+    for op, av in parsed:
+        if (op in _repeat_ops) and (av[1] > 1) and _has_repeat(av[2]):
+            return True
+        if any([_nested_quantifier(child) for child in _children(op, av)]):
+            return True
+    return False
+
+
+def _matches_anything(pattern: str) -> bool:
+    return pattern in (".*", "(.*)", "(?:.*)")
+
+
+def pattern_issue(pattern: str):
+    """an (issue, message) pair for a single pattern, or None if nothing is wrong with it"""
+    try:
+        parsed = _sre_parse.parse(pattern)
+        re.compile(pattern)
+    except re.error as e:
+        return ("invalid", f"does not compile: {e}")
+    if _nested_quantifier(parsed):
+        return ("backtracking", "nested quantifiers risk catastrophic backtracking on non-matching names")
+    return None
+
+
+def analyze_patterns(rules: dict) -> list:
+    """
+    A list of PatternIssue for the patterns of 'rules'. Each distinct pattern is compiled once.
+    A rule whose patterns all match anything is reported if any rule follows it in its section,
+    since trino never reaches those rules.
+    """
+    issues = []
+    checked: dict = {}
+    for section, srules in rules.items():
+        for j, rule in enumerate(srules):
+            for k in _pattern_keys:
+                if k not in rule:
+                    continue
+                pattern = rule[k]
+                if pattern not in checked:
+                    checked[pattern] = pattern_issue(pattern)
+                if checked[pattern] is not None:
+                    issues.append(PatternIssue(section, j, k, pattern, *checked[pattern]))
+            if (j < len(srules) - 1) and all([_matches_anything(rule[k]) for k in _pattern_keys if k in rule]):
+                message = f"matches every request, so the {len(srules) - j - 1} rule(s) after it are never used"
+                issues.append(PatternIssue(section, j, None, None, "broad", message))
+    return issues
+
+
+def _trie_regex(trie: dict) -> str:
+    """the regex matching exactly the names stored in 'trie', where the key '' marks the end of a name"""
+    alts = []
+    for ch in sorted([k for k in trie if k != ""]):
+        run = ch
+        child = trie[ch]
+        # chains of single children are a literal run
+        while (len(child) == 1) and ("" not in child):
+            ((c, child),) = child.items()
+            run += c
+        alts.append(run + _trie_regex(child))
+    if len(alts) == 0:
+        return ""
+    if all([len(alt) == 1 for alt in alts]) and (len(alts) > 1):
+        body = "[" + "".join(alts) + "]"
+    elif len(alts) == 1:
+        body = alts[0]
+    else:
+        body = "(?:" + "|".join(alts) + ")"
+    if "" not in trie:
+        return body
+    # a name ending here is a prefix of the others
+    if (len(alts) == 1) and (len(body) > 1):
+        body = f"(?:{body})"
+    return body + "?"
+
+
+def factor_pattern(pattern: str) -> str:
+    """
+    The trie-factored form of an alternation of literal names, which full-matches exactly the
+    same strings. Any other pattern is returned unchanged.
+    """
+    names = literal_alternatives(pattern)
+    if (names is None) or (len(names) < 2) or ("" in names):
+        return pattern
+    trie: dict = {}
+    for name in names:
+        node = trie
+        for ch in name:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    alts = []
+    for ch in sorted(trie.keys()):
+        alts.append(_trie_regex({ch: trie[ch]}))
+    # the top level alternation needs no group, since the whole pattern is full-matched
+    return "|".join(alts)
+
+
+def factor_rules(rules: dict, keys=_factor_keys) -> dict:
+    """a copy of 'rules' with the literal alternations of the 'keys' attributes trie-factored"""
+    factored: dict = {}
+    result = {}
+    for section, srules in rules.items():
+        frules = []
+        for rule in srules:
+            rule = rule.copy()
+            for k in keys:
+                if k in rule:
+                    if rule[k] not in factored:
+                        factored[rule[k]] = factor_pattern(rule[k])
+                    rule[k] = factored[rule[k]]
+            frules.append(rule)
+        result[section] = frules
+    return result
+
+
+def _samples(pattern: str) -> list:
+    """names to time a pattern against: a few it matches, if it is an alternation, and one it does not"""
+    names = literal_alternatives(pattern) or []
+    picked = [names[j] for j in sorted(set([0, len(names) // 2, len(names) - 1]))] if len(names) > 0 else []
+    return picked + [_sentinel]
+
+
+def _match_ns(pattern: str, samples: list, number: int) -> float:
+    """the mean time, in nanoseconds, to full-match 'pattern' against one of 'samples'"""
+    fullmatch = re.compile(pattern).fullmatch
+    start = time.perf_counter_ns()
+    for _ in range(number):
+        for name in samples:
+            fullmatch(name)
+    return (time.perf_counter_ns() - start) / (number * len(samples))
+
+
+def rule_costs(rules: dict, number=200) -> list:
+    """
+    A list of RuleCost, the time in nanoseconds to full-match all of the patterns of each rule,
+    and the same for their trie-factored form, sorted from the most expensive rule. Literal
+    names are timed too, since trino matches them as patterns. Each distinct pattern is timed
+    once, over 'number' rounds of its samples.
+    """
+    costs: dict = {}
+
+    def cost(pattern: str) -> tuple:
+        if pattern not in costs:
+            if pattern_issue(pattern) is not None:
+                # issues like invalid patterns are reported by analyze_patterns, rather than timed
+                costs[pattern] = (0.0, 0.0)
+                return costs[pattern]
+            samples = _samples(pattern)
+            ns = _match_ns(pattern, samples, number)
+            factored = factor_pattern(pattern)
+            costs[pattern] = (ns, ns if factored == pattern else _match_ns(factored, samples, number))
+        return costs[pattern]
+
+    result = []
+    for section, srules in rules.items():
+        for j, rule in enumerate(srules):
+            pcosts = [cost(rule[k]) for k in _pattern_keys if k in rule]
+            result.append(RuleCost(section, j, sum([c[0] for c in pcosts]), sum([c[1] for c in pcosts])))
+    return sorted(result, key=lambda c: -c.ns)
+
+
+def _load(fname: str) -> dict:
+    with open(fname, "rb") as dsl_file:
+        return parse_dsl(dsl_file.read(), fname)
+
+
+def _dsl_files(dslpath: str):
+    """the DSL of the file 'dslpath', then that of each fragment file it includes"""
+    dsl = _load(dslpath)
+    yield dsl
+    for path in include_paths(dsl, dslpath):
+        yield _load(path)
+
+
+def dsl_principal_sets(dslpath: str):
+    """the principal_sets of the DSL file 'dslpath' and every fragment file it includes"""
+    registry = PrincipalSets()
+    for dsl in _dsl_files(dslpath):
+        principal_sets(dsl, registry)
+    return registry
+
+
+def dsl_expressions(dslpath: str):
+    """the table_expressions of the DSL file 'dslpath' and every fragment file it includes"""
+    registry = Expressions()
+    for dsl in _dsl_files(dslpath):
+        table_expressions(dsl, registry)
+    return registry
+
+
+def main():
+    from .dsl_loader import load_dsl_rules_sections
+
+    parser = argparse.ArgumentParser(description="report problems and match costs of the patterns in generated rules")
+    parser.add_argument("dsl", metavar="DSL_FILE", help="trino acl DSL file (yaml or json)")
+    parser.add_argument("--top", type=int, default=10, help="number of most expensive rules to report")
+    parser.add_argument("--number", type=int, default=200, help="rounds of matches timed for each pattern")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="output format")
+    args = parser.parse_args(sys.argv[1:])
+
+    rules = {section: list(rules) for section, rules in load_dsl_rules_sections(args.dsl, validate=True)}
+    issues = analyze_patterns(rules)
+    costs = rule_costs(rules, number=args.number)[: args.top]
+    principals = dsl_principal_sets(args.dsl)
+    expressions = dsl_expressions(args.dsl).stats()
+
+    if args.format == "json":
+        report = {"issues": [i._asdict() for i in issues], "costs": [c._asdict() for c in costs]}
+        report.update({"principal_lists": principals.lists, "principal_sets": len(principals)})
+        report.update(expressions)
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+    else:
+        print(f"{parser.prog}: {principals.lists} principal lists, {len(principals)} distinct principal sets")
+        e = expressions
+        print(
+            f"{parser.prog}: {e['column_masks']} column masks, {e['distinct_column_masks']} distinct, "
+            f"{e['filters']} row filters, {e['distinct_filters']} distinct, {e['shared_bytes']} bytes of json shared"
+        )
+        for i in issues:
+            where = f"{i.section}[{i.index}]" + ("" if i.key is None else f" {i.key} '{i.pattern}'")
+            print(f"{parser.prog}: {i.issue}: {where} {i.message}")
+        for c in costs:
+            print(f"{c.section}[{c.index}]: {c.ns:.0f}ns per match, {c.factored_ns:.0f}ns trie-factored")
+    if any([i.issue in ("invalid", "backtracking") for i in issues]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
-import argparse
-import json
 import os
 import sys
-
-import yaml  # via pyyaml module
+import time
 
 from .__about__ import __version__
-from .dsl2rules import dsl_to_rules
+from .timings import PhaseTimings, _tracemalloc, add_profiling_arguments, no_timings, profiling
+
+# the hook runs on every commit, mostly with nothing to check, so the modules that
+# compile and compare rules are only imported once some DSL/rules pair needs checking
 
 _out_of_sync_message = """
 {prog}: {jsonfile} out of sync with {dslfile}
@@ -34,31 +34,176 @@ see: https://pre-commit.com/#config-exclude
 """
 
 
-def check_dsl_rules_consistency(dslpath, rulespath, prog):
-    try:
-        with open(dslpath, "r") as dsl_file:
-            dsl = yaml.safe_load(dsl_file)
+def _compile_dsl(dslpath: str, timings, cache=None, included=None) -> dict:
+    """the rules compiled from 'dslpath', appending the paths of any files it includes to 'included'"""
+    from .dsl2rules import _load_timed, dsl_to_rules
+    from .dsl_loader import load_dsl_rules_sections
+    from .dsl_modules import included_rules_sections
+
+    if timings is no_timings:
+        sections = load_dsl_rules_sections(dslpath, validate=True, cache=cache, included=included)
+        return {section: list(rules) for section, rules in sections}
+    # phases are run one after another, rather than streamed, so they can be measured separately
+    dsl = _load_timed(dslpath, timings)
+    if isinstance(dsl, dict) and ("include" in dsl):
+        with timings.phase("includes"):
+            sections = included_rules_sections(dsl, dslpath, True, cache, included)
+            return {section: list(rules) for section, rules in sections}
+    return dsl_to_rules(dsl, validate=True, timings=timings)
+
+
+def _verified_entry(rules_digest: str, included: list) -> str:
+    """a cache entry recording a verified rules.json digest, and the digest of each file the DSL included"""
+    from .compile_cache import file_digest
+
+    return "\n".join([rules_digest] + [f"{file_digest(path)} {os.path.abspath(path)}" for path in included])
+
+
+def _is_verified(entry, rules_digest: str) -> bool:
+    """true if cache 'entry' verified 'rules_digest', and no file included by the DSL has changed since"""
+    from .compile_cache import file_digest
+
+    if entry is None:
+        return False
+    lines = entry.split("\n")
+    if lines[0] != rules_digest:
+        return False
+    for line in lines[1:]:
+        digest, path = line.split(" ", 1)
+        try:
+            if file_digest(path) != digest:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _check_consistency(dslpath, rulespath, prog, cache, timings) -> tuple:
+    """returns (passed, messages)"""
+    from .compile_cache import file_digest
+    from .rules_io import first_rules_difference, load_rules, rules_json_matches
+
+    if cache is not None:
+        # if this exact pair was already verified, there is nothing more to check
+        with timings.phase("cache lookup"):
+            key = cache.key(dslpath)
+            rules_digest = file_digest(rulespath)
+            verified = _is_verified(cache.get(key), rules_digest)
+        if verified:
+            return (True, [f"{prog}: {rulespath} previously verified against {dslpath}"])
+    included: list = []
+    dslrules = _compile_dsl(dslpath, timings, cache=cache, included=included)
+    # rules.json is normally exactly what trino-dsl-to-rules wrote, which can be
+    # checked without parsing it. Otherwise, compare the rules in canonical form.
+    with timings.phase("compare"):
         with open(rulespath, "r") as json_file:
-            jsonrules = json.load(json_file)
-        dslrules = dsl_to_rules(dsl, validate=True)
-        if not (jsonrules == dslrules):
-            print(_out_of_sync_message.format(prog=prog, jsonfile=rulespath, dslfile=dslpath, version=__version__))
-            sys.exit(1)
+            matches = rules_json_matches(dslrules.items(), json_file)
+        if not matches:
+            diff = first_rules_difference(dslrules, load_rules(rulespath, fmt="json"))
+            if diff is not None:
+                return (
+                    False,
+                    [
+                        _out_of_sync_message.format(
+                            prog=prog, jsonfile=rulespath, dslfile=dslpath, version=__version__
+                        ),
+                        f"{prog}: first differing rule is {diff[0]}[{diff[1]}]",
+                    ],
+                )
+    if cache is not None:
+        cache.put(key, _verified_entry(rules_digest, included))
+    return (True, [])
+
+
+def _check_pair(dslpath, rulespath, prog, cache=None, timings=False) -> tuple:
+    """
+    Check one DSL/rules.json pair, returning (passed, report, seconds), where report is
+    the text to print for this pair. Runs in pool workers, so it neither prints nor exits.
+    If 'timings' is true, the report includes the time and allocations of each phase.
+    """
+    start = time.perf_counter()
+    ptimings = PhaseTimings(trace_memory=True) if timings else no_timings
+    try:
+        with profiling(trace_memory=timings and not _tracemalloc().is_tracing()):
+            passed, report = _check_consistency(dslpath, rulespath, prog, cache, ptimings)
     except Exception as e:
         # any exception is a test failure
-        print(f"{prog}: commit check failed with exception {type(e)}:\n{e}")
+        report = [f"{prog}: commit check failed with exception {type(e)}:\n{e}"]
+        passed = False
+    if timings:
+        report.append(ptimings.report(prefix=f"{prog}: "))
+    return (passed, "\n".join(report), time.perf_counter() - start)
+
+
+def check_dsl_rules_consistency(dslpath, rulespath, prog, cache=None):
+    passed, report, _ = _check_pair(dslpath, rulespath, prog, cache=cache)
+    if len(report) > 0:
+        print(report)
+    if not passed:
         sys.exit(1)
 
 
+def _check_pairs(pairs: list, prog: str, cache, jobs: int, timings=False) -> list:
+    """check all (dslpath, rulespath) pairs, concurrently if jobs > 1, returning results in order"""
+    args = [(dslpath, rulespath, prog, cache, timings) for dslpath, rulespath in pairs]
+    if (jobs > 1) and (len(pairs) > 1):
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pairs))) as pool:
+            return list(pool.map(_check_pair, *zip(*args)))
+    return [_check_pair(*a) for a in args]
+
+
 def main():
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "paths", metavar="CHECK_FILES", nargs="*", help="files to check, normally files staged for git commit"
     )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="always recompile, ignoring previously verified DSL/rules pairs"
+    )
+    parser.add_argument("--cache-dir", default=None, help="directory for previously verified DSL/rules pairs")
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of DSL/rules pairs to check concurrently (default: number of cpus)",
+    )
+    add_profiling_arguments(parser)
 
     # parse command line args
     args = parser.parse_args(sys.argv[1:])  # argv[0] is command
+    with profiling(args.profile, tracemalloc_file=args.tracemalloc):
+        _check_files(parser.prog, args)
+
 
+def _including_dsl(fragpath: str):
+    """
+    The path of a 'trino-acl-dsl.yaml' in the directory of 'fragpath', or one of its parent
+    directories, that includes the DSL fragment 'fragpath', or None if there is none.
+    """
+    from .dsl2rules import load_dsl_file
+    from .dsl_modules import include_paths
+
+    target = os.path.abspath(fragpath)
+    dname = os.path.dirname(target)
+    while True:
+        dslpath = os.path.join(dname, "trino-acl-dsl.yaml")
+        if os.path.isfile(dslpath) and (dslpath != target):
+            dsl = load_dsl_file(dslpath)
+            paths = include_paths(dsl, dslpath) if isinstance(dsl, dict) else []
+            if target in [os.path.normpath(path) for path in paths]:
+                # staged paths are relative to the repository root, and so is the DSL
+                return dslpath if os.path.isabs(fragpath) else os.path.relpath(dslpath)
+        if os.path.dirname(dname) == dname:
+            return None
+        dname = os.path.dirname(dname)
+
+
+def _check_files(prog, args):  # noqa: C901
     # I am assuming the `files` attribute in .pre-commit-hooks.yaml
     # (or override in  .pre-commit-config.yaml) is properly set to
     # pass only the expected DSL and rules.json files.
@@ -75,23 +220,29 @@ def main():
     # and each matches exactly one pair in your repo
 
     # useful diagnostic, in the event of a check failure
-    print("{prog}: staged DSL files:\n{flist}\n".format(prog=parser.prog, flist="\n".join(dsl_yaml)))
-    print("{prog}: staged rule files:\n{flist}\n".format(prog=parser.prog, flist="\n".join(unchecked_rules_json)))
+    print("{prog}: staged DSL files:\n{flist}\n".format(prog=prog, flist="\n".join(dsl_yaml)))
+    print("{prog}: staged rule files:\n{flist}\n".format(prog=prog, flist="\n".join(unchecked_rules_json)))
 
+    # failures are collected, so that every broken pair is reported in one run
+    failures = []
+    pairs = []
     for dslpath in dsl_yaml:
-        print(f"{parser.prog}: checking {dslpath}")
         dname, fname = os.path.split(dslpath)
         rulespath = os.path.join(dname, "rules.json")
+        if not os.path.isfile(rulespath):
+            # a DSL fragment is checked by checking the DSL that includes it
+            dslpath = _including_dsl(dslpath) or dslpath
+            rulespath = os.path.join(os.path.dirname(dslpath), "rules.json")
         if not os.path.isfile(rulespath):
             # I expect a rules.json file for any file that matches the pattern
-            print(f"{parser.prog}: did not find expected file {rulespath}")
-            sys.exit(1)
-        print(f"{parser.prog}: checking consistency with {rulespath}")
-        check_dsl_rules_consistency(dslpath, rulespath, parser.prog)
-        # all checks passed for current file
-        print(f"{parser.prog}: check succeeded for {dslpath}")
-        # we validated a DSL -> rules.json pair, so I can check-off the rules file
-        unchecked_rules_json.remove(rulespath)
+            print(f"{prog}: did not find expected file {rulespath}")
+            failures.append(dslpath)
+            continue
+        if (dslpath, rulespath) in pairs:
+            continue
+        pairs.append((dslpath, rulespath))
+        # this DSL -> rules.json pair will be validated, so I can check-off the rules file
+        unchecked_rules_json.discard(rulespath)
 
     # If there are any remaining unchecked rules.json files,
     # there are multiple possibilites:
@@ -107,31 +258,50 @@ def main():
     # this check assumes a companion DSL file named "trino-acl-dsl.yaml"
     # I am not currently sure if there are better possible policies besides
     # making this assumption, or even if better policies are really necessary.
-    tmprules = list(unchecked_rules_json)
-    for rulespath in tmprules:
-        print(f"{parser.prog}: checking rules file {rulespath}")
+    for rulespath in sorted(unchecked_rules_json):
         dname, fname = os.path.split(rulespath)
         dslpath = os.path.join(dname, "trino-acl-dsl.yaml")
         if not os.path.isfile(dslpath):
             # I have not so far made the file name "trino-acl-dsl.yaml" an official assumption
             # I'm not going to treat this as a check failure
-            print(f"{parser.prog}: did not find {dslpath}, skipping")
+            print(f"{prog}: did not find {dslpath}, skipping")
         else:
-            check_dsl_rules_consistency(dslpath, rulespath, parser.prog)
-            print(f"{parser.prog}: check succeeded for {dslpath}")
-            unchecked_rules_json.remove(rulespath)
+            pairs.append((dslpath, rulespath))
+            unchecked_rules_json.discard(rulespath)
+
+    cache = None
+    if (len(pairs) > 0) and not args.no_cache:
+        from .compile_cache import CompileCache
+
+        cache = CompileCache(cache_dir=args.cache_dir)
+
+    results = _check_pairs(pairs, prog, cache, args.jobs, timings=args.timings)
+    for (dslpath, rulespath), (passed, report, seconds) in zip(pairs, results):
+        print(f"{prog}: checking consistency of {dslpath} with {rulespath}")
+        if len(report) > 0:
+            print(report)
+        status = "succeeded" if passed else "FAILED"
+        print(f"{prog}: check {status} for {dslpath} ({seconds:.3f}s)")
+        if not passed:
+            failures.append(dslpath)
+
+    if len(failures) > 0:
+        print("{prog}: checks failed for:\n{flist}\n".format(prog=prog, flist="\n".join(failures)))
 
     if len(unchecked_rules_json) > 0:
         # any remaining rules files are a potential error so fail the check
         print(
             _unchecked_rules_message.format(
-                prog=parser.prog, flist="\n".join(unchecked_rules_json), version=__version__
+                prog=prog, flist="\n".join(sorted(unchecked_rules_json)), version=__version__
             )
         )
         sys.exit(1)
 
+    if len(failures) > 0:
+        sys.exit(1)
+
     # all checks passed for any matching files, exit with 'success'
-    print(f"{parser.prog}: all files passed")
+    print(f"{prog}: all files passed")
     sys.exit(0)
 
 
@@ -0,0 +1,163 @@
+"""
+Workload-driven reordering of generated rules
+
+Trino scans each section of rules.json from the top until the first matching rule, while
+'dsl_to_rules' orders rules by their position in the DSL. Replaying a log of accesses against
+the rules measures how deep each access scans, and which rules are hit how often.
+
+Rules can be moved past each other without changing any access decision when no request can
+match both. Within a run of consecutive rules which all have literal values for the same object
+attributes, for example the table-specific rules for many distinct tables, rules with different
+literal values never overlap. Such a run is split into groups of rules with equal literal values,
+whose order is kept, and the groups are sorted so the most frequently hit come first.
+"""
+
+import argparse
+import csv
+import sys
+from collections import namedtuple
+
+from .rules_eval import RuleSection, object_key
+
+_sections = ("catalogs", "schemas", "tables")
+
+Access = namedtuple("Access", ["user", "groups", "table"])
+
+SectionReplay = namedtuple("SectionReplay", ["accesses", "mean_depth", "hits", "unmatched"])
+
+
+def load_workload(fname: str) -> list:
+    """
+    A list of Access from a csv file with user, groups, catalog, schema and table columns, where
+    groups are separated by ';', as in the csv written by trino-acl-matrix. Other columns are ignored.
+    """
+    accesses = []
+    with open(fname, "r", newline="") as workload_file:
+        for row in csv.DictReader(workload_file):
+            groups = tuple([g for g in (row.get("groups") or "").split(";") if len(g) > 0])
+            accesses.append(Access(row["user"], groups, (row["catalog"], row["schema"], row["table"])))
+    return accesses
+
+
+def replay(rules: dict, accesses: list) -> dict:
+    """
+    Replay 'accesses' against each section of 'rules', returning a SectionReplay per section:
+    the number of accesses, the mean number of rules trino scans to decide each access, the
+    number of first-match hits of each rule by index, and the number of accesses matching no rule.
+    """
+    report = {}
+    for section in _sections:
+        srules = rules.get(section, [])
+        indexed = RuleSection(srules)
+        hits = [0] * len(srules)
+        unmatched = 0
+        scanned = 0
+        for access in accesses:
+            crule = indexed.first_match(access.user, access.groups, access.table)
+            if crule is None:
+                unmatched += 1
+                scanned += len(srules)
+            else:
+                hits[crule.index] += 1
+                scanned += crule.index + 1
+        mean_depth = scanned / len(accesses) if len(accesses) > 0 else 0.0
+        report[section] = SectionReplay(len(accesses), mean_depth, hits, unmatched)
+    return report
+
+
+def _shape(key: tuple) -> tuple:
+    """which object attributes of a rule are literal"""
+    return tuple([v is not None for v in key])
+
+
+def _runs(srules: list) -> list:
+    """split rules into maximal runs of consecutive rules with the same literal attributes, as (start, end)"""
+    runs = []
+    start = 0
+    for j in range(1, len(srules) + 1):
+        if (j == len(srules)) or (_shape(object_key(srules[j])) != _shape(object_key(srules[start]))):
+            runs.append((start, j))
+            start = j
+    return runs
+
+
+def reorder_section(srules: list, hits: list) -> list:
+    """
+    The rules of one section reordered by 'hits', the hit count of each rule by index, moving only
+    rules which no single request can match together, so every access decision is unchanged
+    """
+    reordered = []
+    for start, end in _runs(srules):
+        if not any(_shape(object_key(srules[start]))):
+            # rules without literal object attributes may overlap anything, so they stay in place
+            reordered.extend(srules[start:end])
+            continue
+        groups: dict = {}
+        for j in range(start, end):
+            groups.setdefault(object_key(srules[j]), []).append(j)
+        # sorting is stable, so groups with equal hits keep their order
+        ordered = sorted(groups.values(), key=lambda g: -sum([hits[j] for j in g]))
+        reordered.extend([srules[j] for g in ordered for j in g])
+    return reordered
+
+
+def reorder_rules(rules: dict, accesses: list) -> dict:
+    """'rules' with each section reordered by the hits of 'accesses', see reorder_section"""
+    report = replay(rules, accesses)
+    return {section: reorder_section(srules, report[section].hits) for section, srules in rules.items()}
+
+
+def _decisions(rules: dict, accesses: list) -> list:
+    sections = [RuleSection(rules.get(section, [])) for section in _sections]
+    decisions = []
+    for access in accesses:
+        for indexed in sections:
+            crule = indexed.first_match(access.user, access.groups, access.table)
+            decisions.append(None if crule is None else crule.rule)
+    return decisions
+
+
+def same_decisions(rules_a: dict, rules_b: dict, accesses: list) -> bool:
+    """true if every access is decided by an equal rule in every section of both rule sets"""
+    return _decisions(rules_a, accesses) == _decisions(rules_b, accesses)
+
+
+def main():
+    from .dsl_loader import load_dsl_rules_sections
+    from .rules_io import publish_rules
+
+    parser = argparse.ArgumentParser(description="replay a workload against DSL rules, and reorder them by hits")
+    parser.add_argument("dsl", metavar="DSL_FILE", help="trino acl DSL file (yaml or json)")
+    parser.add_argument("--workload", required=True, help="csv of accesses, with user, groups, catalog, schema, table")
+    parser.add_argument("--output", "-o", default=None, help="write the reordered rules to this file")
+    parser.add_argument("--top", type=int, default=10, help="number of most scanned rules to report per section")
+    args = parser.parse_args(sys.argv[1:])
+
+    rules = {section: list(rules) for section, rules in load_dsl_rules_sections(args.dsl, validate=True)}
+    accesses = load_workload(args.workload)
+    before = replay(rules, accesses)
+    reordered = reorder_rules(rules, accesses)
+    # reordering only moves rules that cannot overlap, but the decisions are checked anyway
+    if not same_decisions(rules, reordered, accesses):
+        print(f"{parser.prog}: reordered rules change access decisions, not writing them", file=sys.stderr)
+        sys.exit(1)
+    after = replay(reordered, accesses)
+
+    for section in _sections:
+        b, a = before[section], after[section]
+        print(f"{section}: {b.accesses} accesses, mean scan depth {b.mean_depth:.1f} -> {a.mean_depth:.1f} rules")
+        if b.unmatched > 0:
+            print(f"    {b.unmatched} accesses match no rule")
+        # the rules costing the most scanning: each hit scans every rule up to and including it
+        cost = sorted([(h * (j + 1), j) for j, h in enumerate(b.hits) if h > 0], reverse=True)[: args.top]
+        for _, j in cost:
+            print(f"    {section}[{j}]: {b.hits[j]} hits at depth {j + 1}, {rules[section][j]}")
+    if args.output is not None:
+        if publish_rules(reordered, args.output):
+            print(f"{parser.prog}: wrote {args.output}", file=sys.stderr)
+        else:
+            print(f"{parser.prog}: {args.output} is unchanged", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
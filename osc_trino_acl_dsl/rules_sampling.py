@@ -0,0 +1,259 @@
+"""
+Sample requests for comparing the effective permissions of two rule sets
+
+Two rule sets can only be compared by evaluating them on some population of principals and
+objects. Rather than requiring one, this samples names from the rules themselves: the literal
+names of alternations like 'a|b|c', and for other patterns a few witness strings derived from
+the parsed regex, for example 'eng_' and 'eng_x' for 'eng_.*', which exercise each alternative,
+character class and optional part of the pattern. Names that no rule mentions are represented
+by a sentinel name. Patterns whose witnesses cannot be derived, such as those using
+backreferences or lookarounds, are reported by 'unanalyzable_rules' so that callers never
+mistake an unsampled change for no change.
+"""
+
+import difflib
+import itertools
+import re
+
+from .rules_eval import is_literal
+from .rules_io import canonical_rule
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    # python < 3.11
+    import sre_parse as _sre_parse
+
+# rule attributes selecting principals and objects
+_principal_keys = ("user", "group")
+_object_keys = ("catalog", "schema", "table")
+
+# bound the witnesses of a single pattern, and the objects sampled for a single rule
+_max_witnesses = 64
+_max_product = 64
+
+# characters tried for '.', negated literals and character classes
+_pool = "x0_-aZ. "
+
+_repeat_ops = tuple(
+    [getattr(_sre_parse, op) for op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(_sre_parse, op)]
+)
+
+_categories = {
+    "CATEGORY_DIGIT": r"\d",
+    "CATEGORY_NOT_DIGIT": r"\D",
+    "CATEGORY_SPACE": r"\s",
+    "CATEGORY_NOT_SPACE": r"\S",
+    "CATEGORY_WORD": r"\w",
+    "CATEGORY_NOT_WORD": r"\W",
+}
+
+_witnesses: dict = {}
+
+
+class _Unanalyzable(Exception):
+    pass
+
+
+def literal_alternatives(pattern: str):
+    """the literal strings matched by a pattern like 'a|b|c', or None if it is not of that form"""
+    alts = pattern.split("|")
+    return alts if all([is_literal(alt) for alt in alts]) else None
+
+
+def _in_class(ch: str, items: list) -> bool:
+    """true if the character 'ch' is in the parsed character class 'items'"""
+    code = ord(ch)
+    negate = False
+    found = False
+    for op, av in items:
+        if op == _sre_parse.NEGATE:
+            negate = True
+        elif op == _sre_parse.LITERAL:
+            found = found or (code == av)
+        elif op == _sre_parse.RANGE:
+            found = found or (av[0] <= code <= av[1])
+        elif (op == _sre_parse.CATEGORY) and (str(av) in _categories):
+            found = found or (re.fullmatch(_categories[str(av)], ch) is not None)
+        else:
+            raise _Unanalyzable(op)
+    return found != negate
+
+
+def _class_chars(items: list) -> list:
+    """the characters mentioned by a character class that are in it, or else one from the pool"""
+    mentioned = []
+    for op, av in items:
+        if op == _sre_parse.LITERAL:
+            mentioned.append(chr(av))
+        elif op == _sre_parse.RANGE:
+            mentioned.extend([chr(av[0]), chr(av[1])])
+    chars = list(dict.fromkeys([ch for ch in mentioned + list(_pool) if _in_class(ch, items)]))
+    if len(chars) == 0:
+        raise _Unanalyzable(items)
+    # the pool is only a fallback for classes like '\w' or '[^x]' which mention no member
+    members = [ch for ch in chars if ch in mentioned]
+    return members if len(members) > 0 else chars[:1]
+
+
+def _repeat(minimum: int, maximum: int, words: list) -> list:
+    """strings for the repeat of a sub-pattern with strings 'words': the fewest repetitions, and one more"""
+    base = words[0] * minimum
+    result = [""] if minimum == 0 else [w + words[0] * (minimum - 1) for w in words]
+    if maximum > minimum:
+        result.extend([base + w for w in words])
+    return result
+
+
+def _node(op, av) -> list:
+    """strings matching one node of a parsed pattern"""
+    if op == _sre_parse.LITERAL:
+        return [chr(av)]
+    if op == _sre_parse.NOT_LITERAL:
+        return [ch for ch in _pool if ord(ch) != av][:1]
+    if op == _sre_parse.ANY:
+        return [_pool[0]]
+    if op == _sre_parse.IN:
+        return _class_chars(av)
+    if op == _sre_parse.AT:
+        # anchors match no characters, and witnesses violating them are filtered out by full matching
+        return [""]
+    if op == _sre_parse.BRANCH:
+        return list(itertools.chain(*[_sequence(alt) for alt in av[1]]))
+    if op == _sre_parse.SUBPATTERN:
+        return _sequence(av[-1])
+    if op == getattr(_sre_parse, "ATOMIC_GROUP", None):
+        return _sequence(av)
+    if op in _repeat_ops:
+        return _repeat(av[0], av[1], _sequence(av[2]))
+    raise _Unanalyzable(op)
+
+
+def _sequence(parsed) -> list:
+    """
+    Strings matching a parsed sequence. Rather than every combination of the strings of each
+    node, each node's strings are tried once against the first strings of the other nodes.
+    """
+    words = [""]
+    for op, av in parsed:
+        ws = list(dict.fromkeys(_node(op, av)))
+        words = [w + ws[0] for w in words] + [words[0] + w for w in ws[1:]]
+        words = list(dict.fromkeys(words))[:_max_witnesses]
+    return words
+
+
+def pattern_witnesses(pattern: str):
+    """
+    A list of strings that fully match 'pattern', covering each of its alternatives,
+    character classes and optional parts, or None if none can be derived
+    """
+    if pattern in _witnesses:
+        return _witnesses[pattern]
+    try:
+        fullmatch = re.compile(pattern).fullmatch
+        words = [w for w in _sequence(_sre_parse.parse(pattern)) if fullmatch(w) is not None]
+    except (re.error, _Unanalyzable, RecursionError):
+        words = []
+    _witnesses[pattern] = words if len(words) > 0 else None
+    return _witnesses[pattern]
+
+
+def pattern_names(pattern: str):
+    """the names to sample for a pattern: its literal alternatives, or its witnesses, or None"""
+    return literal_alternatives(pattern) or pattern_witnesses(pattern)
+
+
+def changed_rules(rules_a: dict, rules_b: dict) -> list:
+    """
+    The (section, rule) pairs of rules in either rule set that are not matched, in order, by
+    an identical rule of the other. Requests whose permissions differ between the two rule
+    sets are always matched by at least one of these.
+    """
+    changed = []
+    for section in sorted(set(rules_a) | set(rules_b)):
+        srules_a = rules_a.get(section, [])
+        srules_b = rules_b.get(section, [])
+        matcher = difflib.SequenceMatcher(
+            None, [canonical_rule(r) for r in srules_a], [canonical_rule(r) for r in srules_b], autojunk=False
+        )
+        for tag, a0, a1, b0, b1 in matcher.get_opcodes():
+            if tag != "equal":
+                changed.extend([(section, rule) for rule in srules_a[a0:a1] + srules_b[b0:b1]])
+    return changed
+
+
+def unanalyzable_rules(rules: list) -> list:
+    """the (section, rule) pairs in 'rules' having some pattern for which no names can be sampled"""
+    keys = _principal_keys + _object_keys
+    return [
+        (section, rule) for section, rule in rules if any([pattern_names(rule[k]) is None for k in keys if k in rule])
+    ]
+
+
+def _rule_values(rules: list, key: str) -> set:
+    """the names sampled for the 'key' patterns of a list of rules"""
+    values = set()
+    for rule in rules:
+        if key in rule:
+            values.update(pattern_names(rule[key]) or [])
+    return values
+
+
+def _sample_values(rules_list: list, key: str) -> set:
+    return _rule_values([rule for rules in rules_list for srules in rules.values() for rule in srules], key)
+
+
+def sample_principals(rules_list: list, sentinel: str) -> list:
+    """
+    (user, groups) principals for the names of every user and group pattern in 'rules_list',
+    plus a sentinel user matched only by broad patterns
+    """
+    users = sorted(_sample_values(rules_list, "user")) + [sentinel]
+    groups = sorted(_sample_values(rules_list, "group"))
+    return [(u, ()) for u in users] + [(sentinel, (g,)) for g in groups]
+
+
+def combined_principals(pair_rules: list, rules: list, sentinel: str) -> set:
+    """
+    Principals combining a user or group named by 'pair_rules' with a group named by 'rules',
+    or a user named by 'rules' with a group named by 'pair_rules'. A principal in two groups
+    can be matched first by a different rule than either group alone, so where 'pair_rules'
+    changed, principals combining them with the other rules matching the same object can
+    change differently from any single user or group.
+    """
+    pair_users = _rule_values(pair_rules, "user")
+    pair_groups = _rule_values(pair_rules, "group")
+    users = _rule_values(rules, "user")
+    groups = _rule_values(rules, "group")
+    combined = set([(u, (g,)) for u in pair_users for g in groups])
+    combined.update([(u, (g,)) for u in users for g in pair_groups])
+    combined.update([(sentinel, tuple(sorted([g, h]))) for g in pair_groups for h in groups if g != h])
+    return combined
+
+
+def _rule_objects(names: list) -> list:
+    """the objects for the (catalogs, schemas, tables) names of one rule: all combinations, if there are few"""
+    if len(names[0]) * len(names[1]) * len(names[2]) <= _max_product:
+        return list(itertools.product(*names))
+    objects = [(names[0][0], names[1][0], names[2][0])]
+    for j in range(3):
+        objects.extend([tuple([v if k == j else names[k][0] for k in range(3)]) for v in names[j][1:]])
+    return objects
+
+
+def sample_objects(rules_list: list, sentinel: str) -> list:
+    """
+    (catalog, schema, table) objects for the names of every object pattern in 'rules_list',
+    with sentinels for other names
+    """
+    objects = set([(sentinel, sentinel, sentinel)])
+    keys = set()
+    for rules in rules_list:
+        for srules in rules.values():
+            keys.update([tuple([rule.get(k) for k in _object_keys]) for rule in srules])
+    for key in keys:
+        # absent attributes, and patterns without names, are sampled by the sentinel
+        names = [[sentinel] if p is None else (pattern_names(p) or [sentinel]) for p in key]
+        for c, s, t in _rule_objects(names):
+            objects.update([(c, s, t), (c, s, sentinel), (c, sentinel, sentinel)])
+    return sorted(objects)
@@ -0,0 +1,103 @@
+"""
+Phase-level timing instrumentation
+
+A PhaseTimings object accumulates the wall time of named phases and, when tracemalloc is
+tracing, the memory each phase allocated and its peak. Python 3.8 cannot reset the traced peak
+between phases, so there the peak of a phase is its net allocation, a lower bound. Functions
+accepting an optional 'timings' parameter fall back to 'no_timings', whose phases do nothing.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+def _tracemalloc():
+    # tracemalloc imports several other modules, so it is only imported once memory is traced
+    import tracemalloc
+
+    return tracemalloc
+
+
+class PhaseTimings(object):
+    def __init__(self, trace_memory=False):
+        # phase name -> [seconds, net allocated bytes, peak bytes], in order of first use
+        self.phases: dict = {}
+        self.trace_memory = trace_memory
+
+    @contextmanager
+    def phase(self, name: str):
+        tracing = self.trace_memory and _tracemalloc().is_tracing()
+        # tracemalloc.reset_peak is new in python 3.9
+        reset_peak = tracing and hasattr(_tracemalloc(), "reset_peak")
+        if tracing:
+            before, _ = _tracemalloc().get_traced_memory()
+        if reset_peak:
+            _tracemalloc().reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rec = self.phases.setdefault(name, [0.0, 0, 0])
+            rec[0] += elapsed
+            if tracing:
+                current, peak = _tracemalloc().get_traced_memory()
+                rec[1] += current - before
+                rec[2] = max(rec[2], (peak if reset_peak else current) - before)
+
+    def report(self, prefix="") -> str:
+        lines = []
+        total = sum([rec[0] for rec in self.phases.values()])
+        for name, (seconds, allocated, peak) in self.phases.items():
+            line = f"{prefix}{name:>16}: {seconds:9.4f}s"
+            if self.trace_memory:
+                line += f"  allocated {allocated / 1e6:9.3f} MB  peak {peak / 1e6:9.3f} MB"
+            lines.append(line)
+        lines.append(f"{prefix}{'total':>16}: {total:9.4f}s")
+        return "\n".join(lines)
+
+
+class _NoTimings(object):
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+
+no_timings = _NoTimings()
+
+
+@contextmanager
+def profiling(profile_file=None, trace_memory=False, tracemalloc_file=None):
+    """
+    Optionally run the enclosed code under cProfile, writing pstats data to 'profile_file', and
+    under tracemalloc, which PhaseTimings needs to record allocations, writing a snapshot to 'tracemalloc_file'
+    """
+    profiler = None
+    if profile_file is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    tracing = trace_memory or (tracemalloc_file is not None)
+    if tracing:
+        _tracemalloc().start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+        if tracing:
+            if tracemalloc_file is not None:
+                _tracemalloc().take_snapshot().dump(tracemalloc_file)
+            _tracemalloc().stop()
+
+
+def add_profiling_arguments(parser):
+    """the --timings, --profile and --tracemalloc options shared by the command line tools"""
+    parser.add_argument(
+        "--timings", action="store_true", help="report wall time and memory allocated by each phase on stderr"
+    )
+    parser.add_argument("--profile", metavar="FILE", default=None, help="write cProfile statistics to FILE")
+    parser.add_argument("--tracemalloc", metavar="FILE", default=None, help="write a tracemalloc snapshot to FILE")
@@ -0,0 +1,201 @@
+"""
+Validation of DSL structures against the DSL json-schema
+
+Validating a whole DSL document with one Draft7Validator call is dominated by the
+'tables' list, and stops at the first error. Here the global structure is validated
+separately from the individual 'schemas' and 'tables' entries. The document and the
+entry definitions are compiled once into plain python predicates, which are much cheaper
+than jsonschema's general purpose validators. Only entries failing these are passed to
+jsonschema to report their full list of errors, so a valid DSL never even imports jsonschema.
+Entries can optionally be validated across worker processes.
+"""
+
+import re
+
+from .dsl2rules import dsl_entry_validator, dsl_json_schema, dsl_json_validator
+
+_entry_lists = [("schemas", "schema-entry"), ("tables", "table-entry")]
+
+# annotation keywords, which have no effect on validation
+_annotations = {"$schema", "$id", "title", "description", "definitions"}
+
+_compiled_checks: dict = {}
+
+
+def _is_type(t: str, x) -> bool:
+    # note that json-schema does not consider booleans to be numbers
+    if t == "object":
+        return isinstance(x, dict)
+    if t == "array":
+        return isinstance(x, list)
+    if t == "string":
+        return isinstance(x, str)
+    if t == "boolean":
+        return isinstance(x, bool)
+    if t == "integer":
+        return isinstance(x, int) and not isinstance(x, bool)
+    if t == "number":
+        return isinstance(x, (int, float)) and not isinstance(x, bool)
+    if t == "null":
+        return x is None
+    raise ValueError(f"unsupported json-schema type {t}")
+
+
+def _keyword_check(k: str, v, definitions: dict):  # noqa: C901
+    """compile a single json-schema keyword to a predicate"""
+    if k == "type":
+        return lambda x: _is_type(v, x)
+    if k == "properties":
+        props = [(p, _compile_check(ps, definitions)) for p, ps in v.items()]
+        return lambda x: (not isinstance(x, dict)) or all([c(x[p]) for p, c in props if p in x])
+    if k == "required":
+        return lambda x: (not isinstance(x, dict)) or all([p in x for p in v])
+    if k == "items":
+        c = _compile_check(v, definitions)
+        return lambda x: (not isinstance(x, list)) or all([c(e) for e in x])
+    if k == "oneOf":
+        cs = [_compile_check(e, definitions) for e in v]
+        return lambda x: sum([1 for c in cs if c(x)]) == 1
+    if k == "pattern":
+        pat = re.compile(v)
+        return lambda x: (not isinstance(x, str)) or (pat.search(x) is not None)
+    if k == "minItems":
+        return lambda x: (not isinstance(x, list)) or (len(x) >= v)
+    if k == "minProperties":
+        return lambda x: (not isinstance(x, dict)) or (len(x) >= v)
+    raise ValueError(f"unsupported json-schema keyword {k}")
+
+
+def _compile_check(schema: dict, definitions: dict):
+    """
+    Compile a json-schema to a predicate, supporting the draft-7 keywords used by the DSL
+    schema. Raises ValueError for anything else, so that callers can fall back to jsonschema.
+    """
+    if "$ref" in schema:
+        # in draft-7 any siblings of $ref are ignored
+        ref = schema["$ref"]
+        if not ref.startswith("#/definitions/"):
+            raise ValueError(f"unsupported json-schema $ref {ref}")
+        return _compile_check(definitions[ref[len("#/definitions/") :]], definitions)
+    checks = [_keyword_check(k, v, definitions) for k, v in schema.items() if k not in _annotations]
+    if len(checks) == 1:
+        return checks[0]
+    return lambda x: all([c(x) for c in checks])
+
+
+def _entry_check(definition=None):
+    """
+    The compiled predicate for an entry definition, or for the whole DSL document if
+    'definition' is None. Returns None if the schema is not compilable.
+    """
+    if definition not in _compiled_checks:
+        schema = dsl_json_schema()
+        definitions = schema["definitions"]
+        try:
+            _compiled_checks[definition] = _compile_check(
+                schema if definition is None else definitions[definition], definitions
+            )
+        except ValueError:
+            _compiled_checks[definition] = None
+    return _compiled_checks[definition]
+
+
+def _document_validator(definition):
+    return dsl_json_validator() if definition is None else dsl_entry_validator(definition)
+
+
+def _is_valid(definition, instance) -> bool:
+    check = _entry_check(definition)
+    if check is not None:
+        return check(instance)
+    return _document_validator(definition).is_valid(instance)
+
+
+def _json_path(path) -> str:
+    """render a jsonschema error path like $.tables[3].acl[0].id"""
+    jpath = "$"
+    for e in path:
+        jpath += f"[{e}]" if isinstance(e, int) else f".{e}"
+    return jpath
+
+
+def _entry_errors(definition: str, prefix: list, offset: int, specs: list) -> list:
+    errors = []
+    for j, spec in enumerate(specs, start=offset):
+        if _is_valid(definition, spec):
+            continue
+        # jsonschema is only needed to describe errors
+        for err in dsl_entry_validator(definition).iter_errors(spec):
+            errors.append((_json_path(prefix + [j] + list(err.absolute_path)), err.message))
+    return errors
+
+
+def _chunks(specs: list, jobs: int) -> list:
+    size = max(1, -(-len(specs) // jobs))
+    return [(j, specs[j : j + size]) for j in range(0, len(specs), size)]
+
+
+def dsl_validation_errors(dsl, jobs=1, definition=None) -> list:
+    """
+    Returns every validation error in 'dsl' as a (json path, message) pair, in document order.
+    An empty list means 'dsl' is valid. 'definition' names the schema definition for the
+    document, for example 'dsl-fragment', and defaults to the DSL schema itself.
+    """
+    if not isinstance(dsl, dict):
+        return [
+            (_json_path(err.absolute_path), err.message) for err in _document_validator(definition).iter_errors(dsl)
+        ]
+    # validate the global structure, with any well formed entry lists emptied
+    skel = dsl.copy()
+    for key, _ in _entry_lists:
+        if isinstance(skel.get(key), list):
+            skel[key] = []
+    errors = []
+    if not _is_valid(definition, skel):
+        validator = _document_validator(definition)
+        errors.extend([(_json_path(err.absolute_path), err.message) for err in validator.iter_errors(skel)])
+    work = []
+    for key, definition in _entry_lists:
+        if isinstance(dsl.get(key), list):
+            work.extend([(definition, [key], j, chunk) for j, chunk in _chunks(dsl[key], jobs)])
+    if jobs > 1 and len(work) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_entry_errors, *zip(*work)))
+    else:
+        results = [_entry_errors(*w) for w in work]
+    for r in results:
+        errors.extend(r)
+    return errors
+
+
+def validate_entry(definition: str, spec):
+    """
+    Validate a single DSL entry against a named definition of the DSL json-schema,
+    for example 'table-entry', raising jsonschema.ValidationError if it is not valid
+    """
+    if not _is_valid(definition, spec):
+        dsl_entry_validator(definition).validate(spec)
+
+
+def validate_skeleton(skel: dict, definition=None):
+    """
+    Validate the global structure of a DSL document whose entry lists have already been
+    validated entry by entry, raising jsonschema.ValidationError if it is not valid
+    """
+    if not _is_valid(definition, skel):
+        _document_validator(definition).validate(skel)
+
+
+def validate_dsl(dsl, jobs=1, definition=None):
+    """
+    Validate 'dsl' against the DSL json-schema, or a named definition of it, raising
+    jsonschema.ValidationError with a report of all errors found if it is not valid
+    """
+    errors = dsl_validation_errors(dsl, jobs=jobs, definition=definition)
+    if len(errors) > 0:
+        import jsonschema
+
+        report = "\n".join([f"{path}: {message}" for path, message in errors])
+        raise jsonschema.ValidationError(f"DSL has {len(errors)} validation error(s):\n{report}")
@@ -42,10 +42,20 @@ setup(
         "osc_trino_acl_dsl": ["jsonschema/*.json"],
     },
     install_requires=["jsonschema", "pyyaml"],
+    extras_require={
+        # a faster json backend for minified rules, and the msgpack rules format
+        "fast": ["orjson"],
+        "msgpack": ["msgpack"],
+    },
     entry_points={
         "console_scripts": [
             "trino-dsl-to-rules=osc_trino_acl_dsl.dsl2rules:main",
             "trino-acl-dsl-check=osc_trino_acl_dsl.rules_precommit_check:main",
+            "trino-acl-matrix=osc_trino_acl_dsl.acl_matrix:main",
+            "trino-acl-diff=osc_trino_acl_dsl.acl_diff:main",
+            "trino-acl-patterns=osc_trino_acl_dsl.rules_patterns:main",
+            "trino-acl-serve=osc_trino_acl_dsl.acl_serve:main",
+            "trino-acl-reorder=osc_trino_acl_dsl.rules_reorder:main",
         ],
     },
 )
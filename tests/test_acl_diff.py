@@ -0,0 +1,113 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import acl_diff
+from osc_trino_acl_dsl.acl_diff import describe_change, read_dsl, rules_diff
+from osc_trino_acl_dsl.acl_matrix import access_matrix
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_sampling import sample_objects, sample_principals
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_dsl() -> dict:
+    with open(_example, "r") as dsl_file:
+        return yaml.safe_load(dsl_file)
+
+
+def _edited_dsl() -> dict:
+    dsl = _example_dsl()
+    # workflow_a tables become public by default, and bob becomes a workflow_b admin
+    dsl["schemas"][1]["public"] = True
+    dsl["schemas"][2]["admin"].append({"user": "bob"})
+    return dsl
+
+
+def test_diff_reports_permission_changes():
+    rules_a = dsl_to_rules(_example_dsl())
+    rules_b = dsl_to_rules(_edited_dsl())
+    assert rules_diff(rules_a, rules_a) == []
+    changes = rules_diff(rules_a, rules_b)
+    bob = [c for c in changes if c.principal == ("bob", ()) and c.table == ("prod", "workflow_b", "*")]
+    assert describe_change(bob[0]) == [
+        "catalog access read-only -> all",
+        "gains schema ownership",
+        "gains DELETE, INSERT, OWNERSHIP",
+    ]
+    other = [c for c in changes if c.principal == ("*", ()) and c.table == ("prod", "workflow_a", "*")]
+    assert describe_change(other[0]) == ["gains SELECT"]
+
+
+def test_diff_matches_full_matrix():
+    # the index only skips tables whose permissions cannot have changed
+    rules_a = dsl_to_rules(_example_dsl())
+    rules_b = dsl_to_rules(_edited_dsl())
+    principals = sample_principals([rules_a, rules_b], "*")
+    objects = sample_objects([rules_a, rules_b], "*")
+    expected = set(
+        [
+            (ra[1], ra[0])
+            for ra, rb in zip(access_matrix(rules_a, principals, objects), access_matrix(rules_b, principals, objects))
+            if ra[2] != rb[2]
+        ]
+    )
+    assert set([(c.table, c.principal) for c in rules_diff(rules_a, rules_b, principals=principals)]) == expected
+
+
+def _schema_admins(group: str) -> dict:
+    dsl = _example_dsl()
+    dsl["schemas"][0]["admin"] = [{"group": group}]
+    return dsl_to_rules(dsl)
+
+
+def test_diff_of_regex_principals():
+    changes = rules_diff(_schema_admins("eng_.*"), _schema_admins("ops_.*"))
+    owners = [c.principal for c in changes if c.table == ("dev", "sandbox", "*") and c.after.owner != c.before.owner]
+    assert ("*", ("eng_x",)) in owners
+    assert ("*", ("ops_x",)) in owners
+
+
+def test_diff_of_group_pairs():
+    # swapping two rules only changes the permissions of members of both groups
+    rules_a = {"tables": [{"group": "eng", "privileges": ["SELECT"]}, {"group": "ops", "privileges": []}]}
+    rules_b = {"tables": list(reversed(rules_a["tables"]))}
+    changes = rules_diff(rules_a, rules_b)
+    assert [c.principal for c in changes] == [("*", ("eng", "ops"))]
+
+
+def test_diff_reports_unanalyzable_rules(tmp_path, monkeypatch, capsys):
+    dsl = _example_dsl()
+    dsl["schemas"][0]["admin"] = [{"group": "(eng)_\\1"}]
+    edited = tmp_path / "edited.yaml"
+    with open(edited, "w") as dsl_file:
+        yaml.safe_dump(dsl, dsl_file)
+    monkeypatch.setattr(sys, "argv", ["trino-acl-diff", _example, str(edited)])
+    with pytest.raises(SystemExit) as exit_info:
+        acl_diff.main()
+    assert exit_info.value.code == 1
+    out, err = capsys.readouterr()
+    assert "not analyzable" in err
+    assert "no effective permission changes" not in out
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_read_dsl_from_git_revision(tmp_path, monkeypatch):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t"] + list(args), check=True, cwd=tmp_path)
+
+    dslpath = tmp_path / "trino-acl-dsl.yaml"
+    shutil.copy(_example, dslpath)
+    git("init", "-q")
+    git("add", "trino-acl-dsl.yaml")
+    git("commit", "-q", "-m", "dsl")
+    edited = _edited_dsl()
+    with open(dslpath, "w") as dsl_file:
+        yaml.safe_dump(edited, dsl_file)
+    monkeypatch.chdir(tmp_path)
+    assert read_dsl("HEAD:trino-acl-dsl.yaml") == _example_dsl()
+    assert read_dsl("trino-acl-dsl.yaml") == edited
@@ -0,0 +1,30 @@
+import itertools
+import os
+
+import yaml
+
+from osc_trino_acl_dsl.acl_matrix import access_matrix
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_eval import RulesEvaluator
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def test_matrix_matches_evaluator():
+    with open(_example, "r") as dsl_file:
+        rules = dsl_to_rules(yaml.safe_load(dsl_file), validate=True)
+    principals = [
+        ("x", ()),
+        ("userx", ()),
+        ("usery", ("workflow_a_users",)),
+        ("quantw", ("workflow_b_dev",)),
+        ("y", ("admins", "workflow_a_quant")),
+    ]
+    tables = list(
+        itertools.product(["dev", "prod"], ["sandbox", "workflow_a", "workflow_b"], ["userfacing", "frontend", "x"])
+    )
+    ev = RulesEvaluator(rules)
+    rows = list(access_matrix(rules, principals, tables))
+    assert len(rows) == len(principals) * len(tables)
+    for (user, groups), obj, perms in rows:
+        assert perms == ev.permissions(user, groups, *obj)
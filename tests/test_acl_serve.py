@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import threading
+import urllib.request
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl.acl_serve import PolicyStore, make_server
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_eval import RulesEvaluator
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+@pytest.fixture
+def served(tmp_path):
+    dslpath = str(tmp_path / "trino-acl-dsl.yaml")
+    shutil.copy(_example, dslpath)
+    server = make_server(PolicyStore(dslpath, reload_interval=0), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield (dslpath, f"http://127.0.0.1:{server.server_port}")
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url: str):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def _post(url: str, body: dict):
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST")
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def test_serve_check_and_batch(served):
+    dslpath, url = served
+    with open(_example, "r") as dsl_file:
+        ev = RulesEvaluator(dsl_to_rules(yaml.safe_load(dsl_file)))
+    expected = ev.permissions("z", ["workflow_a_users"], "dev", "workflow_a", "userfacing")._asdict()
+
+    answer = _get(f"{url}/check?user=z&groups=workflow_a_users&table=dev.workflow_a.userfacing")
+    assert {k: answer[k] for k in expected} == expected
+    query = {"user": "z", "groups": ["workflow_a_users"], "table": "dev.workflow_a.userfacing"}
+    assert _post(f"{url}/check", query) == answer
+    assert _post(f"{url}/batch", {"queries": [query, query]})["results"] == [answer, answer]
+
+    principals = [{"user": "x"}, {"user": "z", "groups": ["workflow_a_users"]}]
+    tables = ["dev.workflow_a.userfacing", "prod.x.x"]
+    results = _post(f"{url}/batch", {"principals": principals, "tables": tables})["results"]
+    assert len(results) == 4
+    assert {k: results[1][k] for k in expected} == expected
+    # groups may also be given as a comma separated string, as in GET queries
+    principals = [{"user": "z", "groups": "workflow_a_users,devs"}]
+    results = _post(f"{url}/batch", {"principals": principals, "tables": tables})["results"]
+    assert results[0]["groups"] == ["workflow_a_users", "devs"]
+    assert {k: results[0][k] for k in expected} == expected
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _post(f"{url}/batch", {"principals": [{"user": "z", "groups": {"a": 1}}], "tables": tables})
+    assert e.value.code == 400
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(f"{url}/check?user=z&table=dev.workflow_a")
+    assert e.value.code == 400
+
+
+def test_serve_reloads(served):
+    dslpath, url = served
+    query = f"{url}/check?user=nobody&table=prod.workflow_a.t1"
+    assert not _get(query)["read"]
+    with open(dslpath, "a") as dsl_file:
+        dsl_file.write("- catalog: prod\n  schema: workflow_a\n  table: t1\n  public: true\n")
+    assert _get(query)["read"]
+    # a broken DSL leaves the last good rules in place
+    with open(dslpath, "a") as dsl_file:
+        dsl_file.write("- catalog: dev\n")
+    assert _get(query)["read"]
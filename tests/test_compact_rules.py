@@ -0,0 +1,49 @@
+import io
+import json
+import os
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl.compact_rules import CompactRules, dsl_to_compact_rules
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_io import write_rules_json
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_dsl() -> dict:
+    with open(_example, "r") as dsl_file:
+        return yaml.safe_load(dsl_file)
+
+
+def test_compact_rules_round_trip():
+    dsl = _example_dsl()
+    expected = dsl_to_rules(dsl)
+    compact = dsl_to_compact_rules(dsl)
+    assert compact.to_rules() == expected
+    # the dict form is rebuilt with the same key order, so serialization is unchanged
+    out = io.StringIO()
+    write_rules_json(compact.items(), out)
+    assert out.getvalue() == json.dumps(expected, indent=4) + "\n"
+
+
+def test_compact_rules_share_values():
+    hidden = [{"name": "c1", "allow": False}, {"name": "c2", "allow": False}]
+    rules = {
+        "tables": [
+            {"group": "g1", "catalog": "dev", "table": "t1", "privileges": ["SELECT"], "columns": hidden},
+            {"group": "g2", "catalog": "dev", "table": "t2", "privileges": ["SELECT"], "columns": list(hidden)},
+        ]
+    }
+    r1, r2 = CompactRules(rules.items()).sections["tables"]
+    assert r1.privileges is r2.privileges
+    assert r1.columns is r2.columns
+    assert r1.keys is r2.keys
+
+
+def test_compact_rules_unsupported():
+    with pytest.raises(ValueError):
+        CompactRules({"tables": [{"privileges": [], "columns": [{"name": "c", "mask": "null"}]}]}.items())
+    with pytest.raises(ValueError):
+        CompactRules({"tables": [{"privileges": [], "unknown": 1}]}.items())
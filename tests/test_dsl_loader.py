@@ -0,0 +1,69 @@
+import io
+import os
+import textwrap
+
+import jsonschema
+import pytest
+import yaml
+
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.dsl_loader import iter_dsl_yaml, stream_dsl_to_rules
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+_anchored = textwrap.dedent("""
+    tables:
+    - catalog: dev
+      schema: s1
+      table: t1
+      admin: &devs
+      - group: devs
+      public: true
+    - catalog: dev
+      schema: s1
+      table: t2
+      admin: *devs
+      public: {hide: [c1]}
+    admin:
+    - user: root
+    public: false
+    catalogs:
+    - catalog: dev
+      public: true
+    schemas: []
+    """)
+
+
+@pytest.fixture(params=["c", "python"])
+def loader(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(yaml, "CSafeLoader", yaml.SafeLoader, raising=False)
+    elif not hasattr(yaml, "CSafeLoader"):
+        pytest.skip("pyyaml was built without libyaml")
+    return request.param
+
+
+def test_stream_matches_full_load(loader):
+    with open(_example, "r") as dsl_file:
+        expected = dsl_to_rules(yaml.safe_load(dsl_file))
+    with open(_example, "r") as dsl_file:
+        assert stream_dsl_to_rules(dsl_file) == expected
+
+    # tables before other keys, and yaml anchors
+    expected = dsl_to_rules(yaml.safe_load(_anchored))
+    assert stream_dsl_to_rules(io.StringIO(_anchored)) == expected
+
+
+def test_stream_tables_lazily(loader):
+    for key, value in iter_dsl_yaml(io.StringIO(_anchored)):
+        if key == "tables":
+            assert next(value)["table"] == "t1"
+            assert next(value)["admin"] == [{"group": "devs"}]
+            assert list(value) == []
+
+
+def test_stream_validation():
+    with pytest.raises(jsonschema.ValidationError):
+        stream_dsl_to_rules(io.StringIO(_anchored.replace("table: t2", "table: T2")))
+    with pytest.raises(jsonschema.ValidationError):
+        stream_dsl_to_rules(io.StringIO(_anchored.replace("public: false", "public: 3")))
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import acl_diff, acl_matrix, dsl_modules, rules_precommit_check
+from osc_trino_acl_dsl.compile_cache import CompileCache
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.dsl_loader import load_dsl_rules_sections
+
+_root = textwrap.dedent("""
+    admin:
+    - group: admins
+    public: false
+    include:
+    - teams/a.trino-acl-dsl.yaml
+    - teams/b.trino-acl-dsl.yaml
+    catalogs:
+    - catalog: dev
+      public: true
+    schemas: []
+    tables:
+    - catalog: dev
+      schema: shared
+      table: t0
+      public: true
+    """)
+
+_fragment_a = textwrap.dedent("""
+    schemas:
+    - catalog: dev
+      schema: a
+      admin:
+      - group: team-a
+      public: false
+    tables:
+    - catalog: dev
+      schema: a
+      table: t1
+      admin:
+      - user: alice
+      public:
+        hide: [ssn]
+    """)
+
+_fragment_b = textwrap.dedent("""
+    catalogs:
+    - catalog: prod
+      public: false
+    tables:
+    - catalog: prod
+      schema: b
+      table: t2
+      acl:
+      - id:
+        - group: team-b
+        filter: [region = 'eu']
+      public: false
+    """)
+
+
+@pytest.fixture
+def modular_dsl(tmp_path):
+    os.mkdir(str(tmp_path / "teams"))
+    for fname, text in [
+        ("trino-acl-dsl.yaml", _root),
+        ("teams/a.trino-acl-dsl.yaml", _fragment_a),
+        ("teams/b.trino-acl-dsl.yaml", _fragment_b),
+    ]:
+        with open(str(tmp_path / fname), "w") as dsl_file:
+            dsl_file.write(text)
+    return str(tmp_path / "trino-acl-dsl.yaml")
+
+
+def _monolithic_rules() -> dict:
+    dsl = yaml.safe_load(_root)
+    del dsl["include"]
+    for text in [_fragment_a, _fragment_b]:
+        for k, entries in yaml.safe_load(text).items():
+            dsl[k].extend(entries)
+    return dsl_to_rules(dsl)
+
+
+def _rules(dslpath, **kwargs) -> dict:
+    return {section: list(rules) for section, rules in load_dsl_rules_sections(dslpath, **kwargs)}
+
+
+def test_include_matches_monolithic_dsl(modular_dsl):
+    included: list = []
+    assert _rules(modular_dsl, included=included) == _monolithic_rules()
+    assert [os.path.basename(path) for path in included] == ["a.trino-acl-dsl.yaml", "b.trino-acl-dsl.yaml"]
+    # a DSL with includes cannot be compiled without knowing where its fragments are
+    with open(modular_dsl, "r") as dsl_file:
+        with pytest.raises(ValueError):
+            dsl_to_rules(yaml.safe_load(dsl_file))
+
+
+def test_fragment_cache(monkeypatch, tmp_path, modular_dsl):
+    cache = CompileCache(cache_dir=str(tmp_path / "cache"))
+    expected = _monolithic_rules()
+    assert _rules(modular_dsl, cache=cache) == expected
+    assert len(os.listdir(str(tmp_path / "cache"))) == 2
+
+    # unchanged fragments are not compiled again
+    def compile_fragment(fragment, fname, validate=True):
+        assert os.path.basename(fname) == "a.trino-acl-dsl.yaml"
+        return original(fragment, fname, validate)
+
+    original = dsl_modules.compile_fragment
+    monkeypatch.setattr(dsl_modules, "compile_fragment", compile_fragment)
+    with open(str(tmp_path / "teams" / "a.trino-acl-dsl.yaml"), "a") as dsl_file:
+        dsl_file.write("\n")
+    assert _rules(modular_dsl, cache=cache) == expected
+    assert len(os.listdir(str(tmp_path / "cache"))) == 3
+
+
+def test_fragment_cannot_set_admin(tmp_path, modular_dsl):
+    with open(str(tmp_path / "teams" / "b.trino-acl-dsl.yaml"), "a") as dsl_file:
+        dsl_file.write("admin:\n- user: mallory\n")
+    with pytest.raises(ValueError, match="b.trino-acl-dsl.yaml"):
+        _rules(modular_dsl, validate=False)
+
+
+def test_check_staged_fragment(monkeypatch, capsys, tmp_path, modular_dsl):
+    with open(str(tmp_path / "rules.json"), "w") as rules_file:
+        json.dump(_monolithic_rules(), rules_file, indent=4)
+        rules_file.write("\n")
+    fragpath = str(tmp_path / "teams" / "b.trino-acl-dsl.yaml")
+    argv = ["trino-acl-dsl-check", "--cache-dir", str(tmp_path / "cache"), fragpath]
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit) as e:
+        rules_precommit_check.main()
+    assert e.value.code == 0
+    assert f"checking consistency of {modular_dsl}" in capsys.readouterr().out
+    # editing a fragment invalidates the verified pair, even though the including DSL is unchanged
+    with open(fragpath, "a") as dsl_file:
+        dsl_file.write("schemas:\n- catalog: prod\n  schema: b\n  admin:\n  - group: team-b\n  public: false\n")
+    with pytest.raises(SystemExit) as e:
+        rules_precommit_check.main()
+    assert e.value.code == 1
+    assert "out of sync" in capsys.readouterr().out
+
+
+def test_check_same_dsl_in_other_directory(monkeypatch, capsys, tmp_path):
+    # the same DSL and rules.json, including fragments that differ, in two directories
+    for dname, fragment in [("a", _fragment_a), ("b", _fragment_b)]:
+        os.makedirs(str(tmp_path / dname / "teams"))
+        with open(str(tmp_path / dname / "trino-acl-dsl.yaml"), "w") as dsl_file:
+            dsl_file.write("admin:\n- group: admins\npublic: false\ninclude:\n- teams/x.trino-acl-dsl.yaml\n")
+            dsl_file.write("catalogs: []\nschemas: []\ntables: []\n")
+        with open(str(tmp_path / dname / "teams" / "x.trino-acl-dsl.yaml"), "w") as dsl_file:
+            dsl_file.write(fragment)
+    with open(str(tmp_path / "a" / "rules.json"), "w") as rules_file:
+        json.dump(_rules(str(tmp_path / "a" / "trino-acl-dsl.yaml")), rules_file, indent=4)
+        rules_file.write("\n")
+    shutil.copy(str(tmp_path / "a" / "rules.json"), str(tmp_path / "b" / "rules.json"))
+    codes = []
+    for dname in ["a", "b"]:
+        dslpath = str(tmp_path / dname / "trino-acl-dsl.yaml")
+        argv = ["trino-acl-dsl-check", "--cache-dir", str(tmp_path / "cache"), dslpath]
+        monkeypatch.setattr(sys, "argv", argv)
+        with pytest.raises(SystemExit) as e:
+            rules_precommit_check.main()
+        codes.append(e.value.code)
+    assert codes == [0, 1]
+    assert "out of sync" in capsys.readouterr().out
+
+
+def test_matrix_of_modular_dsl(monkeypatch, capsys, tmp_path, modular_dsl):
+    with open(str(tmp_path / "principals.yaml"), "w") as principals_file:
+        principals_file.write("- {user: bob, groups: [team-b]}\n")
+    with open(str(tmp_path / "tables.txt"), "w") as tables_file:
+        tables_file.write("prod.b.t2\n")
+    argv = ["trino-acl-matrix", modular_dsl, "--principals", str(tmp_path / "principals.yaml")]
+    monkeypatch.setattr(sys, "argv", argv + ["--tables", str(tmp_path / "tables.txt")])
+    acl_matrix.main()
+    assert capsys.readouterr().out.splitlines()[1] == "bob,team-b,prod,b,t2,read-only,False,SELECT,,(region = 'eu')"
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_diff_of_modular_dsl(monkeypatch, capsys, tmp_path, modular_dsl):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t"] + list(args), check=True, cwd=tmp_path)
+
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-q", "-m", "dsl")
+    # the committed fragment is read from the same revision as the committed DSL
+    fragpath = str(tmp_path / "teams" / "b.trino-acl-dsl.yaml")
+    with open(fragpath, "r") as dsl_file:
+        text = dsl_file.read()
+    with open(fragpath, "w") as dsl_file:
+        dsl_file.write(text.replace("region = 'eu'", "region = 'us'"))
+    with open(str(tmp_path / "principals.yaml"), "w") as principals_file:
+        principals_file.write("- {user: bob, groups: [team-b]}\n")
+    monkeypatch.chdir(tmp_path)
+    argv = ["trino-acl-diff", "HEAD:trino-acl-dsl.yaml", "trino-acl-dsl.yaml", "--principals", "principals.yaml"]
+    monkeypatch.setattr(sys, "argv", argv)
+    acl_diff.main()
+    out = capsys.readouterr().out
+    assert out.startswith("prod.b.t2\n")
+    assert "region = 'us'" in out
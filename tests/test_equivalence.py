@@ -0,0 +1,267 @@
+"""
+Differential tests of generated rules against a direct interpretation of the DSL
+
+Random DSLs and populations of principals and tables are generated, and the first-match
+evaluation of the generated rules, batched over every principal per table by acl_matrix, is
+compared with what the DSL says each principal may do on each table. Set
+OSC_TRINO_ACL_DSL_EQUIVALENCE_SCALE to grow the DSLs and populations, for example a scale of
+5 checks about seven million (principal, table) pairs across all cases.
+"""
+
+import os
+import random
+import re
+
+import pytest
+
+from osc_trino_acl_dsl.acl_matrix import access_matrix
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_eval import Permissions
+from osc_trino_acl_dsl.rules_optimize import optimize_rules
+from osc_trino_acl_dsl.rules_patterns import factor_rules
+
+_scale = int(os.environ.get("OSC_TRINO_ACL_DSL_EQUIVALENCE_SCALE", "1"))
+
+_admin_privs = ["SELECT", "INSERT", "DELETE", "OWNERSHIP"]
+
+
+def _random_ids(rng: random.Random, users: int, groups: int) -> list:
+    ids = []
+    for _ in range(rng.randint(1, 3)):
+        k = rng.randrange(groups)
+        if rng.random() < 0.1:
+            # a regex matching a range of groups, like g1[0-9]
+            ids.append({"group": f"g{k}[0-9]"})
+        elif rng.random() < 0.5:
+            ids.append({"group": f"g{k}"})
+        else:
+            ids.append({"user": f"u{rng.randrange(users)}"})
+    return ids
+
+
+def _random_filters(rng: random.Random) -> list:
+    return [f"region = 'r{rng.randrange(4)}'" for _ in range(rng.randint(1, 2))]
+
+
+def _random_hide(rng: random.Random) -> list:
+    return [f"col{rng.randrange(6)}" for _ in range(rng.randint(1, 2))]
+
+
+def _random_public(rng: random.Random):
+    if rng.random() < 0.5:
+        return rng.random() < 0.5
+    public: dict = {}
+    if rng.random() < 0.5:
+        public["hide"] = _random_hide(rng)
+    if rng.random() < 0.5:
+        public["filter"] = _random_filters(rng)
+    return public
+
+
+def _random_table_entry(rng: random.Random, c: str, s: str, t: str, users: int, groups: int) -> dict:
+    spec: dict = {"catalog": c, "schema": s, "table": t, "public": _random_public(rng)}
+    if rng.random() < 0.5:
+        spec["admin"] = _random_ids(rng, users, groups)
+    acl = []
+    for _ in range(rng.randrange(4)):
+        entry: dict = {"id": _random_ids(rng, users, groups)}
+        if rng.random() < 0.6:
+            entry["hide"] = _random_hide(rng)
+        if ("hide" not in entry) or (rng.random() < 0.4):
+            entry["filter"] = _random_filters(rng)
+        acl.append(entry)
+    if len(acl) > 0:
+        spec["acl"] = acl
+    return spec
+
+
+def random_dsl(rng: random.Random, catalogs: int, schemas: int, tables: int, users: int, groups: int) -> dict:
+    """a random DSL over catalogs c<k>, schemas s<k> and tables t<k>, some entries repeated"""
+    dsl: dict = {
+        "admin": _random_ids(rng, users, groups),
+        "public": rng.random() < 0.5,
+        "catalogs": [],
+        "schemas": [],
+        "tables": [],
+    }
+    for c in [f"c{k}" for k in range(catalogs)]:
+        if rng.random() < 0.8:
+            dsl["catalogs"].append({"catalog": c, "public": rng.random() < 0.5})
+        for s in [f"s{k}" for k in range(schemas)]:
+            if rng.random() < 0.5:
+                spec = {"catalog": c, "schema": s, "admin": _random_ids(rng, users, groups)}
+                dsl["schemas"].append(dict(spec, public=rng.random() < 0.5))
+            for t in [f"t{k}" for k in range(tables)]:
+                if rng.random() < 0.4:
+                    dsl["tables"].append(_random_table_entry(rng, c, s, t, users, groups))
+    # later entries for the same schema or table are shadowed by earlier ones
+    for key in ["schemas", "tables"]:
+        entries = dsl[key]
+        for spec in rng.sample(entries, min(len(entries), 3)):
+            dup = dict(spec, public=not spec["public"]) if key == "schemas" else dict(spec, public=True)
+            entries.append(dup)
+    rng.shuffle(dsl["tables"])
+    return dsl
+
+
+class DSLSemantics(object):
+    """
+    The effective permissions of principals on tables, as described by the DSL, without generating
+    rules. Principals are (user, groups) tuples. They are evaluated together, with sets of principals
+    as bit masks, one bit per principal, so that each DSL entry is examined once per table.
+    """
+
+    def __init__(self, dsl: dict, principals: list):
+        self.dsl = dsl
+        self.principals = principals
+        self.all = (1 << len(principals)) - 1
+        self._masks: dict = {}
+        self.catalogs: dict = {}
+        self.schemas: dict = {}
+        self.tables: dict = {}
+        # the first entry for each name decides its defaults
+        for spec in dsl["catalogs"]:
+            self.catalogs.setdefault(spec["catalog"], spec)
+        for spec in dsl["schemas"]:
+            self.schemas.setdefault((spec["catalog"], spec["schema"]), []).append(spec)
+        for spec in dsl["tables"]:
+            self.tables.setdefault((spec["catalog"], spec["schema"], spec["table"]), spec)
+        # schema and table admins need full access to the catalog, if it is a listed catalog
+        self.catalog_admins: dict = {}
+        for spec in dsl["schemas"] + dsl["tables"]:
+            if "admin" in spec:
+                self.catalog_admins.setdefault(spec["catalog"], []).extend(spec["admin"])
+        self.admins = self.members(dsl["admin"])
+
+    def _id_mask(self, kind: str, pattern: str) -> int:
+        mask = self._masks.get((kind, pattern))
+        if mask is None:
+            pat = re.compile(pattern)
+            mask = 0
+            for j, (user, groups) in enumerate(self.principals):
+                names = [user] if kind == "user" else groups
+                if any([pat.fullmatch(name) is not None for name in names]):
+                    mask |= 1 << j
+            self._masks[(kind, pattern)] = mask
+        return mask
+
+    def members(self, ids: list) -> int:
+        """the principals matching any user or group of 'ids'"""
+        mask = 0
+        for e in ids:
+            for kind, pattern in e.items():
+                mask |= self._id_mask(kind, pattern)
+        return mask
+
+    def _allowed(self, catalog: str) -> int:
+        """the principals with 'all' access to a catalog, the others have 'read-only'"""
+        if catalog not in self.catalogs:
+            return self.admins
+        return self.admins | self.members(self.catalog_admins.get(catalog, []))
+
+    def _owners(self, catalog: str, schema: str) -> int:
+        return self.admins | self.members(
+            [e for spec in self.schemas.get((catalog, schema), []) for e in spec["admin"]]
+        )
+
+    def _table_entry_claims(self, spec: dict) -> list:
+        """(principals, (privileges, hidden columns, filter)) in order of precedence, under a table entry"""
+        claims = []
+        if "admin" in spec:
+            claims.append((self.members(spec["admin"]), (_admin_privs, [], None)))
+        acl = spec.get("acl", [])
+        for entry in acl:
+            filters = entry.get("filter")
+            result = (["SELECT"], entry.get("hide", []), None if filters is None else _conjunction(filters))
+            claims.append((self.members(entry["id"]), result))
+        public = spec["public"]
+        if public is False:
+            return claims + [(self.all, ([], [], None))]
+        # the public sees nothing hidden from any acl entry, and every filter of any acl entry applies
+        extra = public if isinstance(public, dict) else {}
+        hide = set(extra.get("hide", []))
+        filters = set(extra.get("filter", []))
+        for entry in acl:
+            hide.update(entry.get("hide", []))
+            filters.update(entry.get("filter", []))
+        result = (["SELECT"], sorted(hide), _conjunction(sorted(filters)) if len(filters) > 0 else None)
+        return claims + [(self.all, result)]
+
+    def _table_claims(self, obj: tuple) -> list:
+        schemas = self.schemas.get(obj[:2], [])
+        # schema admins are admins of every table in the schema
+        claims = [(self._owners(*obj[:2]), (_admin_privs, [], None))]
+        if obj in self.tables:
+            return claims + self._table_entry_claims(self.tables[obj])
+        if len(schemas) > 0:
+            public = schemas[0]["public"]
+        elif obj[0] in self.catalogs:
+            public = self.catalogs[obj[0]]["public"]
+        else:
+            public = self.dsl["public"]
+        return claims + [(self.all, (["SELECT"] if public else [], [], None))]
+
+    def permissions(self, obj: tuple) -> list:
+        """the Permissions of every principal on the (catalog, schema, table) 'obj'"""
+        allowed = self._allowed(obj[0])
+        owners = self._owners(*obj[:2])
+        assigned: list = [None] * len(self.principals)
+        remaining = self.all
+        for mask, result in self._table_claims(obj):
+            hit = remaining & mask
+            remaining &= ~hit
+            while hit:
+                low = hit & -hit
+                assigned[low.bit_length() - 1] = result
+                hit ^= low
+        perms = []
+        for j, (privileges, hide, filter) in enumerate(assigned):
+            columns = [{"name": col, "allow": False} for col in hide]
+            allow = "all" if (allowed >> j) & 1 else "read-only"
+            perms.append(Permissions(allow, bool((owners >> j) & 1), privileges, columns, filter))
+        return perms
+
+
+def _conjunction(filters: list) -> str:
+    return " and ".join([f"({f})" for f in filters])
+
+
+def _population(rng: random.Random, catalogs: int, schemas: int, tables: int, users: int, groups: int) -> tuple:
+    """principals, with up to three groups each, and every table of the DSL's namespace plus others"""
+    principals = [(f"u{k}", ()) for k in range(users)]
+    for _ in range(users):
+        gs = tuple(sorted(set([f"g{rng.randrange(groups * 2)}" for _ in range(rng.randint(1, 3))])))
+        principals.append((f"u{rng.randrange(users * 2)}", gs))
+    objects = [
+        (f"c{c}", f"s{s}", f"t{t}") for c in range(catalogs + 1) for s in range(schemas + 1) for t in range(tables + 1)
+    ]
+    return (principals, objects)
+
+
+def _first_difference(rules: dict, dsl: dict, principals: list, objects: list):
+    """the first (principal, table, rules permissions, DSL permissions) that differ, or None"""
+    semantics = DSLSemantics(dsl, principals)
+    matrix = access_matrix(rules, principals, objects)
+    for obj in objects:
+        for expected in semantics.permissions(obj):
+            principal, _, perms = next(matrix)
+            if perms != expected:
+                return (principal, obj, perms, expected)
+    return None
+
+
+def _optimized(rules: dict) -> dict:
+    return optimize_rules(rules)[0]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("transform", [None, _optimized, lambda rules: factor_rules(_optimized(rules))])
+def test_rules_agree_with_dsl_semantics(seed, transform):
+    rng = random.Random(seed)
+    sizes = dict(catalogs=3, schemas=4 * _scale, tables=6 * _scale, users=30 * _scale, groups=20)
+    dsl = random_dsl(rng, **sizes)
+    principals, objects = _population(rng, **sizes)
+    rules = dsl_to_rules(dsl, validate=True)
+    if transform is not None:
+        rules = transform(rules)
+    assert _first_difference(rules, dsl, principals, objects) is None
@@ -0,0 +1,86 @@
+import copy
+import os
+
+import jsonschema
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import incremental
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.incremental import IncrementalCompiler
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_dsl() -> dict:
+    with open(_example, "r") as dsl_file:
+        return yaml.safe_load(dsl_file)
+
+
+def test_incremental_compile(tmp_path):
+    dsl = _example_dsl()
+    compiler = IncrementalCompiler()
+    assert compiler.compile(dsl) == dsl_to_rules(dsl)
+    assert (compiler.reused, compiler.compiled) == (0, 7)
+
+    # edit one table, and only that table is recompiled
+    dsl2 = copy.deepcopy(dsl)
+    dsl2["tables"][1]["public"] = True
+    dsl2["tables"][1]["admin"].append({"group": "auditors"})
+    assert compiler.compile(dsl2) == dsl_to_rules(dsl2)
+    assert (compiler.reused, compiler.compiled) == (6, 1)
+
+    # fragments persist across processes
+    cache = str(tmp_path / "cache.json")
+    compiler.save(cache)
+    compiler = IncrementalCompiler.load(cache)
+    assert compiler.compile(dsl2) == dsl_to_rules(dsl2)
+    assert (compiler.reused, compiler.compiled) == (7, 0)
+
+
+def test_incremental_load_other_revision(monkeypatch, tmp_path):
+    dsl = _example_dsl()
+    compiler = IncrementalCompiler()
+    compiler.compile(dsl)
+    cache = str(tmp_path / "cache.json")
+    compiler.save(cache)
+    # fragments compiled to rules of another revision are not reused
+    monkeypatch.setattr(incremental, "_rules_revision", incremental._rules_revision + 1)
+    compiler = IncrementalCompiler.load(cache)
+    compiler.compile(dsl)
+    assert (compiler.reused, compiler.compiled) == (0, 7)
+
+
+def test_incremental_validates_changed_entries():
+    dsl = _example_dsl()
+    compiler = IncrementalCompiler()
+    compiler.compile(dsl)
+    dsl["tables"][0]["table"] = "Not-An-Id"
+    with pytest.raises(jsonschema.ValidationError):
+        compiler.compile(dsl)
+
+
+@pytest.mark.parametrize("key", ["schemas", "tables"])
+def test_incremental_missing_list(key):
+    dsl = _example_dsl()
+    del dsl[key]
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        dsl_to_rules(dsl)
+    with pytest.raises(jsonschema.ValidationError) as e:
+        IncrementalCompiler().compile(dsl)
+    assert e.value.message == expected.value.message
+
+
+def test_parallel_compile_identical():
+    dsl = _example_dsl()
+    assert dsl_to_rules(dsl, jobs=3) == dsl_to_rules(dsl)
+
+
+@pytest.mark.parametrize(
+    "schemas, tables",
+    [([], []), ([{"catalog": "dev", "schema": "s", "admin": [{"user": "a"}], "public": True}], [])],
+)
+def test_parallel_compile_without_shards(schemas, tables):
+    # no entries, or the entries of a single catalog, are compiled without worker processes
+    dsl = {"admin": [{"user": "a"}], "public": True, "catalogs": [], "schemas": schemas, "tables": tables}
+    assert dsl_to_rules(dsl, jobs=2) == dsl_to_rules(dsl)
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import dsl2rules, rules_precommit_check
+from osc_trino_acl_dsl.compile_cache import CompileCache
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.timings import PhaseTimings, profiling
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+@pytest.fixture
+def dsl_pair(tmp_path):
+    dslpath = str(tmp_path / "trino-acl-dsl.yaml")
+    rulespath = str(tmp_path / "rules.json")
+    shutil.copy(_example, dslpath)
+    with open(dslpath, "r") as dsl_file:
+        rules = dsl_to_rules(yaml.safe_load(dsl_file))
+    with open(rulespath, "w") as rules_file:
+        json.dump(rules, rules_file, indent=4)
+        rules_file.write("\n")
+    return (dslpath, rulespath)
+
+
+def _run_check(monkeypatch, *args) -> int:
+    monkeypatch.setattr(sys, "argv", ["trino-acl-dsl-check"] + list(args))
+    with pytest.raises(SystemExit) as e:
+        rules_precommit_check.main()
+    return e.value.code
+
+
+def test_check_consistent_pair(monkeypatch, capsys, tmp_path, dsl_pair):
+    cache_dir = str(tmp_path / "cache")
+    assert _run_check(monkeypatch, "--cache-dir", cache_dir, *dsl_pair) == 0
+    assert "previously verified" not in capsys.readouterr().out
+    # the second check of an unchanged pair is answered from the cache
+    assert _run_check(monkeypatch, "--cache-dir", cache_dir, *dsl_pair) == 0
+    assert "previously verified" in capsys.readouterr().out
+
+
+def test_check_out_of_sync(monkeypatch, capsys, tmp_path, dsl_pair):
+    cache_dir = str(tmp_path / "cache")
+    assert _run_check(monkeypatch, "--cache-dir", cache_dir, *dsl_pair) == 0
+    dslpath, rulespath = dsl_pair
+    with open(dslpath, "a") as dsl_file:
+        dsl_file.write("- catalog: prod\n  schema: workflow_a\n  table: extra\n  public: true\n")
+    assert _run_check(monkeypatch, "--cache-dir", cache_dir, *dsl_pair) == 1
+    assert "out of sync" in capsys.readouterr().out
+
+
+def test_cache_eviction(tmp_path):
+    cache = CompileCache(cache_dir=str(tmp_path), max_entries=2)
+    for j in range(4):
+        cache.put(f"k{j}", f"v{j}")
+        os.utime(str(tmp_path / f"k{j}"), (j, j))
+    assert cache.get("k0") is None
+    assert cache.get("k3") == "v3"
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_cache_key_revision(monkeypatch, tmp_path, dsl_pair):
+    key = CompileCache(cache_dir=str(tmp_path)).key(dsl_pair[0])
+    assert CompileCache(cache_dir=str(tmp_path)).key(dsl_pair[0]) == key
+    # rules verified or compiled by a compiler generating other rules are not trusted
+    monkeypatch.setattr(dsl2rules, "_rules_revision", dsl2rules._rules_revision + 1)
+    assert CompileCache(cache_dir=str(tmp_path)).key(dsl_pair[0]) != key
+
+
+def test_check_reports_first_difference(monkeypatch, capsys, dsl_pair):
+    dslpath, rulespath = dsl_pair
+    with open(rulespath, "r") as rules_file:
+        rules = json.load(rules_file)
+    # formatting differences are not a failure
+    with open(rulespath, "w") as rules_file:
+        json.dump(rules, rules_file)
+    assert _run_check(monkeypatch, "--no-cache", *dsl_pair) == 0
+    rules["tables"][2]["privileges"] = ["SELECT"]
+    with open(rulespath, "w") as rules_file:
+        json.dump(rules, rules_file)
+    assert _run_check(monkeypatch, "--no-cache", *dsl_pair) == 1
+    assert "first differing rule is tables[2]" in capsys.readouterr().out
+
+
+def test_check_reports_every_failed_pair(monkeypatch, capsys, tmp_path, dsl_pair):
+    pairs = []
+    for name in ["a", "b", "c"]:
+        os.mkdir(str(tmp_path / name))
+        for fname in dsl_pair:
+            shutil.copy(fname, str(tmp_path / name))
+        pairs.append(str(tmp_path / name / "trino-acl-dsl.yaml"))
+    for name in ["a", "c"]:
+        with open(str(tmp_path / name / "rules.json"), "w") as rules_file:
+            rules_file.write("{}\n")
+    assert _run_check(monkeypatch, "--no-cache", "--jobs", "2", *pairs) == 1
+    out = capsys.readouterr().out
+    assert "check succeeded for {}".format(pairs[1]) in out
+    assert "checks failed for:\n{}\n{}\n".format(pairs[0], pairs[2]) in out
+
+
+def test_check_timings(monkeypatch, capsys, tmp_path, dsl_pair):
+    profile = str(tmp_path / "check.prof")
+    assert _run_check(monkeypatch, "--no-cache", "--jobs", "1", "--timings", "--profile", profile, *dsl_pair) == 0
+    out = capsys.readouterr().out
+    for phase in ["yaml load", "validate", "tables", "schema defaults", "catalogs", "compare", "total"]:
+        assert f"{phase}: " in out
+    assert os.path.getsize(profile) > 0
+
+
+def test_timings_without_reset_peak(monkeypatch):
+    import tracemalloc
+
+    # python 3.8 has no tracemalloc.reset_peak
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    timings = PhaseTimings(trace_memory=True)
+    with profiling(trace_memory=True):
+        with timings.phase("allocate"):
+            data = [bytes(1000) for _ in range(100)]
+    assert len(data) == 100
+    seconds, allocated, peak = timings.phases["allocate"]
+    assert allocated >= 100000
+    assert peak == allocated
+
+
+def test_hook_imports_lazily(dsl_pair):
+    # the hook should not import yaml or jsonschema until there is a pair to check,
+    # and checking a valid pair should not need jsonschema at all
+    script = (
+        "import sys\n"
+        "from osc_trino_acl_dsl import rules_precommit_check\n"
+        "assert 'yaml' not in sys.modules and 'jsonschema' not in sys.modules\n"
+        f"passed, report, _ = rules_precommit_check._check_pair({dsl_pair[0]!r}, {dsl_pair[1]!r}, 'check')\n"
+        "assert passed, report\n"
+        "assert 'jsonschema' not in sys.modules\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), ".."))
+    subprocess.run([sys.executable, "-c", script], check=True, env=env)
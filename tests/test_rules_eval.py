@@ -0,0 +1,62 @@
+import itertools
+import os
+
+import yaml
+from test_dsl import Table, User, first_matching_rule, rule_permissions
+
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_eval import RulesEvaluator
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_rules() -> dict:
+    with open(_example, "r") as dsl_file:
+        return dsl_to_rules(yaml.safe_load(dsl_file), validate=True)
+
+
+def test_evaluator_matches_emulation():
+    rules = _example_rules()
+    ev = RulesEvaluator(rules)
+    users = [
+        User("x", []),
+        User("userx", []),
+        User("usery", []),
+        User("userz", ["workflow_a_quant"]),
+        User("quantw", ["workflow_b_dev"]),
+        User("y", ["admins"]),
+        User("z", ["workflow_a_dev", "workflow_a_users"]),
+    ]
+    tables = [
+        Table(c, s, t)
+        for c, s, t in itertools.product(
+            ["dev", "prod", "other"],
+            ["sandbox", "sandbox_userx", "workflow_a", "workflow_b", "x"],
+            ["userfacing", "backend", "frontend", "x"],
+        )
+    ]
+    for u, t in itertools.product(users, tables):
+        perms = ev.permissions(u.user, u.groups, t.catalog, t.schema, t.table)
+        assert perms[:3] == rule_permissions(u, t, rules)
+        trule = first_matching_rule(u, t, rules["tables"])
+        assert perms.columns == trule.get("columns", [])
+        assert perms.filter == trule.get("filter")
+        # the same query again is answered from the candidate cache
+        assert ev.permissions(u.user, u.groups, t.catalog, t.schema, t.table) == perms
+
+
+def test_evaluator_regex_objects():
+    rules = {
+        "catalogs": [{"catalog": "dev|prod", "allow": "all"}],
+        "schemas": [{"schema": "s.*", "user": "a.*", "owner": True}],
+        "tables": [
+            {"catalog": "dev", "table": "t[0-9]+", "group": "g1|g2", "privileges": ["SELECT"]},
+            {"catalog": "dev", "schema": "s1", "privileges": []},
+        ],
+    }
+    ev = RulesEvaluator(rules)
+    assert ev.permissions("abc", ["g2"], "dev", "s1", "t12") == ("all", True, ["SELECT"], [], None)
+    assert ev.permissions("bc", ["g3"], "dev", "s1", "t12") == ("all", False, [], [], None)
+    # no matching rules means deny
+    assert ev.permissions("bc", [], "other", "x", "t1") == ("none", False, [], [], None)
+    assert ev.first_matching_rule("tables", "bc", [], "dev", "s2", "t1") is None
@@ -0,0 +1,183 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import time
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import dsl2rules, rules_io
+from osc_trino_acl_dsl.dsl2rules import dsl_rules_sections, dsl_to_rules
+from osc_trino_acl_dsl.rules_eval import RulesEvaluator
+from osc_trino_acl_dsl.rules_io import encode_rules, load_rules, publish_rules, rules_formats, write_rules_json
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_dsl() -> dict:
+    with open(_example, "r") as dsl_file:
+        return yaml.safe_load(dsl_file)
+
+
+def test_streaming_writer_matches_json_dump():
+    dsl = _example_dsl()
+    rules = dsl_to_rules(dsl)
+    expected = json.dumps(rules, indent=4) + "\n"
+
+    out = io.StringIO()
+    write_rules_json(dsl_rules_sections(dsl), out)
+    assert out.getvalue() == expected
+
+    out = io.StringIO()
+    write_rules_json(rules.items(), out)
+    assert out.getvalue() == expected
+
+
+def test_streaming_writer_empty_sections():
+    for rules in [{}, {"catalogs": [], "schemas": [{"owner": False}]}]:
+        out = io.StringIO()
+        write_rules_json(rules.items(), out)
+        assert out.getvalue() == json.dumps(rules, indent=4) + "\n"
+
+
+def test_canonical_difference():
+    from osc_trino_acl_dsl.rules_io import first_rules_difference
+
+    rules = dsl_to_rules(_example_dsl())
+    # reordered keys and privileges are equivalent
+    reordered = json.loads(json.dumps(rules))
+    reordered["tables"][0] = dict(reversed(list(reordered["tables"][0].items())))
+    reordered["tables"][0]["privileges"].reverse()
+    assert first_rules_difference(rules, reordered) is None
+
+    reordered["tables"][3]["privileges"] = []
+    assert first_rules_difference(rules, reordered) == ("tables", 3)
+    reordered["schemas"].pop()
+    assert first_rules_difference(rules, reordered) == ("schemas", len(reordered["schemas"]))
+
+
+def test_rules_json_matches():
+    from osc_trino_acl_dsl.rules_io import rules_json_matches
+
+    rules = dsl_to_rules(_example_dsl())
+    text = json.dumps(rules, indent=4) + "\n"
+    assert rules_json_matches(rules.items(), io.StringIO(text))
+    assert not rules_json_matches(rules.items(), io.StringIO(text + "\n"))
+    assert not rules_json_matches(rules.items(), io.StringIO(text[:-10]))
+    assert not rules_json_matches(rules.items(), io.StringIO(json.dumps(rules)))
+
+
+def test_publish_skips_unchanged_rules(tmp_path):
+    rules = dsl_to_rules(_example_dsl())
+    path = str(tmp_path / "rules.json")
+    assert publish_rules(rules, path)
+    with open(path, "r") as rules_file:
+        assert json.load(rules_file) == rules
+    assert not publish_rules(rules, path)
+    # rules which differ only in formatting are rewritten in the requested format
+    with open(path, "w") as rules_file:
+        json.dump(rules, rules_file, sort_keys=True)
+    assert publish_rules(rules, path)
+    assert not publish_rules(rules, path)
+    inode = os.stat(path).st_ino
+    rules["tables"].pop()
+    assert publish_rules(rules, path)
+    # the file is replaced by rename, never rewritten in place
+    assert os.stat(path).st_ino != inode
+    assert [f for f in os.listdir(tmp_path) if f != "rules.json"] == []
+
+
+def test_publish_format_change(tmp_path):
+    rules = dsl_to_rules(_example_dsl())
+    path = str(tmp_path / "rules.json")
+    assert publish_rules(rules, path, fmt="json")
+    assert publish_rules(rules, path, fmt="minified")
+    with open(path, "rb") as rules_file:
+        assert rules_file.read() == encode_rules(rules, "minified")
+    assert not publish_rules(rules, path, fmt="minified")
+    assert publish_rules(rules, path, fmt="json")
+    assert not publish_rules(rules, path, fmt="json")
+
+
+def _watch_args(dslpath: str, output: str):
+    return argparse.Namespace(
+        dsl=dslpath,
+        output=output,
+        jobs=1,
+        optimize=False,
+        factor_patterns=False,
+        timings=False,
+        poll_interval=0,
+        format="json",
+        no_cache=True,
+        cache_dir=None,
+    )
+
+
+def test_watch_regenerates_rules(tmp_path, capsys):
+    dslpath = str(tmp_path / "trino-acl-dsl.yaml")
+    output = str(tmp_path / "rules.json")
+    shutil.copy(_example, dslpath)
+    args = _watch_args(dslpath, output)
+    dsl2rules._watch("watch", args, polls=2)
+    assert "wrote" in capsys.readouterr().err
+    # an invalid DSL is reported, and the last good rules are kept
+    with open(dslpath, "r") as dsl_file:
+        text = dsl_file.read()
+    with open(dslpath, "w") as dsl_file:
+        dsl_file.write(text.replace("\npublic: true\n", "\npublic: sometimes\n"))
+    dsl2rules._watch("watch", args, polls=1)
+    assert "failed to compile" in capsys.readouterr().err
+    with open(output, "r") as rules_file:
+        assert json.load(rules_file) == dsl_to_rules(_example_dsl())
+
+
+def test_watch_reports_removed_include(tmp_path, capsys, monkeypatch):
+    dslpath = str(tmp_path / "trino-acl-dsl.yaml")
+    fragpath = str(tmp_path / "team.trino-acl-dsl.yaml")
+    output = str(tmp_path / "rules.json")
+    with open(dslpath, "w") as dsl_file:
+        dsl_file.write("admin:\n- group: admins\npublic: false\ninclude:\n- team.trino-acl-dsl.yaml\n")
+        dsl_file.write("catalogs: []\nschemas: []\ntables: []\n")
+    with open(fragpath, "w") as dsl_file:
+        dsl_file.write("catalogs:\n- catalog: dev\n  public: true\n")
+
+    def remove_fragment(seconds):
+        # the included fragment is removed after the first poll
+        if os.path.exists(fragpath):
+            os.remove(fragpath)
+
+    monkeypatch.setattr(time, "sleep", remove_fragment)
+    dsl2rules._watch("watch", _watch_args(dslpath, output), polls=2)
+    err = capsys.readouterr().err
+    assert "wrote" in err
+    assert "failed to compile" in err
+    with open(output, "r") as rules_file:
+        # the last good rules, with the fragment's catalog, are kept
+        assert "dev" in [rule.get("catalog") for rule in json.load(rules_file)["tables"]]
+
+
+@pytest.mark.parametrize("fmt", sorted(rules_formats.keys()))
+def test_rules_formats_round_trip(tmp_path, fmt):
+    if fmt == "msgpack":
+        pytest.importorskip("msgpack")
+    rules = dsl_to_rules(_example_dsl())
+    path = str(tmp_path / f"rules{rules_formats[fmt]}")
+    assert publish_rules(rules, path, fmt=fmt)
+    assert not publish_rules(rules, path, fmt=fmt)
+    assert load_rules(path) == rules
+    ev = RulesEvaluator.from_file(path)
+    assert ev.permissions("x", ["admins"], "dev", "s", "t") == RulesEvaluator(rules).permissions(
+        "x", ["admins"], "dev", "s", "t"
+    )
+
+
+def test_minified_backends_agree(monkeypatch):
+    pytest.importorskip("orjson")
+    rules = dsl_to_rules(_example_dsl())
+    fast = encode_rules(rules, "minified")
+    monkeypatch.setattr(rules_io, "_orjson", lambda: None)
+    assert encode_rules(rules, "minified") == fast
+    assert json.loads(fast) == rules
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import pytest
+import yaml
+
+from osc_trino_acl_dsl import dsl2rules, rules_optimize
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_optimize import check_equivalence, optimize_rules
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_rules() -> dict:
+    with open(_example, "r") as dsl_file:
+        return dsl_to_rules(yaml.safe_load(dsl_file))
+
+
+def test_optimize_example():
+    rules = _example_rules()
+    optimized, report = optimize_rules(rules)
+    assert check_equivalence(rules, optimized) is None
+    for section, (before, after) in report.items():
+        assert before == len(rules[section])
+        assert after == len(optimized[section])
+    assert report["tables"][1] < report["tables"][0]
+
+
+def test_optimize_shadowed_and_merged():
+    rules = {
+        "catalogs": [{"allow": "read-only"}],
+        "schemas": [{"owner": False}],
+        "tables": [
+            {"group": "admins", "privileges": ["SELECT"]},
+            {"group": "admins", "catalog": "dev", "privileges": []},
+            {"catalog": "dev", "schema": "a", "privileges": ["SELECT"]},
+            {"catalog": "dev", "schema": "b", "privileges": ["SELECT"]},
+            {"catalog": "dev", "schema": "c", "privileges": []},
+            {"catalog": "dev", "schema": "a", "table": "t", "privileges": []},
+            {"privileges": []},
+        ],
+    }
+    optimized, report = optimize_rules(rules)
+    assert optimized["tables"] == [
+        {"group": "admins", "privileges": ["SELECT"]},
+        {"catalog": "dev", "schema": "a|b", "privileges": ["SELECT"]},
+        {"catalog": "dev", "schema": "c", "privileges": []},
+        {"privileges": []},
+    ]
+    assert report["tables"] == (7, 4)
+    assert check_equivalence(rules, optimized) is None
+
+
+def test_equivalence_counterexample():
+    rules = _example_rules()
+    broken = dict(rules)
+    broken["tables"] = rules["tables"][1:]
+    diff = check_equivalence(rules, broken)
+    assert diff is not None
+    (user, groups), obj = diff
+    assert "admins" in groups
+
+
+def test_equivalence_of_regex_principals():
+    rules = {"schemas": [{"group": "eng_.*", "owner": True}, {"owner": False}]}
+    changed = {"schemas": [{"group": "ops_.*", "owner": True}, {"owner": False}]}
+    assert check_equivalence(rules, changed) is not None
+    unanalyzable = {"schemas": [{"group": "(eng)_\\1", "owner": True}, {"owner": False}]}
+    with pytest.raises(ValueError, match="cannot be sampled"):
+        check_equivalence(rules, unanalyzable)
+
+
+def test_optimize_refuses_inequivalent_rules(tmp_path, monkeypatch):
+    def broken(rules):
+        optimized, report = optimize_rules(rules)
+        return (dict(optimized, tables=optimized["tables"][1:]), report)
+
+    output = tmp_path / "rules.json"
+    monkeypatch.setattr(rules_optimize, "optimize_rules", broken)
+    monkeypatch.setattr(sys, "argv", ["trino-dsl-to-rules", _example, "--optimize", "--output", str(output)])
+    with pytest.raises(ValueError, match="optimized rules differ"):
+        dsl2rules.main()
+    assert not output.exists()
@@ -0,0 +1,98 @@
+import os
+import random
+import re
+
+import yaml
+
+from osc_trino_acl_dsl.dsl2rules import PrincipalSets, dsl_to_rules, principal_sets, table_expressions
+from osc_trino_acl_dsl.rules_optimize import check_equivalence, optimize_rules
+from osc_trino_acl_dsl.rules_patterns import (
+    analyze_patterns,
+    dsl_expressions,
+    dsl_principal_sets,
+    factor_pattern,
+    factor_rules,
+    rule_costs,
+)
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def test_factor_pattern():
+    assert factor_pattern("dev_a|dev_b|data") == "d(?:ata|ev_[ab])"
+    assert factor_pattern("dev|devs|developers|ops") == "dev(?:elopers|s)?|ops"
+    # anything other than an alternation of names is left alone
+    for pattern in ["admins", "dev.*|ops", ".*"]:
+        assert factor_pattern(pattern) == pattern
+
+    rng = random.Random(0)
+    names = sorted(set(["".join(rng.choices("abc_", k=rng.randint(1, 6))) for _ in range(300)]))
+    factored = re.compile(factor_pattern("|".join(names)))
+    for name in names + ["".join(rng.choices("abc_", k=rng.randint(1, 7))) for _ in range(300)]:
+        assert (factored.fullmatch(name) is not None) == (name in names)
+
+
+def test_factor_rules_equivalent():
+    with open(_example, "r") as dsl_file:
+        rules, _ = optimize_rules(dsl_to_rules(yaml.safe_load(dsl_file)))
+    factored = factor_rules(rules)
+    assert factored != rules
+    assert check_equivalence(rules, factored) is None
+
+
+def test_analyze_patterns():
+    rules = {
+        "catalogs": [{"group": "(a+)+", "allow": "all"}, {"user": "x(", "allow": "all"}],
+        "schemas": [{"owner": False}, {"group": "admins", "owner": True}],
+        "tables": [{"user": ".*", "catalog": ".*", "privileges": []}],
+    }
+    issues = [(i.section, i.index, i.issue) for i in analyze_patterns(rules)]
+    assert issues == [("catalogs", 0, "backtracking"), ("catalogs", 1, "invalid"), ("schemas", 0, "broad")]
+    costs = rule_costs(rules, number=2)
+    assert len(costs) == 5
+    assert all([c.ns >= 0 for c in costs])
+
+
+def test_principal_sets():
+    registry = PrincipalSets()
+    a = registry.alternations([{"group": "ops"}, {"user": "bob"}, {"group": "dev"}, {"group": "ops"}])
+    b = registry.alternations([{"group": "dev"}, {"group": "ops"}, {"user": "bob"}])
+    assert a == ("dev|ops", "bob")
+    # equal sets of principals share the same strings
+    assert all([x is y for x, y in zip(a, b)])
+    assert (registry.lists, len(registry)) == (2, 1)
+
+    spec = {"catalog": "c", "schema": "s", "admin": [{"user": "bob"}, {"user": "amy"}]}
+    dsl = {"admin": [{"group": "admins"}], "public": False, "catalogs": [], "schemas": [dict(spec, public=False)]}
+    dsl["tables"] = [dict(spec, table="t", public=True, acl=[{"id": spec["admin"][::-1], "hide": ["x"]}])]
+    assert dsl_to_rules(dsl)["schemas"][1]["user"] == "amy|bob"
+    registry = principal_sets(dsl)
+    assert (registry.lists, len(registry)) == (4, 2)
+
+    registry = dsl_principal_sets(_example)
+    assert registry.lists >= len(registry) > 0
+
+
+def test_table_expressions():
+    acl = [{"id": [{"group": "a"}], "hide": ["x", "y"]}, {"id": [{"group": "b"}], "filter": ["r = 1"]}]
+    dsl = {"admin": [{"group": "admins"}], "public": False, "catalogs": [], "schemas": []}
+    dsl["tables"] = [
+        {"catalog": "c", "schema": "s", "table": t, "public": {"hide": ["z", "x"]}, "acl": acl} for t in ["t1", "t2"]
+    ]
+    rules = dsl_to_rules(dsl)["tables"]
+    assert [r.get("filter") for r in rules[1:7]] == [None, "(r = 1)", "(r = 1)", None, "(r = 1)", "(r = 1)"]
+    public = rules[3]
+    assert public["columns"] == [{"name": col, "allow": False} for col in ["x", "y", "z"]]
+    # rules of both tables share their column masks and filters
+    assert rules[1]["columns"] is rules[4]["columns"]
+    assert public["columns"] is rules[6]["columns"]
+    assert public["filter"] is rules[5]["filter"]
+    # but separate compilations do not
+    rules[1]["columns"].append({"name": "w", "allow": False})
+    assert dsl_to_rules(dsl)["tables"][1]["columns"] == [{"name": col, "allow": False} for col in ["x", "y"]]
+
+    stats = table_expressions(dsl).stats()
+    counts = [stats[k] for k in ["column_masks", "distinct_column_masks", "filters", "distinct_filters"]]
+    assert counts == [4, 2, 4, 1]
+    assert stats["shared_bytes"] > 0
+    assert dsl_expressions(_example).stats()["distinct_filters"] > 0
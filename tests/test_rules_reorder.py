@@ -0,0 +1,64 @@
+import csv
+import random
+
+from test_equivalence import _population, random_dsl
+
+from osc_trino_acl_dsl.dsl2rules import dsl_to_rules
+from osc_trino_acl_dsl.rules_optimize import check_equivalence
+from osc_trino_acl_dsl.rules_reorder import (
+    Access,
+    load_workload,
+    reorder_rules,
+    reorder_section,
+    replay,
+    same_decisions,
+)
+
+
+def test_reorder_keeps_decisions():
+    rng = random.Random(0)
+    sizes = dict(catalogs=3, schemas=4, tables=6, users=30, groups=20)
+    rules = dsl_to_rules(random_dsl(rng, **sizes))
+    principals, objects = _population(rng, **sizes)
+    # a skewed workload, mostly hitting a few tables late in the rules
+    hot = objects[-10:]
+    accesses = [
+        Access(*rng.choice(principals), rng.choice(hot if rng.random() < 0.9 else objects)) for _ in range(2000)
+    ]
+
+    reordered = reorder_rules(rules, accesses)
+    assert reordered != rules
+    assert same_decisions(rules, reordered, accesses)
+    assert check_equivalence(rules, reordered) is None
+    before = replay(rules, accesses)
+    after = replay(reordered, accesses)
+    assert after["tables"].mean_depth < before["tables"].mean_depth
+    assert sorted(after["tables"].hits) == sorted(before["tables"].hits)
+
+
+def test_reorder_section_moves_only_disjoint_rules():
+    rules = [
+        {"group": "admins", "privileges": ["SELECT"]},
+        {"catalog": "c", "schema": "s", "table": "t1", "user": "a", "privileges": ["SELECT"]},
+        {"catalog": "c", "schema": "s", "table": "t1", "privileges": []},
+        {"catalog": "c", "schema": "s", "table": "t2", "privileges": ["SELECT"]},
+        {"catalog": "c", "schema": "s.*", "table": "t3", "privileges": []},
+        {"catalog": "c", "schema": "s", "table": "t3", "privileges": ["SELECT"]},
+        {"privileges": []},
+    ]
+    hits = [9, 0, 1, 5, 0, 3, 9]
+    # t2 is hit more than t1, but the regex schema rule for t3 overlaps the t3 rule after it
+    assert reorder_section(rules, hits) == [rules[0], rules[3], rules[1], rules[2], rules[4], rules[5], rules[6]]
+
+
+def test_load_workload(tmp_path):
+    fname = str(tmp_path / "workload.csv")
+    with open(fname, "w", newline="") as workload_file:
+        writer = csv.writer(workload_file)
+        writer.writerow(["user", "groups", "catalog", "schema", "table", "allow"])
+        writer.writerow(["alice", "devs;ops", "dev", "s", "t", "all"])
+        writer.writerow(["bob", "", "dev", "s", "t", "none"])
+    assert load_workload(fname) == [
+        Access("alice", ("devs", "ops"), ("dev", "s", "t")),
+        Access("bob", (), ("dev", "s", "t")),
+    ]
@@ -0,0 +1,82 @@
+import copy
+import os
+
+import jsonschema
+import pytest
+import yaml
+
+from osc_trino_acl_dsl.validation import dsl_validation_errors, validate_dsl, validate_skeleton
+
+_example = os.path.join(os.path.dirname(__file__), "..", "examples", "dsl-example-1.yaml")
+
+
+def _example_dsl() -> dict:
+    with open(_example, "r") as dsl_file:
+        return yaml.safe_load(dsl_file)
+
+
+def test_valid_dsl():
+    dsl = _example_dsl()
+    assert dsl_validation_errors(dsl) == []
+    assert dsl_validation_errors(dsl, jobs=2) == []
+    validate_dsl(dsl)
+
+
+def test_all_errors_reported():
+    dsl = _example_dsl()
+    dsl["public"] = "yes"
+    dsl["schemas"][1]["schema"] = "Bad-Name"
+    dsl["tables"][0]["acl"][1]["id"].append({"role": "x"})
+    del dsl["tables"][2]["public"]
+    errors = dsl_validation_errors(dsl)
+    assert [path for path, _ in errors] == [
+        "$.public",
+        "$.schemas[1].schema",
+        "$.tables[0].acl[1].id[2]",
+        "$.tables[2]",
+    ]
+    assert dsl_validation_errors(copy.deepcopy(dsl), jobs=2) == errors
+    with pytest.raises(jsonschema.ValidationError, match="4 validation error"):
+        validate_dsl(dsl)
+
+
+def test_malformed_entry_lists():
+    dsl = _example_dsl()
+    dsl["tables"] = {"catalog": "dev"}
+    assert [path for path, _ in dsl_validation_errors(dsl)] == ["$.tables"]
+    assert [path for path, _ in dsl_validation_errors([])] == ["$"]
+
+
+def test_compiled_entry_check_agrees_with_jsonschema():
+    from osc_trino_acl_dsl.dsl2rules import dsl_entry_validator
+    from osc_trino_acl_dsl.validation import _entry_check
+
+    check = _entry_check("table-entry")
+    assert check is not None
+    validator = dsl_entry_validator("table-entry")
+    base = _example_dsl()["tables"][0]
+    variants = [base]
+    for key, value in [
+        ("public", 1),
+        ("public", {"hide": ["x"], "filter": [3]}),
+        ("table", "T"),
+        ("acl", []),
+        ("acl", [{"id": [{"user": "u"}]}]),
+        ("acl", [{"id": [{"user": "u", "group": "g"}], "hide": ["c"]}]),
+        ("admin", [{"group": 1}]),
+        ("admin", [{"role": "r"}]),
+    ]:
+        spec = copy.deepcopy(base)
+        spec[key] = value
+        variants.append(spec)
+    for spec in variants:
+        assert check(spec) == validator.is_valid(spec)
+
+
+def test_skeleton_errors_match_jsonschema():
+    dsl = _example_dsl()
+    dsl["catalogs"][0]["public"] = "sometimes"
+    skel = dict(dsl, schemas=[], tables=[])
+    with pytest.raises(jsonschema.ValidationError):
+        validate_skeleton(skel)
+    assert [p for p, _ in dsl_validation_errors(dsl)] == ["$.catalogs[0].public"]